@@ -4,6 +4,15 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+
+def _get_list(name, default):
+    """Reads a comma-separated environment variable into a list of non-empty strings."""
+    value = os.getenv(name)
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
 # Jira Configuration
 JIRA_SERVER = os.getenv("JIRA_SERVER")
 JIRA_PAT = os.getenv("JIRA_PAT")
@@ -12,6 +21,26 @@ JIRA_PAT = os.getenv("JIRA_PAT")
 GITLAB_SERVER = os.getenv("GITLAB_SERVER")
 GITLAB_PRIVATE_TOKEN = os.getenv("GITLAB_PRIVATE_TOKEN")
 
+# HTTP transport shared by the Jira, GitLab and OpenAI clients: connections kept per host
+# (size it to at least the number of concurrent workers), idle keep-alive, timeouts in seconds,
+# and HTTP/2 for the OpenAI client (needs the optional 'h2' package).
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "300"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+# Throttling and retries shared by every upstream host: a token bucket per host (requests per
+# second and burst; 0 disables throttling, THROTTLE_HOST_RATES="host=rate,..." overrides the rate
+# of single hosts) and retries of 429/5xx/connection errors, honouring Retry-After and otherwise
+# backing off exponentially with jitter from RETRY_BASE_DELAY up to RETRY_MAX_DELAY seconds.
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "10"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "10"))
+THROTTLE_HOST_RATES = _get_list("THROTTLE_HOST_RATES", [])
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+
 # AI Model Configuration
 AI_SERVICE_PROVIDER = os.getenv("AI_SERVICE_PROVIDER", "openai") # Default to 'openai'
 AI_MODEL_NAME = os.getenv("AI_MODEL_NAME") # Can be empty, service will use default if not set
@@ -19,25 +48,148 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 
+# Diffs larger than this (estimated tokens) are split into chunks at file/hunk boundaries,
+# reviewed in parallel and merged. AI_MAX_ISSUES caps the merged "perubahan_diperlukan" list.
+AI_CHUNK_TOKEN_BUDGET = int(os.getenv("AI_CHUNK_TOKEN_BUDGET", "24000"))
+AI_CHUNK_CONCURRENCY = int(os.getenv("AI_CHUNK_CONCURRENCY", "4"))
+AI_MAX_ISSUES = int(os.getenv("AI_MAX_ISSUES", "5"))
+
+# Stream LLM completions. A call is aborted and retried (up to AI_STREAM_RETRIES times) when no
+# token arrives within AI_FIRST_TOKEN_TIMEOUT seconds or the stream stalls for longer than
+# AI_STREAM_STALL_TIMEOUT seconds between chunks. 0 disables a deadline.
+AI_STREAMING_ENABLED = os.getenv("AI_STREAMING_ENABLED", "true").lower() == "true"
+AI_FIRST_TOKEN_TIMEOUT = float(os.getenv("AI_FIRST_TOKEN_TIMEOUT", "60"))
+AI_STREAM_STALL_TIMEOUT = float(os.getenv("AI_STREAM_STALL_TIMEOUT", "30"))
+AI_STREAM_RETRIES = int(os.getenv("AI_STREAM_RETRIES", "1"))
+
+# Hedged LLM calls: when the primary provider has not answered after the AI_HEDGE_PERCENTILE
+# of its recent latencies (at least AI_HEDGE_MIN_DELAY seconds, which also applies until
+# AI_HEDGE_MIN_SAMPLES calls were seen), the prompt is also sent to AI_HEDGE_PROVIDER /
+# AI_HEDGE_MODEL_NAME. The first valid JSON answer wins and the other call is cancelled.
+AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "false").lower() == "true"
+AI_HEDGE_PROVIDER = os.getenv("AI_HEDGE_PROVIDER", "gemini")
+AI_HEDGE_MODEL_NAME = os.getenv("AI_HEDGE_MODEL_NAME")
+AI_HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "95"))
+AI_HEDGE_MIN_DELAY = float(os.getenv("AI_HEDGE_MIN_DELAY", "20"))
+AI_HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", "20"))
+
+# Adaptive limit on in-flight LLM calls (across chunks and tickets), AIMD style: it grows by
+# about one per window of calls while latency stays within AI_LATENCY_TOLERANCE times the
+# baseline's prediction for the call's size (overhead plus cost per token, throttle waits left
+# out) and is multiplied by AI_CONCURRENCY_BACKOFF on a 429 or a latency spike.
+AI_ADAPTIVE_CONCURRENCY = os.getenv("AI_ADAPTIVE_CONCURRENCY", "true").lower() == "true"
+AI_CONCURRENCY_INITIAL = int(os.getenv("AI_CONCURRENCY_INITIAL", "4"))
+AI_CONCURRENCY_MIN = int(os.getenv("AI_CONCURRENCY_MIN", "1"))
+AI_CONCURRENCY_MAX = int(os.getenv("AI_CONCURRENCY_MAX", "16"))
+AI_LATENCY_TOLERANCE = float(os.getenv("AI_LATENCY_TOLERANCE", "2.0"))
+AI_CONCURRENCY_BACKOFF = float(os.getenv("AI_CONCURRENCY_BACKOFF", "0.5"))
+
+# Persistent cache of AI analysis results, keyed by prompt, provider, model, temperature and diff.
+# Disable for a single run with --no-ai-cache.
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", ".cache/ai_cache.sqlite3")
+AI_CACHE_MAX_MB = int(os.getenv("AI_CACHE_MAX_MB", "200"))
+AI_CACHE_MAX_AGE_DAYS = int(os.getenv("AI_CACHE_MAX_AGE_DAYS", "30"))
+
+# Persistent cache of GitLab diffs keyed by (server, project path, SHA). Commit diffs are
+# immutable, so repeat fetches need no network; MR diffs are keyed by their base/head SHAs.
+DIFF_CACHE_ENABLED = os.getenv("DIFF_CACHE_ENABLED", "true").lower() == "true"
+DIFF_CACHE_PATH = os.getenv("DIFF_CACHE_PATH", ".cache/diff_cache.sqlite3")
+DIFF_CACHE_MAX_MB = int(os.getenv("DIFF_CACHE_MAX_MB", "500"))
+# Also persist the GitLab project path -> project ID map in the diff cache across runs.
+GITLAB_PROJECT_ID_CACHE_PERSIST = os.getenv("GITLAB_PROJECT_ID_CACHE_PERSIST", "true").lower() == "true"
+
+# MR diffs come from GitLab's paginated /diffs endpoint, pages fetched concurrently.
+# MR_DIFF_SOURCE="local" instead fetches refs/merge-requests/<iid>/head into the local
+# mirror and diffs it against the merge base there, falling back to the API.
+MR_DIFF_PAGE_SIZE = int(os.getenv("MR_DIFF_PAGE_SIZE", "50"))
+MR_DIFF_PAGE_CONCURRENCY = int(os.getenv("MR_DIFF_PAGE_CONCURRENCY", "4"))
+MR_DIFF_SOURCE = os.getenv("MR_DIFF_SOURCE", "api").lower()
+# Re-review MRs that got new pushes since the bot's last review, sending only the delta
+# (last reviewed head..current head) to the AI. The reviewed head is recorded in the comment.
+INCREMENTAL_REVIEW_ENABLED = os.getenv("INCREMENTAL_REVIEW_ENABLED", "true").lower() == "true"
+
+# Diff pruning before AI analysis: files matching these globs (full path or file name) or
+# regexes (full path) are dropped, as are binary files, generated files and whitespace-only hunks.
+DIFF_PRUNE_ENABLED = os.getenv("DIFF_PRUNE_ENABLED", "true").lower() == "true"
+DIFF_PRUNE_GLOBS = _get_list("DIFF_PRUNE_GLOBS", [
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "npm-shrinkwrap.json", "composer.lock",
+    "Gemfile.lock", "poetry.lock", "Pipfile.lock", "Cargo.lock", "go.sum",
+    "*.min.js", "*.min.css", "*.map", "*.bundle.js",
+    "*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.pb.cc", "*.pb.h",
+    "vendor/*", "*/vendor/*", "node_modules/*", "*/node_modules/*", "dist/*",
+])
+DIFF_PRUNE_REGEXES = _get_list("DIFF_PRUNE_REGEXES", [
+    r"(^|/)(generated|gen|openapi-generated)/",
+])
+DIFF_PRUNE_WHITESPACE_ONLY = os.getenv("DIFF_PRUNE_WHITESPACE_ONLY", "true").lower() == "true"
+
+# Diffs are streamed from git / GitLab and cut off (with a truncation marker) after this many
+# bytes or lines, so memory per worker stays flat however big a change is. 0 disables a limit.
+DIFF_MAX_BYTES = int(os.getenv("DIFF_MAX_BYTES", "4000000"))
+DIFF_MAX_LINES = int(os.getenv("DIFF_MAX_LINES", "100000"))
+
+# Local SQLite ledger of the URLs found and reviews posted per ticket, plus a watermark of the
+# last Jira comment scanned, so each run only reads comments newer than the watermark.
+REVIEW_LEDGER_ENABLED = os.getenv("REVIEW_LEDGER_ENABLED", "true").lower() == "true"
+REVIEW_LEDGER_PATH = os.getenv("REVIEW_LEDGER_PATH", ".cache/review_ledger.sqlite3")
+
+# JSON lines report of every LLM call (tokens, latency, provider, model, cache hit) plus
+# per-ticket and per-run totals. Set to an empty string to disable the file.
+RUN_REPORT_PATH = os.getenv("RUN_REPORT_PATH", "reports/run_report.jsonl")
+
 # Local Git Repository Path for cloning
 LOCAL_GIT_REPO_PATH = os.getenv("LOCAL_GIT_REPO_PATH", "temp_repos")
+# Fetch commit diffs from bare, blobless mirrors under LOCAL_GIT_REPO_PATH/mirrors
+# before falling back to the GitLab API.
+GIT_MIRROR_ENABLED = os.getenv("GIT_MIRROR_ENABLED", "true").lower() == "true"
+# Disk budget for the mirror store; least recently used mirrors are evicted beyond it.
+LOCAL_GIT_REPO_MAX_MB = int(os.getenv("LOCAL_GIT_REPO_MAX_MB", "10240"))
+# Seconds to wait for another worker or run to release a mirror's lock.
+GIT_LOCK_TIMEOUT = int(os.getenv("GIT_LOCK_TIMEOUT", "600"))
+# Run 'git maintenance'/'gc --auto' on idle mirrors at the end of each run.
+GIT_MAINTENANCE_ENABLED = os.getenv("GIT_MAINTENANCE_ENABLED", "true").lower() == "true"
 
 # --- NEW ---
 # Workflow Configuration
 # Controls whether to automatically transition a ticket when AI recommends 'Revisi'
 AUTO_TRANSITION_REVISI = os.getenv("AUTO_TRANSITION_REVISI", "false").lower() == "true"
 
+# Number of Jira tickets processed in parallel when several tickets are given.
+# 1 keeps the original sequential behaviour.
+TICKET_WORKERS = int(os.getenv("TICKET_WORKERS", "1"))
+
+# Issue fields fetched from Jira (the workflow needs only these), and how --jql searches page:
+# page size and how many pages are requested at once.
+JIRA_ISSUE_FIELDS = _get_list("JIRA_ISSUE_FIELDS", ["assignee", "comment", "status"])
+JIRA_SEARCH_PAGE_SIZE = int(os.getenv("JIRA_SEARCH_PAGE_SIZE", "100"))
+JIRA_SEARCH_CONCURRENCY = int(os.getenv("JIRA_SEARCH_CONCURRENCY", "4"))
+
+# Per-ticket review pipeline: concurrency of the fetch, analyze and post stages,
+# and the size of the bounded queues that link them.
+PIPELINE_FETCH_CONCURRENCY = int(os.getenv("PIPELINE_FETCH_CONCURRENCY", "4"))
+PIPELINE_ANALYZE_CONCURRENCY = int(os.getenv("PIPELINE_ANALYZE_CONCURRENCY", "2"))
+PIPELINE_POST_CONCURRENCY = int(os.getenv("PIPELINE_POST_CONCURRENCY", "1"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
 
-def validate_config():
-    """Validates that all necessary configuration variables are set."""
+def validate_config(require_remote=True):
+    """
+    Validates that all necessary configuration variables are set.
+    Jira and GitLab settings are only required when `require_remote` is True;
+    local repository analysis does not talk to either server.
+    """
     required_vars = {
-        "JIRA_SERVER": JIRA_SERVER,
-        "JIRA_PAT": JIRA_PAT,
-        "GITLAB_SERVER": GITLAB_SERVER,
-        "GITLAB_PRIVATE_TOKEN": GITLAB_PRIVATE_TOKEN,
         "AI_SERVICE_PROVIDER": AI_SERVICE_PROVIDER,
         "LOCAL_GIT_REPO_PATH": LOCAL_GIT_REPO_PATH,
     }
+    if require_remote:
+        required_vars.update({
+            "JIRA_SERVER": JIRA_SERVER,
+            "JIRA_PAT": JIRA_PAT,
+            "GITLAB_SERVER": GITLAB_SERVER,
+            "GITLAB_PRIVATE_TOKEN": GITLAB_PRIVATE_TOKEN,
+        })
 
     if AI_SERVICE_PROVIDER == "gemini":
         required_vars["GEMINI_API_KEY"] = GEMINI_API_KEY
@@ -1,5 +1,7 @@
 import argparse
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urlparse
 import requests
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
@@ -9,10 +11,11 @@ requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
 import re
 from config import settings
-from services.jira_service import JiraService
-from services.gitlab_service import GitLabService
-from services.ai_service import AIService
-from services.git_service import GitService
+from services.container import ServiceContainer
+from services.diff_model import ParsedDiff
+from services.review_pipeline import ReviewPipeline
+from services.cache_store import get_cache_store
+from services.run_report import get_run_report
 
 def extract_mr_urls(text):
     """Extracts all GitLab Merge Request URLs from a given text."""
@@ -24,6 +27,65 @@ def extract_commit_urls(text):
     pattern = r"\[?(https?://[^\]|]+/commit/[a-f0-9]+)"
     return re.findall(pattern, text)
 
+# Header that marks a comment as one of our reviews.
+BOT_COMMENT_HEADER = "h2. 🤖 Hasil Code Review"
+# Invisible Jira anchor recording the MR head a review covered, for incremental re-reviews.
+REVIEWED_HEAD_MARKER = "{{anchor:ai-review-head-{sha}}}"
+REVIEWED_HEAD_RE = re.compile(r"\{anchor:ai-review-head-([0-9a-f]{7,64})\}")
+
+def extract_reviewed_heads(bot_comments):
+    """Maps each MR URL to the head SHA recorded in the bot's latest review of it."""
+    reviewed_heads = {}
+    for comment_body in bot_comments: # Oldest first, so the latest review wins
+        match = REVIEWED_HEAD_RE.search(comment_body)
+        if match:
+            for url in extract_mr_urls(comment_body):
+                reviewed_heads[url] = match.group(1)
+    return reviewed_heads
+
+def scan_comments(comment_bodies):
+    """
+    Scans ticket comments for GitLab URLs. Returns (found, reviewed): the set of (url, type)
+    pairs in all comments, and {url: head_sha or None} for URLs our bot already reviewed.
+    """
+    found = set()
+    bot_comments = []
+    for text in comment_bodies:
+        for url in extract_mr_urls(text):
+            found.add((url, "MR"))
+        for url in extract_commit_urls(text):
+            found.add((url, "Commit"))
+        if BOT_COMMENT_HEADER in text:
+            bot_comments.append(text)
+
+    reviewed = {}
+    for comment_body in bot_comments:
+        # Extract URLs from the bot's past comments
+        for url in extract_mr_urls(comment_body) + extract_commit_urls(comment_body):
+            reviewed.setdefault(url, None)
+    reviewed.update(extract_reviewed_heads(bot_comments))
+    return found, reviewed
+
+def collect_urls_with_ledger(review_ledger, jira_service, ticket_id, issue):
+    """
+    Like scan_comments, but only for comments newer than the ticket's watermark in the
+    review ledger; what they contain is added to the ledger, which then answers for all
+    URLs and reviews of the ticket. Returns None if the comments could not be fetched.
+    """
+    watermark = review_ledger.watermark(ticket_id)
+    new_comments = jira_service.get_comments_since(ticket_id, watermark, issue)
+    if new_comments is None:
+        return None
+    found, reviewed = scan_comments([body for _, body in new_comments])
+    for url, url_type in sorted(found):
+        review_ledger.add_url(ticket_id, url, url_type)
+    for url, head_sha in reviewed.items():
+        review_ledger.record_review(ticket_id, url, head_sha)
+    if new_comments:
+        review_ledger.set_watermark(ticket_id, new_comments[-1][0])
+    print(f"   Scanned {len(new_comments)} comments newer than comment {watermark}.")
+    return set(review_ledger.urls(ticket_id)), review_ledger.reviewed_heads(ticket_id)
+
 def format_analysis_category(category_name, findings):
     """Helper function to format a single category of findings."""
     if not findings:
@@ -38,8 +100,11 @@ def format_analysis_category(category_name, findings):
         section += f"* {finding.get('comment', 'No comment provided.')} ({location})\n"
     return section + "\n"
 
-def format_comment(analysis_result, url, assignee_name):
-    """Formats the detailed analysis result into a Jira comment."""
+def format_comment(analysis_result, url, assignee_name, head_sha=None, base_sha=None):
+    """
+    Formats the detailed analysis result into a Jira comment. `head_sha` (the reviewed MR
+    head) is recorded in a hidden marker; `base_sha` marks an incremental review since then.
+    """
     if not analysis_result:
         return "Analisis AI tidak menghasilkan temuan yang valid."
 
@@ -47,8 +112,13 @@ def format_comment(analysis_result, url, assignee_name):
     link_type = "Commit" if "/commit/" in url else "Merge Request"
 
     # Main header and link
-    comment = f"h2. 🤖 Hasil Code Review\n"
-    comment += f"*{link_type}*: [{url}|{url}]\n\n"
+    comment = f"{BOT_COMMENT_HEADER}\n"
+    comment += f"*{link_type}*: [{url}|{url}]\n"
+    if base_sha and head_sha:
+        comment += f"_Review inkremental: hanya perubahan sejak review sebelumnya ({base_sha[:8]}..{head_sha[:8]})._\n"
+    if head_sha:
+        comment += REVIEWED_HEAD_MARKER.format(sha=head_sha) + "\n"
+    comment += "\n"
     
     # Change Summary
     comment += f"h3. Ringkasan Perubahan\n"
@@ -87,20 +157,42 @@ def format_comment(analysis_result, url, assignee_name):
     
     return comment
 
-def main_workflow(ticket_id):
-    """The main workflow of the application."""
+def mr_head_sha(mr):
+    """Head commit of an MR fetched with GitLabService.get_merge_request, or None."""
+    return (getattr(mr, 'diff_refs', None) or {}).get('head_sha')
+
+def prune_diff(diff_pruner, code_diff, source):
+    """Runs the pruning stage between DiffFetcher and AIService and reports what it saved."""
+    if not diff_pruner or not code_diff:
+        return code_diff
+    # Parsed once here; the pruned view is what AIService chunks and renders.
+    pruned_diff, report = diff_pruner.prune(ParsedDiff.parse(code_diff))
+    print(f"   Diff pruning for {source}: {report.summary()}")
+    stats = pruned_diff.stats()
+    print(f"   Reviewing {stats['files']} files (+{stats['additions']}/-{stats['deletions']} lines).")
+    for path, rule in report.removed_files:
+        print(f"      - {path} ({rule})")
+    if not pruned_diff:
+        print(f"   All changes in {source} were pruned; nothing left to review.")
+    return pruned_diff
+
+def main_workflow(ticket_id, services=None):
+    """
+    The main workflow of the application.
+    `services` is the run's shared ServiceContainer; a fresh one is created if omitted.
+    """
     print("--- STEP 1: Initializing services... ---")
-    jira_service = JiraService()
-    gitlab_service = GitLabService()
-    ai_service = AIService()
-    git_service = GitService() # Initialize GitService
-    
-    # Initialize DiffFetcher with both gitlab_service and git_service
-    diff_fetcher = DiffFetcher(gitlab_service, git_service)
+    services = services or ServiceContainer()
+    jira_service = services.jira
+    ai_service = services.ai
+    diff_fetcher = services.diff_fetcher
+    diff_pruner = services.diff_pruner
     print("--- STEP 1 COMPLETE ---")
 
+    review_ledger = services.review_ledger
     print(f"\n--- STEP 2: Fetching details for ticket {ticket_id}... ---")
-    issue = jira_service.get_ticket_details(ticket_id)
+    # With the review ledger, comments are read separately and only past its watermark.
+    issue = jira_service.get_ticket_details(ticket_id, include_comments=not review_ledger)
     if not issue:
         print("--- EXIT: Failed to fetch issue. ---")
         return
@@ -115,38 +207,45 @@ def main_workflow(ticket_id):
 
     print("\n--- STEP 3: Finding all new GitLab URLs to review... ---")
     
-    # 1. Extract all unique URLs from comments only (not from description)
-    all_comments = []
-    if hasattr(issue.fields, 'comment') and issue.fields.comment.comments:
-        all_comments.extend([comment.body for comment in issue.fields.comment.comments])
-    
-    all_found_urls = set()
-    for text in all_comments:
-        for url in extract_mr_urls(text):
-            all_found_urls.add((url, "MR"))
-        for url in extract_commit_urls(text):
-            all_found_urls.add((url, "Commit"))
+    # 1. Find all unique URLs and the ones already reviewed by our bot
+    if review_ledger:
+        scanned = collect_urls_with_ledger(review_ledger, jira_service, ticket_id, issue)
+        if scanned is None:
+            print("--- EXIT: Failed to fetch comments. ---")
+            return
+        all_found_urls, reviewed_heads = scanned
+    else:
+        # Extract all unique URLs from comments only (not from description)
+        all_comments = []
+        if hasattr(issue.fields, 'comment') and issue.fields.comment.comments:
+            all_comments.extend([comment.body for comment in issue.fields.comment.comments])
+        all_found_urls, reviewed_heads = scan_comments(all_comments)
             
     if not all_found_urls:
         print("--- EXIT: No GitLab URLs found in the ticket. ---")
         return
-        
-    # 2. Find URLs that have already been reviewed by our bot
-    bot_comments = [comment.body for comment in issue.fields.comment.comments if "h2. 🤖 Hasil Code Review" in comment.body]
-    reviewed_urls = set()
-    for comment_body in bot_comments:
-        # Extract URLs from the bot's past comments
-        # This re-uses the same extraction logic
-        for url in extract_mr_urls(comment_body):
-            reviewed_urls.add(url)
-        for url in extract_commit_urls(comment_body):
-            reviewed_urls.add(url)
             
-    # 3. Determine which URLs are new and need reviewing
-    urls_to_review = [item for item in all_found_urls if item[0] not in reviewed_urls]
+    # 2. Determine which URLs are new and need reviewing
+    urls_to_review = [item for item in all_found_urls if item[0] not in reviewed_heads]
     
     print(f"   Found {len(all_found_urls)} unique URLs in total.")
-    print(f"   Found {len(reviewed_urls)} URLs already reviewed.")
+    print(f"   Found {len(reviewed_heads)} URLs already reviewed.")
+
+    # 3. Reviewed MRs that got new pushes since are reviewed again, but only the delta
+    mr_heads = {}          # MR URL -> head SHA being reviewed now
+    incremental_bases = {} # MR URL -> head SHA of its last review
+    merge_requests = {}    # MR URL -> MR looked up in this run, reused to fetch its diff
+    if settings.INCREMENTAL_REVIEW_ENABLED:
+        for url, url_type in sorted(all_found_urls):
+            if url_type != "MR" or not reviewed_heads.get(url):
+                continue
+            merge_requests[url] = services.gitlab.get_merge_request(url)
+            head_sha = mr_head_sha(merge_requests[url])
+            if head_sha and not head_sha.startswith(reviewed_heads[url]):
+                print(f"   MR {url} has new commits since its last review ({reviewed_heads[url][:8]}..{head_sha[:8]}).")
+                mr_heads[url] = head_sha
+                incremental_bases[url] = reviewed_heads[url]
+                urls_to_review.append((url, "MR"))
     
     if not urls_to_review:
         print("--- EXIT: No new URLs to review. ---")
@@ -155,45 +254,69 @@ def main_workflow(ticket_id):
     print(f"   Found {len(urls_to_review)} new URLs to review.")
     print("--- STEP 3 COMPLETE ---")
 
-    # --- Loop through each new URL and process it ---
-    any_transition_recommended = False
-    final_conclusion = None
-    
-    for i, (gitlab_url, url_type) in enumerate(urls_to_review, 1):
-        print(f"\n--- PROCESSING URL {i}/{len(urls_to_review)}: {gitlab_url} ---")
-        
-        print("\n--- STEP 4: Fetching code diff from GitLab... ---")
-        code_diff = None
+    # Commits of the same project are extracted in one git batch per mirror up front.
+    diff_fetcher.prefetch_commit_diffs([url for url, url_type in urls_to_review if url_type == "Commit"])
+
+    # --- Fetch, analyze and post each new URL through the staged pipeline ---
+    def fetch_diff(gitlab_url, url_type):
         if url_type == "MR":
-            code_diff = diff_fetcher.fetch_gitlab_mr_diff(gitlab_url)
-        elif url_type == "Commit":
+            code_diff = fetch_mr_diff(gitlab_url)
+        else:
             code_diff = diff_fetcher.fetch_commit_diff(gitlab_url)
+        return prune_diff(diff_pruner, code_diff, gitlab_url)
+
+    def fetch_mr_diff(gitlab_url):
+        base_sha = incremental_bases.get(gitlab_url)
+        if base_sha:
+            code_diff = diff_fetcher.fetch_mr_delta_diff(gitlab_url, base_sha, mr_heads[gitlab_url])
+            if code_diff:
+                return code_diff
+            print(f"   Could not compute the delta for {gitlab_url}. Reviewing the whole MR instead.")
+            incremental_bases.pop(gitlab_url)
+        elif settings.INCREMENTAL_REVIEW_ENABLED:
+            # Remember which head this review covers, for the next incremental round.
+            merge_requests[gitlab_url] = services.gitlab.get_merge_request(gitlab_url)
+            head_sha = mr_head_sha(merge_requests[gitlab_url])
+            if head_sha:
+                mr_heads[gitlab_url] = head_sha
+        return diff_fetcher.fetch_gitlab_mr_diff(gitlab_url, mr=merge_requests.get(gitlab_url))
+
+    def post_review(gitlab_url, analysis_result):
+        print(f"\n--- STEP 6: Formatting comment for Jira ({gitlab_url})... ---")
+        jira_comment = format_comment(analysis_result, gitlab_url, assignee_name,
+                                      head_sha=mr_heads.get(gitlab_url), base_sha=incremental_bases.get(gitlab_url))
+        print("--- STEP 6 COMPLETE ---")
 
-        if not code_diff:
-            print(f"--- SKIP URL: Failed to fetch code diff for {gitlab_url}. ---")
-            continue # Skip to the next URL
-        print("--- STEP 4 COMPLETE ---")
+        print(f"\n--- STEP 7: Posting comment to Jira ticket ({gitlab_url})... ---")
+        comment_id = jira_service.post_comment(ticket_id, jira_comment)
+        if not comment_id:
+            # Not posted: the review is neither recorded nor counted towards the STEP 8 transition.
+            return None
+        if review_ledger:
+            review_ledger.record_review(ticket_id, gitlab_url, mr_heads.get(gitlab_url),
+                                        ai_service.prompt_version, comment_id)
+        print("--- STEP 7 COMPLETE ---")
+        return jira_comment
 
-        print("\n--- STEP 5: Analyzing code diff with AI... ---")
-        analysis_result = ai_service.analyze_code_diff(code_diff)
-        if not analysis_result:
-            print(f"--- SKIP URL: AI analysis failed for {gitlab_url}. ---")
-            continue
-        print("--- STEP 5 COMPLETE ---")
+    async def analyze_diff(code_diff):
+        # Awaited on the pipeline's loop, so analyses wait on the LLM without holding a thread each.
+        return await ai_service.analyze_code_diff_async(code_diff, ticket_id=ticket_id)
 
-        print("\n--- STEP 6: Formatting comment for Jira... ---")
-        jira_comment = format_comment(analysis_result, gitlab_url, assignee_name)
-        print("--- STEP 6 COMPLETE ---")
-        
-        print("\n--- STEP 7: Posting comment to Jira ticket... ---")
-        jira_service.post_comment(ticket_id, jira_comment)
-        print("--- STEP 7 COMPLETE ---")
-        
-        # Store the conclusion for the final transition decision
-        conclusion = analysis_result.get('conclusion', '').strip().lower()
+    pipeline = ReviewPipeline(fetch_diff, analyze_diff, post_review, close_fn=ai_service.aclose)
+    results = pipeline.run(urls_to_review)
+
+    # Store the conclusion for the final transition decision, in URL order
+    any_transition_recommended = False
+    final_conclusion = None
+    jira_comment = None
+    for result in results:
+        if not result.posted:
+            continue
+        conclusion = result.analysis_result.get('conclusion', '').strip().lower()
         if 'staging' in conclusion or 'revisi' in conclusion:
             any_transition_recommended = True
             final_conclusion = conclusion
+            jira_comment = result.comment
 
     # --- STEP 8: Perform a single transition based on the results of all reviews ---
     if any_transition_recommended and final_conclusion:
@@ -207,7 +330,6 @@ def main_workflow(ticket_id):
                 transition_successful = jira_service.transition_ticket_status(ticket_id, "➔ Revisi")
                 if transition_successful:
                     print("   Transition to 'Revisi' successful. Looking for the cloned ticket...")
-                    import time
                     time.sleep(10) # 10-second delay
                     
                     cloned_issue = jira_service.find_cloned_issue(ticket_id)
@@ -227,6 +349,87 @@ def main_workflow(ticket_id):
         print("\n--- STEP 8: No transition recommended in any of the new reviews. ---")
 
 
+def run_single_ticket(ticket_id, services=None):
+    """
+    Runs main_workflow for one ticket, keeping any error isolated to that ticket.
+    Returns a result dict with the ticket ID, status, wall time and error (if any).
+    """
+    start_time = time.time()
+    try:
+        print(f"\n\n--- Processing ticket: {ticket_id} ---")
+        main_workflow(ticket_id, services)
+        print(f"--- Successfully completed analysis for ticket: {ticket_id} ---")
+        error = None
+    except Exception as e:
+        # Log the error for the specific ticket and continue with the next one
+        print(f"\n--- An error occurred while processing ticket {ticket_id}: {e} ---", file=sys.stderr)
+        error = str(e)
+    elapsed = time.time() - start_time
+    get_run_report().write_ticket_summary(ticket_id, elapsed, ok=error is None)
+    return {
+        "ticket_id": ticket_id,
+        "ok": error is None,
+        "elapsed": elapsed,
+        "error": error,
+    }
+
+def run_tickets(ticket_ids, workers=1, services=None):
+    """
+    Processes the given tickets with a bounded pool of `workers` threads, all sharing
+    one ServiceContainer. Results are returned in the same order as `ticket_ids`.
+    """
+    services = services or ServiceContainer()
+    workers = max(1, min(workers, len(ticket_ids)))
+    # Before the first ticket builds the AIService, whose hedge pool is sized by it.
+    services.ticket_workers = workers
+    if workers == 1:
+        return [run_single_ticket(ticket_id, services) for ticket_id in ticket_ids]
+
+    print(f"--- Processing {len(ticket_ids)} tickets with {workers} workers ---")
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ticket") as executor:
+        futures = {executor.submit(run_single_ticket, ticket_id, services): ticket_id for ticket_id in ticket_ids}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return [results[ticket_id] for ticket_id in ticket_ids]
+
+def print_run_summary(results, total_elapsed):
+    """Prints throughput and per-ticket wall time for a batch of tickets."""
+    succeeded = sum(1 for result in results if result["ok"])
+    failed = len(results) - succeeded
+    throughput = len(results) / (total_elapsed / 60) if total_elapsed > 0 else 0.0
+
+    print("\n--- Run Summary ---")
+    print(f"   Tickets: {len(results)} (succeeded: {succeeded}, failed: {failed})")
+    print(f"   Total wall time: {total_elapsed:.2f} seconds")
+    print(f"   Throughput: {throughput:.2f} tickets/minute")
+    for result in results:
+        status = "OK" if result["ok"] else f"FAILED ({result['error']})"
+        print(f"   {result['ticket_id']}: {result['elapsed']:.2f} seconds - {status}")
+
+def print_ai_cache_stats():
+    """Prints hit/miss counters of the AI analysis cache for this run."""
+    if not settings.AI_CACHE_ENABLED:
+        return
+    stats = get_cache_store(settings.AI_CACHE_PATH).stats()
+    print(f"   AI cache: {stats['hits']} hits, {stats['misses']} misses "
+          f"(hit rate {stats['hit_rate']:.0%}, {stats['entries']} entries, {stats['bytes'] / 1024:.1f} KiB)")
+
+def print_llm_usage(totals):
+    """Prints the LLM token and latency totals of this run."""
+    print(f"   LLM calls: {totals['calls']} (cached: {totals['cached_calls']}, failed: {totals['failed_calls']}), "
+          f"prompt tokens: {totals['prompt_tokens']}, completion tokens: {totals['completion_tokens']}, "
+          f"LLM time: {totals['latency_seconds']:.2f} seconds")
+    for name, state in totals.get("concurrency", {}).items():
+        print(f"   {name} concurrency limit: {state['limit']} ({state['changes']} adjustments)")
+    hedge = totals.get("hedge")
+    if hedge:
+        win_rate = f"{hedge['hedge_win_rate']:.0%}" if hedge["hedge_win_rate"] is not None else "n/a"
+        print(f"   Hedged LLM calls: {hedge['hedged']} of {hedge['calls']} ({hedge['hedge_rate']:.0%}), "
+              f"hedge won: {hedge['hedge_wins']} ({win_rate})")
+    if settings.RUN_REPORT_PATH:
+        print(f"   Run report written to {settings.RUN_REPORT_PATH}")
+
 def main():
     """Main function to run the AI System Analyst Assistant."""
     parser = argparse.ArgumentParser(
@@ -237,6 +440,11 @@ def main():
         type=str,
         help="One or more Jira ticket IDs to analyze, separated by commas (e.g., 'PROJ-123,PROJ-124')."
     )
+    parser.add_argument(
+        "--jql",
+        type=str,
+        help="Review every ticket matching this JQL query (e.g., 'project = PROJ AND status = \"In Review\"')."
+    )
     parser.add_argument(
         "--local-repo-path",
         type=str,
@@ -254,6 +462,17 @@ def main():
         choices=["gemini", "openai"],
         help="The AI service provider to use (e.g., 'gemini', 'openai'). Defaults to settings.AI_SERVICE_PROVIDER."
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.TICKET_WORKERS,
+        help="Number of tickets to process in parallel. Defaults to settings.TICKET_WORKERS (1 = sequential)."
+    )
+    parser.add_argument(
+        "--no-ai-cache",
+        action="store_true",
+        help="Bypass the persistent AI analysis cache for this run."
+    )
 
     args = parser.parse_args()
     # Accept comma-separated tickets and split them into a list
@@ -263,36 +482,47 @@ def main():
     commit_sha = args.commit_sha
     ai_provider = args.ai_provider
 
-    if not ticket_id and not local_repo_path:
-        parser.error("Either --ticket or --local-repo-path must be provided.")
+    if not ticket_id and not args.jql and not local_repo_path:
+        parser.error("Either --ticket, --jql or --local-repo-path must be provided.")
     if local_repo_path and not commit_sha:
         parser.error("--commit-sha is required when --local-repo-path is provided.")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1.")
 
     # Override the AI service provider from settings if specified in CLI
     settings.AI_SERVICE_PROVIDER = ai_provider
+    if args.no_ai_cache:
+        settings.AI_CACHE_ENABLED = False
 
     # Since ticket_id is now a list, we handle it differently
     if ticket_id:
         print(f"--- Starting analysis for Jira tickets: {', '.join(ticket_id)} using {settings.AI_SERVICE_PROVIDER} ---")
+    elif args.jql:
+        print(f"--- Starting analysis for Jira tickets matching: {args.jql} using {settings.AI_SERVICE_PROVIDER} ---")
     elif local_repo_path:
         print(f"--- Starting analysis for local repository: {local_repo_path} (Commit: {commit_sha}) using {settings.AI_SERVICE_PROVIDER} ---")
 
     try:
-        settings.validate_config()
+        settings.validate_config(require_remote=not local_repo_path)
+        # One container for the whole run keeps connections and clients warm across tickets.
+        services = ServiceContainer()
+        if args.jql and not local_repo_path:
+            # One paged search fetches every matching issue; the workflow reuses them as is.
+            found = [issue.key for issue in services.jira.search_issues(args.jql)]
+            ticket_id = list(dict.fromkeys((ticket_id or []) + found))
+            if not ticket_id:
+                print("--- No tickets match the JQL query. ---")
         if local_repo_path and commit_sha:
-            local_workflow(local_repo_path, commit_sha)
+            local_workflow(local_repo_path, commit_sha, services)
         elif ticket_id:
-            # Loop through each ticket ID provided
-            for single_ticket_id in ticket_id:
-                try:
-                    print(f"\n\n--- Processing ticket: {single_ticket_id} ---")
-                    main_workflow(single_ticket_id)
-                    print(f"--- Successfully completed analysis for ticket: {single_ticket_id} ---")
-                except Exception as e:
-                    # Log the error for the specific ticket and continue with the next one
-                    print(f"\n--- An error occurred while processing ticket {single_ticket_id}: {e} ---", file=sys.stderr)
-                    # Optionally, continue to the next ticket instead of exiting
-                    continue
+            run_start_time = time.time()
+            results = run_tickets(ticket_id, workers=args.workers, services=services)
+            print_run_summary(results, time.time() - run_start_time)
+            print_ai_cache_stats()
+            print_llm_usage(get_run_report().write_run_summary(tickets=len(results)))
+            if settings.GIT_MIRROR_ENABLED and settings.GIT_MAINTENANCE_ENABLED:
+                # The run is done, so the mirrors are idle: a good time for gc and eviction.
+                services.git.run_maintenance()
     except (ValueError, Exception) as e:
         # This will catch initialization errors, e.g., config validation
         print(f"\nAn error occurred during initial setup: {e}", file=sys.stderr)
@@ -303,27 +533,30 @@ def main():
     elif local_repo_path:
         print(f"\n--- Analysis for local repository {local_repo_path} completed successfully. ---")
 
-def local_workflow(repo_path, commit_sha):
+def local_workflow(repo_path, commit_sha, services=None):
     """Workflow for analyzing a local Git repository."""
     print("--- STEP 1: Initializing services... ---")
-    # JiraService and AIService might still be needed for posting comments later or just AI analysis
-    gitlab_service = GitLabService() # Still needed for DiffFetcher
-    git_service = GitService()
-    ai_service = AIService()
-    
-    diff_fetcher = DiffFetcher(gitlab_service, git_service)
+    services = services or ServiceContainer()
+    ai_service = services.ai
+    diff_fetcher = services.diff_fetcher
+    diff_pruner = services.diff_pruner
     print("--- STEP 1 COMPLETE ---")
 
     print(f"\n--- STEP 2: Fetching code diff from local repository {repo_path} for commit {commit_sha}... ---")
     code_diff = diff_fetcher.fetch_local_repo_diff(repo_path, commit_sha)
+    code_diff = prune_diff(diff_pruner, code_diff, f"{repo_path}@{commit_sha}")
 
-    if not code_diff:
+    if code_diff is None:
         print("--- EXIT: Failed to fetch code diff from local repository. ---")
         return
+    if not code_diff:
+        print("--- EXIT: No reviewable changes in this commit after pruning. ---")
+        return
     print("--- STEP 2 COMPLETE ---")
 
     print("\n--- STEP 3: Analyzing code diff with AI... ---")
     analysis_result = ai_service.analyze_code_diff(code_diff)
+    print_llm_usage(get_run_report().write_run_summary())
     if not analysis_result:
         print("--- EXIT: AI analysis failed or returned no result. ---")
         return
@@ -340,28 +573,5 @@ def local_workflow(repo_path, commit_sha):
     print("--- STEP 4 COMPLETE ---")
 
 
-class DiffFetcher:
-    def __init__(self, gitlab_service: GitLabService, git_service: GitService):
-        self.gitlab_service = gitlab_service
-        self.git_service = git_service
-
-    def fetch_commit_diff(self, commit_url):
-        print(f"Attempting to fetch diff for commit via GitLab API: {commit_url}")
-        return self.gitlab_service.get_commit_diff(commit_url)
-
-    def fetch_gitlab_mr_diff(self, mr_url):
-        # MR diffs currently only supported via GitLab API
-        return self.gitlab_service.get_merge_request_diff(mr_url)
-
-    def fetch_local_repo_diff(self, repo_path, commit_sha):
-        """
-        Fetches the diff for a specific commit directly from a local repository path.
-        """
-        print(f"Fetching diff for commit {commit_sha} from local repository: {repo_path}")
-        # When analyzing a local repo provided by path, we might not want to fetch from remote origin by default,
-        # or we should allow it to fail gracefully if no remote is configured.
-        # Passing fetch_remote=True (default in new GitService method) but relying on the warning logic there.
-        return self.git_service.get_commit_diff(repo_path, commit_sha, fetch_remote=True)
-
 if __name__ == "__main__":
     main()
\ No newline at end of file
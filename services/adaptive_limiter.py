@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for calls to a shared upstream (the LLM gateway). Each call that
+    finishes with flat latency raises the limit by 1/limit (about +1 per full window of calls);
+    a 429 or a latency spike cuts it to limit * backoff. A call's latency is compared with the
+    baseline's prediction for its size (LatencyModel: fixed overhead plus a cost per token), so
+    big prompts are not mistaken for an overloaded gateway and small ones for a slow one.
+    Signals from calls that started before the last cut are ignored: they were sent under the
+    old limit.
+    """
+
+    def __init__(self, name, initial, min_limit, max_limit, latency_tolerance=2.0, backoff=0.5,
+                 on_change=None):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.on_change = on_change  # called as on_change(name, old_limit, new_limit, reason)
+        self._limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self._in_flight = 0
+        self._baseline = LatencyModel()
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self.decisions = deque(maxlen=20)
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @contextmanager
+    def slot(self, abort=None):
+        """
+        Holds one of the `limit` slots for the duration of a call. The caller reports the
+        outcome through the yielded Slot's record(); a slot without a record changes nothing.
+        `abort()` is called whenever the wait for a slot wakes up and may raise to give up
+        waiting; wake() wakes the waiters, e.g. when that has become the case.
+        """
+        with self._condition:
+            while self._in_flight >= self.limit:
+                if abort:
+                    abort()
+                self._condition.wait()
+            self._in_flight += 1
+        slot = Slot(self)
+        try:
+            yield slot
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def wake(self):
+        """Wakes every call waiting for a slot, so it checks its abort condition again."""
+        with self._condition:
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """slot() for event loops. Waiting polls, since the limit is shared with threads."""
+        while True:
+            with self._condition:
+                if self._in_flight < self.limit:
+                    self._in_flight += 1
+                    break
+            await asyncio.sleep(0.05)
+        slot = Slot(self)
+        try:
+            yield slot
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def _record(self, started_at, latency, tokens, rate_limited):
+        tokens = max(1, tokens or 1)
+        with self._condition:
+            old = self.limit
+            if started_at < self._last_decrease:
+                return
+            expected = self._baseline.predict(tokens)
+            if rate_limited:
+                reason = "rate limited (429)"
+            elif expected and latency > expected * self.latency_tolerance:
+                reason = f"latency spike ({latency / expected:.1f}x baseline)"
+                # Slow calls still move the baseline (capped at the tolerance), so a gateway that
+                # has become slower for good is re-learned instead of cutting the limit forever.
+                self._baseline.add(tokens, expected * self.latency_tolerance)
+            else:
+                self._baseline.add(tokens, latency)
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+                if self.limit != old:
+                    self._decide(old, "latency flat")
+                    self._condition.notify_all()
+                return
+            self._limit = max(self.min_limit, self._limit * self.backoff)
+            self._last_decrease = time.monotonic()
+            if self.limit != old:
+                self._decide(old, reason)
+
+    def _decide(self, old, reason):
+        self.decisions.append({"at": time.time(), "from": old, "to": self.limit, "reason": reason})
+        if self.on_change:
+            self.on_change(self.name, old, self.limit, reason)
+
+
+class LatencyModel:
+    """
+    Expected latency of a call as fixed overhead plus a cost per token, fitted by exponentially
+    weighted least squares over recent calls. Until the calls seen vary enough in size to tell
+    the two apart, a call is predicted to take as long as the slowest split consistent with
+    the average call: the average latency for smaller calls, proportionally longer for bigger ones.
+    """
+
+    def __init__(self, decay=0.9, min_spread=0.25):
+        self.decay = decay
+        self.min_spread = min_spread  # coefficient of variation of call sizes needed for a fit
+        self._weight = 0.0
+        self._x = 0.0
+        self._y = 0.0
+        self._xx = 0.0
+        self._xy = 0.0
+
+    def add(self, tokens, latency):
+        self._weight = self._weight * self.decay + 1
+        self._x = self._x * self.decay + tokens
+        self._y = self._y * self.decay + latency
+        self._xx = self._xx * self.decay + tokens * tokens
+        self._xy = self._xy * self.decay + tokens * latency
+
+    def predict(self, tokens):
+        """Expected seconds for a call of `tokens` tokens, or None before any call was added."""
+        if not self._weight:
+            return None
+        mean_x = self._x / self._weight
+        mean_y = self._y / self._weight
+        variance = self._xx / self._weight - mean_x * mean_x
+        if variance > (self.min_spread * mean_x) ** 2:
+            per_token = (self._xy / self._weight - mean_x * mean_y) / variance
+            overhead = mean_y - per_token * mean_x
+            if per_token >= 0 and overhead >= 0:
+                return overhead + per_token * tokens
+        return max(mean_y, mean_y * tokens / mean_x)
+
+
+class Slot:
+    """One in-flight call admitted by an AdaptiveLimiter."""
+
+    def __init__(self, limiter):
+        self._limiter = limiter
+        self.started_at = time.monotonic()
+
+    def record(self, latency, tokens=None, rate_limited=False):
+        """Reports the call's latency, its token count and whether it was rate limited."""
+        self._limiter._record(self.started_at, latency, tokens, rate_limited)
@@ -1,44 +1,106 @@
-import openai
+import asyncio
 import json
-import re
 import os
 import certifi
+import threading
+import time
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
 from config import settings
-import google.generativeai as genai
+from services.diff_chunker import chunk_diff
+from services.token_utils import estimate_tokens
+from services.run_report import get_run_report
+from services.cache_store import get_cache_store, make_cache_key
+from services.http_transport import httpx_async_client, httpx_client
+from services.throttle import bucket_for, throttle_wait, throttled_call
+from services.adaptive_limiter import AdaptiveLimiter
+from services.hedging import LatencyTracker, begin_send, check_cancelled, hedged_call, hedged_call_async, register_cancel
+from services.llm_stream import JsonObjectScanner, StreamTimeout, collect_stream, collect_stream_async
+
+# Host the Gemini SDK talks to, for throttling and retries of its calls.
+GEMINI_HOST = "generativelanguage.googleapis.com"
 
 class AIService:
-    def __init__(self):
-        """Initializes the AI Service with the configured provider (Gemini or OpenAI)."""
-        self.provider = settings.AI_SERVICE_PROVIDER
+    def __init__(self, run_report=None, provider=None, model_name=None, hedge=True, ticket_workers=None):
+        """
+        Initializes the AI Service with the configured provider (Gemini or OpenAI), or with
+        `provider`/`model_name` when given (used for the hedging secondary, see AI_HEDGE_ENABLED).
+        `ticket_workers` is how many tickets share this service in parallel (TICKET_WORKERS by default).
+        """
+        self.run_report = run_report or get_run_report()
+        self.provider = provider or settings.AI_SERVICE_PROVIDER
         self.client = None
-        self.model_name = None
+        # AI_MODEL_NAME belongs to the configured provider, not to an explicitly given one.
+        configured_model = model_name if provider else settings.AI_MODEL_NAME
         self.api_key = None
+        # temperature=0 untuk output yang deterministic dan konsisten
+        self.temperature = 0
 
+        # Provider SDKs are imported only for the selected provider; together they
+        # account for most of the CLI's startup time.
         if self.provider == "gemini":
             self.api_key = settings.GEMINI_API_KEY
             if not self.api_key:
                 raise ValueError("GEMINI_API_KEY is not set for Gemini provider.")
+            import google.generativeai as genai
+            self._genai = genai
             genai.configure(api_key=self.api_key)
-            self.model_name = settings.AI_MODEL_NAME or 'gemini-pro-latest'
+            self.model_name = configured_model or 'gemini-pro-latest'
             self.client = genai.GenerativeModel(self.model_name)
+            self.api_host = GEMINI_HOST
             print(f"AIService initialized with Google Gemini ({self.model_name}).")
         elif self.provider == "openai":
             self.api_key = settings.OPENAI_API_KEY
             if not self.api_key:
                 raise ValueError("OPENAI_API_KEY is not set for OpenAI provider.")
-            import httpx
-            http_client = httpx.Client(verify=False)
+            import openai
+            # LLM calls have no side effects, so failed POSTs may be retried too. Retries happen
+            # in the shared transport; the SDK's own retries would stack on top of them.
+            http_client = httpx_client(verify=False, idempotent=True)
             self.client = openai.OpenAI(
                 api_key=self.api_key,
                 base_url=settings.OPENAI_BASE_URL,
-                http_client=http_client
+                http_client=http_client,
+                max_retries=0
             )
-            self.model_name = settings.AI_MODEL_NAME or "vertex_ai/gemini-3-flash-preview"
+            self.model_name = configured_model or "vertex_ai/gemini-3-flash-preview"
+            self.api_host = urlsplit(settings.OPENAI_BASE_URL or "https://api.openai.com/v1").hostname
             print(f"AIService initialized with OpenAI ({self.model_name}).")
         else:
             raise ValueError(f"Unsupported AI_SERVICE_PROVIDER: {self.provider}. Must be 'gemini' or 'openai'.")
         
+        self.streaming = settings.AI_STREAMING_ENABLED
+        # AsyncOpenAI clients for analyze_code_diff_async, one per event loop (ticket workers each
+        # run their own loop on a shared AIService), created on the loop that first needs one.
+        self._async_clients = {}
+        self._async_clients_lock = threading.Lock()
+
         self.prompt_template = self._load_prompt_template()
+        self.limiter = None
+        if settings.AI_ADAPTIVE_CONCURRENCY:
+            self.limiter = AdaptiveLimiter(
+                "llm" if hedge else "llm-hedge", settings.AI_CONCURRENCY_INITIAL, settings.AI_CONCURRENCY_MIN, settings.AI_CONCURRENCY_MAX,
+                latency_tolerance=settings.AI_LATENCY_TOLERANCE, backoff=settings.AI_CONCURRENCY_BACKOFF,
+                on_change=self.run_report.record_concurrency_change,
+            )
+        # Hedging: a second provider/model that gets the same prompt when this one is slow.
+        self.hedge = None
+        if hedge and settings.AI_HEDGE_ENABLED:
+            self.hedge = AIService(self.run_report, provider=settings.AI_HEDGE_PROVIDER,
+                                   model_name=settings.AI_HEDGE_MODEL_NAME, hedge=False)
+            self._latencies = LatencyTracker()
+            # Up to two legs for every call that can be in flight at once.
+            ticket_workers = ticket_workers or settings.TICKET_WORKERS
+            workers = 2 * max(settings.AI_CONCURRENCY_MAX, ticket_workers * settings.AI_CHUNK_CONCURRENCY)
+            self._hedge_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-hedge")
+            print(f"Hedging slow calls to {self.hedge.provider} ({self.hedge.model_name}).")
+        self.cache = None
+        if settings.AI_CACHE_ENABLED:
+            self.cache = get_cache_store(
+                settings.AI_CACHE_PATH,
+                max_bytes=settings.AI_CACHE_MAX_MB * 1024 * 1024,
+                max_age_seconds=settings.AI_CACHE_MAX_AGE_DAYS * 24 * 3600,
+            )
 
     def _load_prompt_template(self):
         """Loads the prompt template from the file."""
@@ -51,59 +113,530 @@ class AIService:
 
     def _clean_json_response(self, text):
         """Cleans the text to extract a valid JSON object."""
-        # This regex is more robust and handles cases where the JSON is not perfectly formatted.
-        # It looks for a string that starts with { and ends with }, and is greedy.
-        match = re.search(r'\{.*\}', text, re.DOTALL)
-        if match:
-            return match.group(0)
-        return text
+        # The first balanced top-level object, so prose or a second object after it is ignored.
+        scanner = JsonObjectScanner()
+        scanner.feed(text)
+        return scanner.json_text
 
     def _call_gemini_api(self, prompt):
-        """Makes a call to the Gemini API using the official Google SDK."""
+        """
+        Makes a call to the Gemini API using the official Google SDK.
+        Returns (response_text, prompt_tokens, completion_tokens, ttft) from usage_metadata.
+        """
+        if self.streaming:
+            response = throttled_call(GEMINI_HOST, lambda: self.client.generate_content(
+                prompt, generation_config=self._gemini_generation_config(), stream=True))
+            # Cancelling the underlying call unblocks a read that is waiting on a stalled stream.
+            cancel = getattr(getattr(response, "_iterator", None), "cancel", None)
+            if cancel:
+                register_cancel(cancel)
+            return self._stream_result(*collect_stream(
+                response, _gemini_chunk, settings.AI_FIRST_TOKEN_TIMEOUT, settings.AI_STREAM_STALL_TIMEOUT, cancel))
+        response = throttled_call(GEMINI_HOST,
+                                  lambda: self.client.generate_content(prompt, generation_config=self._gemini_generation_config()))
+        return self._gemini_result(response)
+
+    def _gemini_generation_config(self):
         # The response_mime_type can be set via generation_config
-        # temperature=0 untuk output yang deterministic dan konsisten
-        generation_config = genai.types.GenerationConfig(
+        return self._genai.types.GenerationConfig(
             response_mime_type="application/json",
-            temperature=0
+            temperature=self.temperature
+        )
+
+    def _gemini_result(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        return (
+            response.text,
+            getattr(usage, "prompt_token_count", None),
+            getattr(usage, "candidates_token_count", None),
+            None,
         )
-        response = self.client.generate_content(prompt, generation_config=generation_config)
-        return response.text
 
-    def analyze_code_diff(self, code_diff):
+    def _stream_result(self, scanner, usage, ttft):
+        """(response_text, prompt_tokens, completion_tokens, ttft) of a collected stream."""
+        prompt_tokens, completion_tokens = usage or (None, None)
+        return scanner.json_text or None, prompt_tokens, completion_tokens, ttft
+
+    def _cache_key(self, code_diff):
+        """Content-addressed cache key for an analysis of `code_diff` with the current setup."""
+        return make_cache_key(self.prompt_template, self.provider, self.model_name, self.temperature, code_diff)
+
+    @property
+    def prompt_version(self):
+        """Short fingerprint of the prompt template, recorded with every posted review."""
+        return make_cache_key(self.prompt_template)[:12]
+
+    def analyze_code_diff(self, code_diff, ticket_id=None):
         """
         Sends the code diff to the configured AI model for analysis and returns the structured result.
+        Diffs larger than AI_CHUNK_TOKEN_BUDGET are split at file/hunk boundaries, the chunks are
+        analyzed in parallel and their findings are merged into a single result.
+        """
+        if not code_diff:
+            print("Code diff is empty. Skipping analysis.")
+            return None
+
+        # code_diff is diff text or a ParsedDiff; chunks are rendered text either way.
+        chunks = chunk_diff(code_diff, settings.AI_CHUNK_TOKEN_BUDGET)
+        if len(chunks) == 1:
+            return self._analyze_chunk(chunks[0], ticket_id)
+
+        print(f"Code diff is ~{estimate_tokens(code_diff)} tokens; splitting into {len(chunks)} chunks "
+              f"of at most ~{settings.AI_CHUNK_TOKEN_BUDGET} tokens.")
+        workers = max(1, min(settings.AI_CHUNK_CONCURRENCY, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-chunk") as executor:
+            chunk_results = list(executor.map(lambda chunk: self._analyze_chunk(chunk, ticket_id), chunks))
+
+        return self._combine_chunk_results(chunk_results)
+
+    async def analyze_code_diff_async(self, code_diff, ticket_id=None):
+        """
+        analyze_code_diff for asyncio: same chunking, result and error handling, but the
+        provider calls are awaited (AsyncOpenAI / Gemini async generation) instead of holding
+        a thread each, so many reviews can be in flight on one event loop.
         """
         if not code_diff:
             print("Code diff is empty. Skipping analysis.")
             return None
 
+        chunks = chunk_diff(code_diff, settings.AI_CHUNK_TOKEN_BUDGET)
+        if len(chunks) == 1:
+            return await self._analyze_chunk_async(chunks[0], ticket_id)
+
+        print(f"Code diff is ~{estimate_tokens(code_diff)} tokens; splitting into {len(chunks)} chunks "
+              f"of at most ~{settings.AI_CHUNK_TOKEN_BUDGET} tokens.")
+        semaphore = asyncio.Semaphore(max(1, settings.AI_CHUNK_CONCURRENCY))
+
+        async def analyze(chunk):
+            async with semaphore:
+                return await self._analyze_chunk_async(chunk, ticket_id)
+        chunk_results = await asyncio.gather(*(analyze(chunk) for chunk in chunks))
+        return self._combine_chunk_results(chunk_results)
+
+    def _combine_chunk_results(self, chunk_results):
+        """Merges the chunk analyses, or returns None if any chunk failed."""
+        failed = sum(1 for result in chunk_results if not result)
+        if failed:
+            # A partial review would be posted as if it covered the whole diff; skip it instead.
+            print(f"AI analysis failed for {failed} of {len(chunk_results)} chunks. Discarding partial review.")
+            return None
+        return self._merge_chunk_results(chunk_results)
+
+    def _merge_chunk_results(self, chunk_results):
+        """
+        Merges per-chunk analyses into the single result shape expected by format_comment.
+        The prompt's "max 5 issues" rule is applied after the merge, keeping the most severe ones.
+        """
+        # Tags the prompt asks the model to prefix its comments with, most severe first.
+        severity_order = ["[SECURITY", "[BUG", "[COMPLIANCE"]
+
+        def severity(finding):
+            comment = str(finding.get('comment', '')).upper()
+            for rank, tag in enumerate(severity_order):
+                if tag in comment[:40]:
+                    return rank
+            return len(severity_order)
+
+        def dedupe(findings):
+            seen = set()
+            unique = []
+            for finding in findings:
+                key = (finding.get('file'), finding.get('line'), finding.get('comment'))
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(finding)
+            return unique
+
+        perubahan_diperlukan = []
+        sudah_baik = []
+        summaries = []
+        conclusions = []
+        for result in chunk_results:
+            analysis = result.get('analysis', {}) or {}
+            perubahan_diperlukan.extend(analysis.get('perubahan_diperlukan', []) or [])
+            sudah_baik.extend(analysis.get('sudah_baik', []) or [])
+            if result.get('change_summary'):
+                summaries.append(result['change_summary'].strip())
+            if result.get('conclusion'):
+                conclusions.append(result['conclusion'].strip())
+
+        # sorted() is stable, so findings of equal severity keep their diff order.
+        perubahan_diperlukan = sorted(dedupe(perubahan_diperlukan), key=severity)[:settings.AI_MAX_ISSUES]
+
+        # One chunk asking for revisions is enough to ask for revisions on the whole diff.
+        conclusion = next((c for c in conclusions if 'revisi' in c.lower()), None)
+        if conclusion is None and perubahan_diperlukan:
+            conclusion = "REVISI"
+        if conclusion is None:
+            conclusion = conclusions[0] if conclusions else ""
+
+        return {
+            "change_summary": "\n".join(summaries),
+            "analysis": {
+                "perubahan_diperlukan": perubahan_diperlukan,
+                "sudah_baik": dedupe(sudah_baik),
+            },
+            "conclusion": conclusion,
+        }
+
+    def _analyze_chunk(self, code_diff, ticket_id=None):
+        """Analyzes a diff that fits into a single prompt, using the cache when enabled."""
+        start_time = time.monotonic()
+        cached, cache_key, full_prompt = self._start_chunk(code_diff, start_time, ticket_id)
+        if cached is not None:
+            return cached
+        try:
+            response, source = self._call_hedged(full_prompt, ticket_id)
+        except Exception as e:
+            return self._call_failed(e, start_time, full_prompt, ticket_id)
+        return self._finish_chunk(response, start_time, full_prompt, code_diff, cache_key, ticket_id, source)
+
+    async def _analyze_chunk_async(self, code_diff, ticket_id=None):
+        """_analyze_chunk with an awaited provider call."""
+        start_time = time.monotonic()
+        cached, cache_key, full_prompt = self._start_chunk(code_diff, start_time, ticket_id)
+        if cached is not None:
+            return cached
+        try:
+            response, source = await self._call_hedged_async(full_prompt, ticket_id)
+        except Exception as e:
+            return self._call_failed(e, start_time, full_prompt, ticket_id)
+        return self._finish_chunk(response, start_time, full_prompt, code_diff, cache_key, ticket_id, source)
+
+    def _start_chunk(self, code_diff, start_time, ticket_id):
+        """
+        Returns (cached_result, cache_key, full_prompt). A cached result is recorded in the run
+        report and returned; otherwise the prompt is built for a provider call.
+        """
+        cache_key = None
+        if self.cache:
+            cache_key = self._cache_key(code_diff)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"Using cached analysis from {self.provider} ({self.model_name}).")
+                self._record_call(0, 0, start_time, cached=True, ticket_id=ticket_id)
+                return json.loads(cached), cache_key, None
+
         full_prompt = self.prompt_template.replace("{code_diff}", code_diff)
-        
         print(f"Sending code diff to {self.provider} ({self.model_name}) for analysis...")
+        return None, cache_key, full_prompt
+
+    def _finish_chunk(self, response, start_time, full_prompt, code_diff, cache_key, ticket_id, source=None):
+        """
+        Parses a provider response into the analysis result, recording and caching it.
+        `source` is the AIService whose provider answered (the hedge, when it won); the result
+        is cached under that service's key, since another model produced it.
+        """
+        source = source or self
+        response_text, prompt_tokens, completion_tokens, ttft = response
+        if not response_text:
+            print(f"No response text received from {source.provider}.")
+            self._record_call(prompt_tokens, completion_tokens, start_time, ok=False, prompt=full_prompt,
+                              ticket_id=ticket_id, source=source)
+            return None
         try:
-            response_text = None
-            if self.provider == "gemini":
-                response_text = self._call_gemini_api(full_prompt)
-            elif self.provider == "openai":
-                chat_completion = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": full_prompt}],
-                    response_format={"type": "json_object"},
-                    temperature=0
+            cleaned_response = self._clean_json_response(response_text)
+            print(f"Received analysis from {source.provider}.")
+            analysis_result = json.loads(cleaned_response)
+        except json.JSONDecodeError as e:
+            print(f"Failed to decode JSON from {source.provider} response: {e}. Raw response: {response_text}")
+            self._record_call(prompt_tokens, completion_tokens, start_time, ok=False, prompt=full_prompt,
+                              response_text=response_text, ticket_id=ticket_id, ttft=ttft, source=source)
+            return None
+        self._record_call(prompt_tokens, completion_tokens, start_time, prompt=full_prompt,
+                          response_text=response_text, ticket_id=ticket_id, ttft=ttft, source=source)
+        if self.cache:
+            if source is not self:
+                cache_key = source._cache_key(code_diff)
+            self.cache.set(cache_key, json.dumps(analysis_result))
+        return analysis_result
+
+    def _call_failed(self, error, start_time, full_prompt, ticket_id):
+        print(f"An error occurred with the {self.provider} API: {error}")
+        self._record_call(None, None, start_time, ok=False, prompt=full_prompt, ticket_id=ticket_id)
+        return None
+
+    def _call_hedged(self, prompt, ticket_id=None):
+        """
+        Calls the provider, hedged when AI_HEDGE_ENABLED: see _hedge_delay for when the hedge
+        provider is asked too. Returns (response, source) with the AIService that answered.
+        """
+        if not self.hedge:
+            return self._call_provider_limited(prompt), self
+        start_time = time.monotonic()
+        response, winner, hedged = hedged_call(
+            lambda: self._call_provider_limited(prompt), lambda: self.hedge._call_provider_limited(prompt),
+            self._hedge_delay(), self._is_valid_response, self._hedge_executor,
+            on_lost=self._hedge_loser_recorder(prompt, start_time, ticket_id))
+        return self._hedge_outcome(response, winner, hedged, start_time)
+
+    async def _call_hedged_async(self, prompt, ticket_id=None):
+        """_call_hedged with awaited provider calls; the losing call's task is cancelled."""
+        if not self.hedge:
+            return await self._call_provider_limited_async(prompt), self
+        start_time = time.monotonic()
+        response, winner, hedged = await hedged_call_async(
+            lambda: self._call_provider_limited_async(prompt), lambda: self.hedge._call_provider_limited_async(prompt),
+            self._hedge_delay(), self._is_valid_response,
+            on_lost=self._hedge_loser_recorder(prompt, start_time, ticket_id))
+        return self._hedge_outcome(response, winner, hedged, start_time)
+
+    def _hedge_loser_recorder(self, prompt, start_time, ticket_id):
+        """
+        on_lost callback for hedged calls: adds a leg whose answer was not used to the run
+        report, since its request was billed all the same. A leg cancelled mid-request has no
+        usage, so its prompt is estimated and its partial completion is not counted.
+        """
+        def record(leg, response, error):
+            source = self.hedge if leg == 1 else self
+            response_text, prompt_tokens, completion_tokens, ttft = response or (None, None, 0, None)
+            self._record_call(prompt_tokens, completion_tokens, start_time, ok=error is None, prompt=prompt,
+                              response_text=response_text, ticket_id=ticket_id, ttft=ttft, source=source,
+                              hedge_lost=True)
+        return record
+
+    def _hedge_delay(self):
+        """
+        How long the primary provider gets before the hedge is asked as well: the
+        AI_HEDGE_PERCENTILE of its recent latencies, but at least AI_HEDGE_MIN_DELAY seconds
+        (also used until AI_HEDGE_MIN_SAMPLES calls were seen). Chunks are bounded by
+        AI_CHUNK_TOKEN_BUDGET, so raw latencies of different calls are comparable.
+        """
+        percentile = self._latencies.percentile(settings.AI_HEDGE_PERCENTILE, settings.AI_HEDGE_MIN_SAMPLES)
+        return max(settings.AI_HEDGE_MIN_DELAY, percentile or 0)
+
+    def _is_valid_response(self, response):
+        """True if a provider response contains a JSON object, i.e. a usable review."""
+        response_text = response[0]
+        if not response_text:
+            return False
+        try:
+            json.loads(self._clean_json_response(response_text))
+            return True
+        except json.JSONDecodeError:
+            return False
+
+    def _hedge_outcome(self, response, winner, hedged, start_time):
+        if winner is not None:
+            # Only the primary's latencies set the deadline. When the hedge won, the primary had
+            # taken at least this long, so the elapsed time is recorded as a lower bound; leaving
+            # lost races out would pull the percentile down toward AI_HEDGE_MIN_DELAY.
+            self._latencies.add(time.monotonic() - start_time)
+        self.run_report.record_hedge(hedged, winner == 1)
+        if hedged:
+            print(f"Hedged call: {'hedge' if winner == 1 else 'primary' if winner == 0 else 'no provider'} "
+                  f"answered first ({time.monotonic() - start_time:.1f}s).")
+        return response, self.hedge if winner == 1 else self
+
+    def _call_provider_limited(self, prompt):
+        """
+        _call_provider under the adaptive concurrency limit, feeding it the call's latency and
+        size and whether the gateway answered 429 meanwhile (retries happen in the transport).
+        Time spent waiting for the token bucket or a retry backoff is not the gateway's latency,
+        so it is left out.
+        """
+        check_cancelled()
+        if not self.limiter:
+            begin_send()
+            return self._call_provider(prompt)
+        bucket = bucket_for(self.api_host)
+        # A hedged leg that lost the race while waiting for a slot gives up instead of sending.
+        register_cancel(self.limiter.wake)
+        with self.limiter.slot(abort=check_cancelled) as slot:
+            rate_limited_before = bucket.rate_limited
+            waited_before = throttle_wait()
+            start_time = time.monotonic()
+            begin_send()
+            try:
+                result = self._call_provider(prompt)
+            except Exception:
+                self._record_slot(slot, start_time, prompt, None, bucket.rate_limited > rate_limited_before,
+                                  throttle_wait() - waited_before)
+                raise
+            self._record_slot(slot, start_time, prompt, result, bucket.rate_limited > rate_limited_before,
+                              throttle_wait() - waited_before)
+            return result
+
+    async def _call_provider_limited_async(self, prompt):
+        """_call_provider_limited with an awaited provider call."""
+        if not self.limiter:
+            begin_send()
+            return await self._call_provider_async(prompt)
+        bucket = bucket_for(self.api_host)
+        async with self.limiter.slot_async() as slot:
+            rate_limited_before = bucket.rate_limited
+            waited_before = throttle_wait()
+            start_time = time.monotonic()
+            begin_send()
+            try:
+                result = await self._call_provider_async(prompt)
+            except Exception:
+                self._record_slot(slot, start_time, prompt, None, bucket.rate_limited > rate_limited_before,
+                                  throttle_wait() - waited_before)
+                raise
+            self._record_slot(slot, start_time, prompt, result, bucket.rate_limited > rate_limited_before,
+                              throttle_wait() - waited_before)
+            return result
+
+    def _record_slot(self, slot, start_time, prompt, result, rate_limited, waited=0.0):
+        """
+        Reports a finished call to the limiter, minus the `waited` seconds it spent throttled.
+        Failed calls only count if they saw a 429.
+        """
+        latency = max(0.0, time.monotonic() - start_time - waited)
+        if result is None:
+            # Other failures say nothing about load; only a 429 is worth a cut.
+            if rate_limited:
+                slot.record(latency, rate_limited=True)
+            return
+        response_text, prompt_tokens, completion_tokens, _ = result
+        if not isinstance(prompt_tokens, int):
+            prompt_tokens = estimate_tokens(prompt)
+        if not isinstance(completion_tokens, int):
+            completion_tokens = estimate_tokens(response_text)
+        slot.record(latency, prompt_tokens + completion_tokens, rate_limited=rate_limited)
+
+    def _call_provider(self, prompt):
+        """
+        Sends the prompt to the configured provider, streaming the completion when
+        AI_STREAMING_ENABLED. A stream that misses its first-token or stall deadline is
+        aborted and sent again, up to AI_STREAM_RETRIES times.
+        Returns (response_text, prompt_tokens, completion_tokens, ttft); token counts are None
+        when the provider does not report usage, ttft is None for non-streamed calls.
+        """
+        for attempt in range(settings.AI_STREAM_RETRIES + 1):
+            try:
+                if self.provider == "gemini":
+                    return self._call_gemini_api(prompt)
+                return self._call_openai_api(prompt)
+            except StreamTimeout as e:
+                if attempt == settings.AI_STREAM_RETRIES:
+                    raise
+                print(f"{self.provider} stream aborted ({e}); retrying ({attempt + 1}/{settings.AI_STREAM_RETRIES}).")
+
+    def _call_openai_api(self, prompt):
+        if self.streaming:
+            stream = self.client.chat.completions.create(**self._openai_request(prompt, stream=True))
+            register_cancel(stream.close)
+            return self._stream_result(*collect_stream(
+                stream, _openai_chunk, settings.AI_FIRST_TOKEN_TIMEOUT, settings.AI_STREAM_STALL_TIMEOUT,
+                stream.close))
+        return self._openai_result(self.client.chat.completions.create(**self._openai_request(prompt)))
+
+    def _openai_request(self, prompt, stream=False):
+        request = dict(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            response_format={"type": "json_object"},
+            temperature=self.temperature
+        )
+        if stream:
+            # Usage arrives in a final chunk without choices.
+            request.update(stream=True, stream_options={"include_usage": True})
+        return request
+
+    def _openai_result(self, chat_completion):
+        usage = getattr(chat_completion, "usage", None)
+        return (
+            chat_completion.choices[0].message.content,
+            getattr(usage, "prompt_tokens", None),
+            getattr(usage, "completion_tokens", None),
+            None,
+        )
+
+    async def _call_provider_async(self, prompt):
+        """_call_provider on the providers' async APIs."""
+        for attempt in range(settings.AI_STREAM_RETRIES + 1):
+            try:
+                if self.provider == "gemini":
+                    return await self._call_gemini_api_async(prompt)
+                return await self._call_openai_api_async(prompt)
+            except StreamTimeout as e:
+                if attempt == settings.AI_STREAM_RETRIES:
+                    raise
+                print(f"{self.provider} stream aborted ({e}); retrying ({attempt + 1}/{settings.AI_STREAM_RETRIES}).")
+
+    async def _call_gemini_api_async(self, prompt):
+        # The SDK's async client is a process-wide grpc.aio channel bound to the first event loop,
+        # so every later asyncio.run would fail on it. The sync call in a worker thread has no such
+        # tie, and a hedge cancel still reaches it through the leg's token in the copied context.
+        return await asyncio.to_thread(self._call_gemini_api, prompt)
+
+    async def _call_openai_api_async(self, prompt):
+        client = self._get_async_client()
+        if self.streaming:
+            stream = await client.chat.completions.create(**self._openai_request(prompt, stream=True))
+            return self._stream_result(*await collect_stream_async(
+                stream, _openai_chunk, settings.AI_FIRST_TOKEN_TIMEOUT, settings.AI_STREAM_STALL_TIMEOUT))
+        return self._openai_result(await client.chat.completions.create(**self._openai_request(prompt)))
+
+    def _get_async_client(self):
+        """
+        The AsyncOpenAI client of the running event loop. Its httpx.AsyncClient pool is bound to
+        the loop it was created on, so every loop (e.g. each ticket worker's asyncio.run) gets its
+        own client; call aclose() before a loop ends so its connections are closed on that loop.
+        """
+        loop = asyncio.get_running_loop()
+        with self._async_clients_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                # Clients of loops that ended without aclose() can no longer be closed; forget them.
+                for ended in [other for other in self._async_clients if other.is_closed()]:
+                    del self._async_clients[ended]
+                import openai
+                client = self._async_clients[loop] = openai.AsyncOpenAI(
+                    api_key=self.api_key,
+                    base_url=settings.OPENAI_BASE_URL,
+                    http_client=httpx_async_client(verify=False, idempotent=True),
+                    max_retries=0
                 )
-                response_text = chat_completion.choices[0].message.content
+        return client
 
-            if response_text:
-                cleaned_response = self._clean_json_response(response_text)
-                print(f"Received analysis from {self.provider}.")
-                return json.loads(cleaned_response)
-            else:
-                print(f"No response text received from {self.provider}.")
-                return None
+    async def aclose(self):
+        """Closes the AsyncOpenAI clients (this service's and the hedge's) of the running loop only."""
+        with self._async_clients_lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+        if self.hedge:
+            await self.hedge.aclose()
 
-        except json.JSONDecodeError as e:
-            print(f"Failed to decode JSON from {self.provider} response: {e}. Raw response: {response_text}")
-            return None
-        except Exception as e:
-            print(f"An error occurred with the {self.provider} API: {e}")
-            return None
\ No newline at end of file
+    def _record_call(self, prompt_tokens, completion_tokens, start_time, cached=False, ok=True,
+                     prompt=None, response_text=None, ticket_id=None, ttft=None, source=None, hedge_lost=False):
+        """
+        Adds one call to the run report, estimating token counts the provider did not report.
+        The call is attributed to `source` (an AIService), by default this one.
+        """
+        source = source or self
+        estimated = False
+        if not cached:
+            if not isinstance(prompt_tokens, int):
+                prompt_tokens = estimate_tokens(prompt)
+                estimated = True
+            if not isinstance(completion_tokens, int):
+                completion_tokens = estimate_tokens(response_text)
+                estimated = True
+        self.run_report.record_llm_call(
+            source.provider, source.model_name, prompt_tokens or 0, completion_tokens or 0,
+            time.monotonic() - start_time, cached=cached, ok=ok, estimated=estimated, ticket_id=ticket_id,
+            ttft=ttft, hedge_lost=hedge_lost,
+        )
+
+
+def _openai_chunk(chunk):
+    """(text, (prompt_tokens, completion_tokens) or None) of one streamed chat completion chunk."""
+    text = chunk.choices[0].delta.content if chunk.choices else None
+    usage = getattr(chunk, "usage", None)
+    return text, (getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)) if usage else None
+
+
+def _gemini_chunk(chunk):
+    """(text, (prompt_tokens, completion_tokens) or None) of one streamed Gemini response chunk."""
+    try:
+        text = chunk.text
+    except ValueError:  # chunks without text parts (e.g. only finish reason / usage)
+        text = None
+    usage = getattr(chunk, "usage_metadata", None)
+    if not getattr(usage, "candidates_token_count", None):
+        return text, None
+    return text, (getattr(usage, "prompt_token_count", None), usage.candidates_token_count)
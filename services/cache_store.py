@@ -0,0 +1,128 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def make_cache_key(*parts):
+    """Builds a content-addressed key (SHA-256 hex digest) from the given parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        # Length-prefix every part so ("ab", "c") and ("a", "bc") never collide.
+        digest.update(f"{len(data)}:".encode("ascii"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def get_cache_store(path, max_bytes=None, max_age_seconds=None):
+    """
+    Returns the process-wide CacheStore for `path`, creating it on first use.
+    Sharing one instance per file keeps a single connection and one set of counters.
+    """
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = CacheStore(path, max_bytes=max_bytes, max_age_seconds=max_age_seconds)
+            _stores[path] = store
+        return store
+
+
+class CacheStore:
+    """
+    A small persistent key/value store backed by SQLite.
+    Entries are evicted when they are older than `max_age_seconds`, and the least
+    recently used entries are dropped once the store grows past `max_bytes`.
+    """
+
+    def __init__(self, path, max_bytes=None, max_age_seconds=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # WAL lets concurrent runs (e.g. cron + manual) read while another one writes.
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None on a miss (including expired entries)."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row and self.max_age_seconds and now - row[1] > self.max_age_seconds:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        """Stores `value` (str or bytes) under `key` and evicts entries over the size/age budget."""
+        now = time.time()
+        size = len(value.encode("utf-8") if isinstance(value, str) else value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones until the store fits `max_bytes`."""
+        with self._lock:
+            self._evict(time.time())
+            self._conn.commit()
+
+    def _evict(self, now):
+        if self.max_age_seconds:
+            self._conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.max_age_seconds,))
+        if not self.max_bytes:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        """Returns hit/miss counters and the current number of entries and bytes stored."""
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total,
+        }
@@ -0,0 +1,68 @@
+import threading
+from config import settings
+from services.jira_service import JiraService
+from services.gitlab_service import GitLabService
+from services.ai_service import AIService
+from services.git_service import GitService
+from services.diff_pruner import DiffPruner
+from services.diff_fetcher import DiffFetcher
+from services.review_ledger import ReviewLedger
+
+
+class ServiceContainer:
+    """
+    Long-lived services shared by every ticket of a run.
+    Each service is built on first use and then reused, so the Jira and GitLab
+    sessions, the LLM HTTP client and the loaded prompt stay warm across tickets
+    instead of being re-created (and re-authenticated) per ticket.
+    """
+
+    def __init__(self, ticket_workers=None):
+        self._lock = threading.RLock()
+        self._services = {}
+        # Tickets sharing these services in parallel (set by run_tickets); sizes the AIService pools.
+        self.ticket_workers = ticket_workers or settings.TICKET_WORKERS
+
+    def _get(self, name, factory):
+        service = self._services.get(name)
+        if service is None:
+            with self._lock:
+                service = self._services.get(name)
+                if service is None:
+                    service = factory()
+                    self._services[name] = service
+        return service
+
+    @property
+    def jira(self):
+        return self._get("jira", JiraService)
+
+    @property
+    def gitlab(self):
+        return self._get("gitlab", GitLabService)
+
+    @property
+    def ai(self):
+        return self._get("ai", lambda: AIService(ticket_workers=self.ticket_workers))
+
+    @property
+    def git(self):
+        return self._get("git", GitService)
+
+    @property
+    def diff_fetcher(self):
+        return self._get("diff_fetcher", lambda: DiffFetcher(self.gitlab, self.git))
+
+    @property
+    def diff_pruner(self):
+        """The DiffPruner, or None when pruning is disabled."""
+        if not settings.DIFF_PRUNE_ENABLED:
+            return None
+        return self._get("diff_pruner", DiffPruner)
+
+    @property
+    def review_ledger(self):
+        """The ReviewLedger, or None when the ledger is disabled."""
+        if not settings.REVIEW_LEDGER_ENABLED:
+            return None
+        return self._get("review_ledger", lambda: ReviewLedger(settings.REVIEW_LEDGER_PATH))
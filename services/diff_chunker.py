@@ -0,0 +1,83 @@
+from services.diff_model import ParsedDiff
+from services.token_utils import estimate_tokens, estimate_tokens_for_length
+
+
+def split_diff_files(diff_text):
+    """
+    Splits a unified diff into (preamble, files), where every file is a tuple of
+    (header, hunks) and each part keeps its original text including newlines.
+    The preamble is whatever precedes the first file (e.g. the `git show` commit header).
+    """
+    parsed = ParsedDiff.parse(diff_text)
+    files = [(parsed.header_text(file), [parsed.hunk_text(hunk) for hunk in file.hunks]) for file in parsed.files]
+    return parsed.preamble, files
+
+
+def _split_oversized(header, text, token_budget):
+    """Splits a single hunk that exceeds the budget at line boundaries."""
+    pieces = []
+    current = header
+    for line in text.splitlines(keepends=True):
+        if current != header and estimate_tokens(current + line) > token_budget:
+            pieces.append(current)
+            current = header
+        current += line
+    if current != header:
+        pieces.append(current)
+    return pieces
+
+
+def _length(parts):
+    return sum(len(part) if isinstance(part, str) else part[1] - part[0] for part in parts)
+
+
+def _render(text, parts):
+    return "".join(part if isinstance(part, str) else text[part[0]:part[1]] for part in parts)
+
+
+def chunk_diff(diff, token_budget):
+    """
+    Splits a diff (text or ParsedDiff) into chunks that each fit `token_budget` estimated
+    tokens. Chunks are cut at file boundaries first and at hunk boundaries for files that are
+    too large on their own; every piece of a split file repeats the file header so the
+    model still knows which file it is looking at. A diff that fits is returned as is.
+    Packing works on the parsed records' offsets; text is only sliced out for the result.
+    """
+    parsed = ParsedDiff.parse(diff)
+    if estimate_tokens_for_length(parsed.size) <= token_budget:
+        return [diff if isinstance(diff, str) else parsed.render()]
+    if not parsed.files:
+        return _split_oversized("", parsed.render(), token_budget)
+
+    # Units are the smallest pieces we are willing to pack: whole files, or
+    # header + hunk for files that do not fit a chunk by themselves. A unit is a list of
+    # (start, end) slices of the diff buffer, or literal text for a split oversized hunk.
+    units = []
+    for file in parsed.files:
+        header = (file.start, file.header_end)
+        hunks = [(hunk.start, hunk.end) for hunk in file.hunks]
+        if estimate_tokens_for_length(file.size) <= token_budget or not hunks:
+            units.append([header] + hunks)
+            continue
+        for hunk in hunks:
+            if estimate_tokens_for_length(_length([header, hunk])) <= token_budget:
+                units.append([header, hunk])
+            else:
+                pieces = _split_oversized(_render(parsed.text, [header]), _render(parsed.text, [hunk]), token_budget)
+                units.extend([piece] for piece in pieces)
+
+    # The preamble (commit message) rides along with the first unit.
+    chunks = []
+    current = [(0, parsed.preamble_end)] if estimate_tokens_for_length(parsed.preamble_end) < token_budget else []
+    current_length = _length(current)
+    has_unit = False
+    for unit in units:
+        unit_length = _length(unit)
+        if has_unit and estimate_tokens_for_length(current_length + unit_length) > token_budget:
+            chunks.append(current)
+            current, current_length = [], 0
+        current.extend(unit)
+        current_length += unit_length
+        has_unit = True
+    chunks.append(current)
+    return [_render(parsed.text, parts) for parts in chunks]
@@ -0,0 +1,119 @@
+import threading
+from config import settings
+from services.gitlab_service import GitLabService, merge_request_refs
+from services.git_service import GitService
+
+
+class DiffFetcher:
+    def __init__(self, gitlab_service: GitLabService, git_service: GitService):
+        self.gitlab_service = gitlab_service
+        self.git_service = git_service
+        self._prefetched = {}  # commit URL -> diff, filled by prefetch_commit_diffs
+        self._prefetched_lock = threading.Lock()
+
+    def prefetch_commit_diffs(self, commit_urls):
+        """
+        Extracts the diffs of commits that share a project in one batch per mirror
+        (GitService.get_commit_diffs) instead of one fetch/cat-file/show round per commit.
+        fetch_commit_diff then serves those URLs from memory. Returns the number prefetched.
+        """
+        if not settings.GIT_MIRROR_ENABLED:
+            return 0
+        by_project = {}
+        for commit_url in dict.fromkeys(commit_urls):
+            project_path = self.git_service._get_project_path_from_url(commit_url)
+            commit_sha = self.gitlab_service._parse_commit_sha_from_url(commit_url)
+            if project_path and commit_sha:
+                by_project.setdefault(project_path, []).append((commit_url, commit_sha))
+
+        prefetched = 0
+        for project_path, commits in by_project.items():
+            if len(commits) < 2:
+                continue # A single commit takes the regular path
+            print(f"Batch fetching {len(commits)} commit diffs of {project_path} via local mirror...")
+            with self.git_service.mirror_lock(commits[0][0]) as locked:
+                repo_path = self.git_service.clone_repository(commits[0][0]) if locked else None
+                if not repo_path:
+                    continue
+                diffs = self.git_service.get_commit_diffs(repo_path, [sha for _, sha in commits])
+            with self._prefetched_lock:
+                for commit_url, commit_sha in commits:
+                    if diffs.get(commit_sha):
+                        self._prefetched[commit_url] = diffs[commit_sha]
+                        prefetched += 1
+        return prefetched
+
+    def fetch_commit_diff(self, commit_url):
+        """
+        Fetches a commit diff from the local mirror store first (a bare, blobless partial
+        clone keyed by the full project path) and falls back to the GitLab API if the
+        mirror cannot be created or does not yield the commit.
+        """
+        with self._prefetched_lock:
+            diff = self._prefetched.pop(commit_url, None)
+        if diff:
+            return diff
+
+        if settings.GIT_MIRROR_ENABLED:
+            commit_sha = self.gitlab_service._parse_commit_sha_from_url(commit_url)
+            print(f"Attempting to fetch diff for commit via local mirror: {commit_url}")
+            # The mirror stays locked from the clone to the diff, so it can't be evicted in between.
+            with self.git_service.mirror_lock(commit_url) as locked:
+                repo_path = self.git_service.clone_repository(commit_url) if commit_sha and locked else None
+                if repo_path:
+                    diff = self.git_service.get_commit_diff(repo_path, commit_sha)
+                    if diff:
+                        return diff
+            print(f"Local mirror could not provide the diff for {commit_url}. Falling back to GitLab API.")
+
+        print(f"Attempting to fetch diff for commit via GitLab API: {commit_url}")
+        return self.gitlab_service.get_commit_diff(commit_url)
+
+    def fetch_gitlab_mr_diff(self, mr_url, mr=None):
+        """
+        Fetches an MR diff from GitLab's paginated diffs endpoint, or with MR_DIFF_SOURCE="local"
+        from refs/merge-requests/<iid>/head in the local mirror (same output format), falling
+        back to the API. `mr` is the MR if the caller already fetched it (no second lookup).
+        """
+        if settings.MR_DIFF_SOURCE == "local" and settings.GIT_MIRROR_ENABLED:
+            mr_iid = self.gitlab_service._parse_mr_iid_from_url(mr_url)
+            print(f"Attempting to fetch diff for MR via local mirror: {mr_url}")
+            if mr is None:
+                mr = self.gitlab_service.get_merge_request(mr_url)
+            diff_refs = merge_request_refs(mr) or {}
+            with self.git_service.mirror_lock(mr_url) as locked:
+                repo_path = self.git_service.clone_repository(mr_url) if mr_iid and locked else None
+                if repo_path:
+                    diff = self.git_service.get_merge_request_diff(repo_path, mr_iid, diff_refs.get('base_sha'))
+                    if diff:
+                        return diff
+            print(f"Local mirror could not provide the diff for {mr_url}. Falling back to GitLab API.")
+
+        return self.gitlab_service.get_merge_request_diff(mr_url, mr=mr)
+
+    def fetch_mr_delta_diff(self, mr_url, old_head, new_head):
+        """
+        Fetches only what was pushed to an MR between two reviews ('git diff old_head..new_head'):
+        from the local mirror with MR_DIFF_SOURCE="local", otherwise (or as fallback) from the
+        GitLab compare API. Returns None if the delta can't be computed, e.g. after a force push
+        removed the old head.
+        """
+        if settings.MR_DIFF_SOURCE == "local" and settings.GIT_MIRROR_ENABLED:
+            with self.git_service.mirror_lock(mr_url) as locked:
+                repo_path = self.git_service.clone_repository(mr_url) if locked else None
+                if repo_path:
+                    diff = self.git_service.get_range_diff(repo_path, old_head, new_head)
+                    if diff:
+                        return diff
+            print(f"Local mirror could not provide the delta for {mr_url}. Falling back to GitLab API.")
+        return self.gitlab_service.get_compare_diff(mr_url, old_head, new_head)
+
+    def fetch_local_repo_diff(self, repo_path, commit_sha):
+        """
+        Fetches the diff for a specific commit directly from a local repository path.
+        """
+        print(f"Fetching diff for commit {commit_sha} from local repository: {repo_path}")
+        # When analyzing a local repo provided by path, we might not want to fetch from remote origin by default,
+        # or we should allow it to fail gracefully if no remote is configured.
+        # Passing fetch_remote=True (default in new GitService method) but relying on the warning logic there.
+        return self.git_service.get_commit_diff(repo_path, commit_sha, fetch_remote=True)
@@ -0,0 +1,212 @@
+import re
+
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+BINARY_LINE_RE = re.compile(r"^(Binary files .* differ|GIT binary patch)$")
+
+
+class Hunk:
+    """One '@@' hunk: its line ranges, +/- counts and [start, end) offsets into the diff buffer."""
+
+    __slots__ = ("start", "end", "old_start", "old_count", "new_start", "new_count", "additions", "deletions")
+
+    def __init__(self, start, header):
+        self.start = start
+        self.end = start
+        match = HUNK_HEADER_RE.match(header)
+        if match:
+            old_start, old_count, new_start, new_count = match.groups()
+            self.old_start, self.new_start = int(old_start), int(new_start)
+            self.old_count = 1 if old_count is None else int(old_count)
+            self.new_count = 1 if new_count is None else int(new_count)
+        else:
+            self.old_start = self.old_count = self.new_start = self.new_count = 0
+        self.additions = 0
+        self.deletions = 0
+
+    @property
+    def size(self):
+        return self.end - self.start
+
+
+class FileDiff:
+    """
+    One file of a diff: paths, change type ('added', 'deleted', 'renamed' or 'modified'),
+    its header's offsets into the diff buffer and its hunks. Holds no text of its own.
+    """
+
+    __slots__ = ("old_path", "new_path", "change_type", "binary", "start", "header_end", "hunks")
+
+    def __init__(self, start):
+        self.old_path = None
+        self.new_path = None
+        self.change_type = "modified"
+        self.binary = False
+        self.start = start
+        self.header_end = start
+        self.hunks = []
+
+    @property
+    def path(self):
+        """The new path, or the old one for deletions."""
+        return self.new_path or self.old_path
+
+    @property
+    def size(self):
+        return (self.header_end - self.start) + sum(hunk.size for hunk in self.hunks)
+
+    @property
+    def additions(self):
+        return sum(hunk.additions for hunk in self.hunks)
+
+    @property
+    def deletions(self):
+        return sum(hunk.deletions for hunk in self.hunks)
+
+    def with_hunks(self, hunks):
+        """A copy of this file restricted to `hunks`, still pointing into the same buffer."""
+        copy = FileDiff(self.start)
+        copy.old_path, copy.new_path = self.old_path, self.new_path
+        copy.change_type, copy.binary, copy.header_end = self.change_type, self.binary, self.header_end
+        copy.hunks = list(hunks)
+        return copy
+
+    def _read_header_line(self, line):
+        if line.startswith("diff --git "):
+            match = re.match(r"diff --git a/(.*) b/(.*)$", line)
+            if match:
+                self.old_path, self.new_path = match.group(1), match.group(2)
+        elif line.startswith("--- "):
+            self.old_path = _strip_prefix(line[4:].strip())
+            if self.old_path is None:
+                self.change_type = "added"
+        elif line.startswith("+++ "):
+            self.new_path = _strip_prefix(line[4:].strip())
+            if self.new_path is None:
+                self.change_type = "deleted"
+        elif line.startswith("new file mode"):
+            self.change_type = "added"
+        elif line.startswith("deleted file mode"):
+            self.change_type = "deleted"
+        elif line.startswith("rename from ") or line.startswith("rename to "):
+            self.change_type = "renamed"
+        elif BINARY_LINE_RE.match(line):
+            self.binary = True
+
+    def _finish(self):
+        if self.change_type == "added":
+            self.old_path = None
+        elif self.change_type == "deleted":
+            self.new_path = None
+        elif self.old_path and self.new_path and self.old_path != self.new_path:
+            self.change_type = "renamed"
+
+
+def _strip_prefix(path):
+    if path == "/dev/null":
+        return None
+    return path[2:] if path.startswith(("a/", "b/")) else path
+
+
+def _is_file_start(lines, i, git_style):
+    """Returns True if lines[i] starts a new file section of a unified diff."""
+    line = lines[i]
+    if git_style:
+        return line.startswith("diff --git ")
+    # GitLab API diffs only carry '--- a/x' / '+++ b/x' headers.
+    return (line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "))
+
+
+class ParsedDiff:
+    """
+    A unified diff parsed once into FileDiff/Hunk records that point into a single shared
+    text buffer. Filtering (select, FileDiff.with_hunks), sizing and stats work on the
+    records alone; text is only sliced out of the buffer when a diff is rendered.
+    """
+
+    __slots__ = ("text", "preamble_end", "files")
+
+    def __init__(self, text, preamble_end, files):
+        self.text = text
+        self.preamble_end = preamble_end
+        self.files = files
+
+    @classmethod
+    def parse(cls, diff_text):
+        """
+        Parses git ('diff --git' headers) and GitLab API ('--- a/x' / '+++ b/x') style diffs.
+        Whatever precedes the first file (e.g. the 'git show' commit header) is the preamble.
+        """
+        if isinstance(diff_text, ParsedDiff):
+            return diff_text
+        lines = diff_text.splitlines(keepends=True)
+        git_style = any(line.startswith("diff --git ") for line in lines)
+
+        files = []
+        preamble_end = len(diff_text)
+        current = hunk = None
+        position = 0
+        for i, line in enumerate(lines):
+            if _is_file_start(lines, i, git_style):
+                if current is None:
+                    preamble_end = position
+                else:
+                    current._finish()
+                current, hunk = FileDiff(position), None
+                files.append(current)
+            if current is not None:
+                if line.startswith("@@"):
+                    hunk = Hunk(position, line)
+                    current.hunks.append(hunk)
+                elif hunk is not None:
+                    if line.startswith("+"):
+                        hunk.additions += 1
+                    elif line.startswith("-"):
+                        hunk.deletions += 1
+                else:
+                    current._read_header_line(line.rstrip("\r\n"))
+            position += len(line)
+            if hunk is not None:
+                hunk.end = position
+            elif current is not None:
+                current.header_end = position
+        if current is not None:
+            current._finish()
+        return cls(diff_text, preamble_end, files)
+
+    @property
+    def preamble(self):
+        return self.text[:self.preamble_end]
+
+    def header_text(self, file):
+        return self.text[file.start:file.header_end]
+
+    def hunk_text(self, hunk):
+        return self.text[hunk.start:hunk.end]
+
+    def file_text(self, file):
+        return self.header_text(file) + "".join(self.hunk_text(hunk) for hunk in file.hunks)
+
+    def select(self, files, preamble=True):
+        """A view of this diff restricted to `files` (FileDiff records of this buffer)."""
+        return ParsedDiff(self.text, self.preamble_end if preamble else 0, list(files))
+
+    @property
+    def size(self):
+        """Length of the rendered diff in characters, computed without rendering it."""
+        return self.preamble_end + sum(file.size for file in self.files)
+
+    def stats(self):
+        return {
+            "files": len(self.files),
+            "additions": sum(file.additions for file in self.files),
+            "deletions": sum(file.deletions for file in self.files),
+        }
+
+    def render(self):
+        return self.preamble + "".join(self.file_text(file) for file in self.files)
+
+    def __str__(self):
+        return self.render()
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,172 @@
+import fnmatch
+import re
+from config import settings
+from services.diff_model import ParsedDiff
+from services.token_utils import estimate_tokens_for_length
+
+# Markers that tools put in the header comment of generated sources (Go, protoc, OpenAPI
+# generators, ...). Case-sensitive so annotations such as JPA's @GeneratedValue do not match.
+GENERATED_MARKER_RE = re.compile(r"(Code generated .* DO NOT EDIT|@generated\b|<auto-generated|[Aa]uto-generated|[Aa]utogenerated)")
+BINARY_MARKER_RE = re.compile(r"^(Binary files .* differ|GIT binary patch)$", re.MULTILINE)
+COMMENT_PREFIXES = ("//", "#", "/*", "*", "<!--", "--", ";", '"""', "'''")
+# Files where leading indentation is part of the meaning, so re-indenting is a real change.
+INDENT_SENSITIVE_EXTENSIONS = (".py", ".pyi", ".pyw", ".yaml", ".yml", ".coffee", ".haml", ".pug", ".jade",
+                               ".slim", ".sass", ".styl", ".nim", ".fs", ".hs", ".mk")
+INDENT_SENSITIVE_NAMES = ("Makefile", "GNUmakefile", "Snakefile", "BUILD", "WORKSPACE")
+
+
+def _is_indent_sensitive(path):
+    basename = (path or "").rsplit("/", 1)[-1]
+    return basename in INDENT_SENSITIVE_NAMES or basename.endswith(INDENT_SENSITIVE_EXTENSIONS)
+
+
+def _normalize(line, keep_indent):
+    """The line with all whitespace removed (as `git diff -w` compares), keeping the indent if asked."""
+    text = "".join(line.split())
+    if keep_indent and text:
+        return line[:len(line) - len(line.lstrip())] + text
+    return text
+
+
+def _is_whitespace_only(hunk, keep_indent=False):
+    """
+    True if the hunk's removed and added lines are pairwise identical once whitespace is
+    ignored, as `git diff -w` compares them. With `keep_indent`, a changed leading indent
+    counts as a real change (Python, YAML, ...).
+    """
+    removed = []
+    added = []
+    for line in hunk.splitlines()[1:]:
+        if line.startswith("-"):
+            removed.append(_normalize(line[1:], keep_indent))
+        elif line.startswith("+"):
+            added.append(_normalize(line[1:], keep_indent))
+    if not removed and not added:
+        return False
+    return removed == added
+
+
+def _has_generated_header(hunk, max_lines=6):
+    """True if a hunk starting at line 1 opens with a comment carrying a generated-code marker."""
+    lines = hunk.splitlines()[1:max_lines + 1]
+    for line in lines:
+        if line.startswith("-"):
+            continue
+        text = line[1:].strip()
+        if not text:
+            continue
+        if not text.startswith(COMMENT_PREFIXES):
+            return False
+        if GENERATED_MARKER_RE.search(text):
+            return True
+    return False
+
+
+class PruneReport:
+    """What a DiffPruner removed from one diff, and how much it saved."""
+
+    def __init__(self, bytes_before):
+        self.bytes_before = bytes_before
+        self.bytes_after = bytes_before
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.removed_files = []  # (path, reason)
+        self.removed_hunks = 0
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_before - self.bytes_after
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_before - self.tokens_after
+
+    def summary(self):
+        if not self.removed_files and not self.removed_hunks:
+            return "nothing pruned"
+        percent = (self.bytes_saved / self.bytes_before * 100) if self.bytes_before else 0
+        return (f"removed {len(self.removed_files)} files and {self.removed_hunks} whitespace-only hunks, "
+                f"saved {self.bytes_saved} bytes ({percent:.0f}%), ~{self.tokens_saved} tokens")
+
+
+class DiffPruner:
+    """
+    Removes diff content that is noise for a code review before it is sent to the LLM:
+    lockfiles, generated/vendored/minified files (glob and regex rules on the path, plus
+    generated-code markers), binary-file markers and whitespace-only hunks.
+    """
+
+    def __init__(self, path_globs=None, path_regexes=None, drop_whitespace_only=None):
+        self.path_globs = settings.DIFF_PRUNE_GLOBS if path_globs is None else path_globs
+        regexes = settings.DIFF_PRUNE_REGEXES if path_regexes is None else path_regexes
+        self.path_regexes = [re.compile(pattern) for pattern in regexes]
+        self.drop_whitespace_only = (settings.DIFF_PRUNE_WHITESPACE_ONLY
+                                     if drop_whitespace_only is None else drop_whitespace_only)
+
+    def _path_rule(self, path):
+        """Returns the rule that matches `path`, or None."""
+        basename = path.rsplit("/", 1)[-1]
+        for pattern in self.path_globs:
+            if fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(basename, pattern):
+                return f"glob {pattern}"
+        for regex in self.path_regexes:
+            if regex.search(path):
+                return f"regex {regex.pattern}"
+        return None
+
+    def _file_rule(self, parsed, file):
+        if file.path:
+            rule = self._path_rule(file.path)
+            if rule:
+                return rule
+        if file.binary or (file.hunks and any(BINARY_MARKER_RE.search(parsed.hunk_text(hunk)) for hunk in file.hunks)):
+            return "binary"
+        # Generated files announce themselves in the header comment at the top of the file.
+        first = file.hunks[0] if file.hunks else None
+        if first and first.new_start <= 1 and _has_generated_header(parsed.hunk_text(first)):
+            return "generated"
+        return None
+
+    def prune(self, diff):
+        """
+        Returns (pruned_diff, PruneReport). Text in, text out; a ParsedDiff in gives a
+        ParsedDiff view of the same buffer back, so nothing is re-parsed or copied.
+        """
+        parsed = ParsedDiff.parse(diff)
+        report = PruneReport(len(parsed.text.encode("utf-8")))
+        report.tokens_before = report.tokens_after = estimate_tokens_for_length(parsed.size)
+        if not parsed.files:
+            return diff, report
+
+        kept = []
+        removed_bytes = 0
+        for file in parsed.files:
+            rule = self._file_rule(parsed, file)
+            if rule:
+                report.removed_files.append((file.path or parsed.header_text(file).splitlines()[0], rule))
+                removed_bytes += len(parsed.file_text(file).encode("utf-8"))
+                continue
+            if self.drop_whitespace_only and file.hunks:
+                keep_indent = _is_indent_sensitive(file.path)
+                whitespace_only = [_is_whitespace_only(parsed.hunk_text(hunk), keep_indent) for hunk in file.hunks]
+                kept_hunks = [hunk for hunk, drop in zip(file.hunks, whitespace_only) if not drop]
+                removed_hunks = [hunk for hunk, drop in zip(file.hunks, whitespace_only) if drop]
+                report.removed_hunks += len(removed_hunks)
+                if not kept_hunks:
+                    report.removed_files.append((file.path, "whitespace-only"))
+                    removed_bytes += len(parsed.file_text(file).encode("utf-8"))
+                    continue
+                removed_bytes += sum(len(parsed.hunk_text(hunk).encode("utf-8")) for hunk in removed_hunks)
+                if removed_hunks:
+                    file = file.with_hunks(kept_hunks)
+            kept.append(file)
+
+        # With every file pruned, the preamble (e.g. the commit header of `git show`) is all
+        # that would be left; nothing of it is worth a review, so the diff becomes empty.
+        keep_preamble = bool(kept) or not parsed.files
+        if not keep_preamble:
+            removed_bytes += len(parsed.preamble.encode("utf-8"))
+        pruned = parsed.select(kept, preamble=keep_preamble)
+        report.bytes_after = report.bytes_before - removed_bytes
+        report.tokens_after = estimate_tokens_for_length(pruned.size)
+        return (pruned if isinstance(diff, ParsedDiff) else pruned.render()), report
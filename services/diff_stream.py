@@ -0,0 +1,102 @@
+from config import settings
+
+TRUNCATION_MARKER = "\n[... diff truncated: {reason}; the rest of this change was not reviewed ...]\n"
+
+
+def cap_lines(lines, max_bytes=None, max_lines=None):
+    """
+    Passes through the lines of a diff until `max_bytes` (UTF-8) or `max_lines` would be
+    exceeded, then yields a truncation marker and stops reading. A limit of 0 disables it;
+    None uses DIFF_MAX_BYTES / DIFF_MAX_LINES. The last line kept is always a whole line.
+    """
+    max_bytes = settings.DIFF_MAX_BYTES if max_bytes is None else max_bytes
+    max_lines = settings.DIFF_MAX_LINES if max_lines is None else max_lines
+    total_bytes = 0
+    total_lines = 0
+    for line in lines:
+        total_bytes += len(line.encode("utf-8"))
+        total_lines += 1
+        if max_lines and total_lines > max_lines:
+            yield TRUNCATION_MARKER.format(reason=f"more than {max_lines} lines")
+            break
+        if max_bytes and total_bytes > max_bytes:
+            yield TRUNCATION_MARKER.format(reason=f"more than {max_bytes} bytes")
+            break
+        yield line
+    # Stop the producer (e.g. kill a git process) instead of leaving it blocked on a full pipe.
+    close = getattr(lines, "close", None)
+    if close:
+        close()
+
+
+def _starts_file(line, next_line, git_style):
+    if git_style:
+        return line.startswith("diff --git ")
+    # GitLab API diffs only carry '--- a/x' / '+++ b/x' headers.
+    return line.startswith("--- ") and next_line is not None and next_line.startswith("+++ ")
+
+
+def iter_file_patches(lines):
+    """
+    Groups a stream of diff lines into per-file patches (same file rules as
+    split_diff_files) and yields each one as soon as it is complete. Whatever precedes
+    the first file, e.g. the 'git show' commit header, is yielded first on its own.
+    Only one file's patch is held in memory at a time.
+    """
+    git_style = None
+    current = []
+    previous = None
+    for line in lines:
+        if previous is not None:
+            if git_style is None and previous.startswith("diff --git "):
+                git_style = True
+            if current and _starts_file(previous, line, bool(git_style)):
+                yield "".join(current)
+                current = []
+            current.append(previous)
+        previous = line
+    if previous is not None:
+        current.append(previous)
+    if current:
+        yield "".join(current)
+
+
+def iter_gitlab_diff_lines(diffs):
+    """
+    Yields the lines of a unified diff built from GitLab API diff entries
+    ({'old_path', 'new_path', 'diff'}), which may come from a lazily paged iterator.
+    """
+    for diff in diffs:
+        # /dev/null marks added and deleted files, so the change type survives in the text.
+        yield "--- /dev/null\n" if diff.get('new_file') else f"--- a/{diff['old_path']}\n"
+        yield "+++ /dev/null\n" if diff.get('deleted_file') else f"+++ b/{diff['new_path']}\n"
+        # Same text as f"{diff['diff']}\n", one line at a time.
+        text = diff['diff']
+        if text.endswith("\n") or not text:
+            yield from text.splitlines(keepends=True)
+            yield "\n"
+        else:
+            lines = text.splitlines(keepends=True)
+            yield from lines[:-1]
+            yield lines[-1] + "\n"
+
+
+def gitlab_diff_entries(parsed):
+    """
+    Turns a ParsedDiff of 'git diff' output into GitLab API style diff entries, so a diff
+    computed locally renders exactly like one fetched from the API.
+    """
+    for file in parsed.files:
+        yield {
+            "old_path": file.old_path or file.new_path,
+            "new_path": file.new_path or file.old_path,
+            "new_file": file.change_type == "added",
+            "deleted_file": file.change_type == "deleted",
+            "renamed_file": file.change_type == "renamed",
+            "diff": "".join(parsed.hunk_text(hunk) for hunk in file.hunks),
+        }
+
+
+def read_capped_diff(lines, max_bytes=None, max_lines=None):
+    """Collects a streamed diff into one string, capped as in cap_lines."""
+    return "".join(iter_file_patches(cap_lines(lines, max_bytes, max_lines)))
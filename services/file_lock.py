@@ -0,0 +1,97 @@
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLockTimeout(Exception):
+    """Raised when a FileLock cannot be acquired within its timeout."""
+
+
+class FileLock:
+    """
+    An exclusive advisory lock on a file, shared between threads and processes.
+    Uses flock() on POSIX and msvcrt.locking() on Windows. Each acquire opens its own
+    file handle, so two threads of the same process also exclude each other. The holder may
+    delete the lock file on release; a waiter that then locks the deleted file notices and
+    locks the path's new file instead.
+    """
+
+    def __init__(self, path, timeout=None, poll_interval=0.1):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd = None
+
+    def _try_lock(self, fd):
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, blocking=True):
+        """
+        Acquires the lock. Returns False if `blocking` is False and the lock is held
+        elsewhere; raises FileLockTimeout if it is still held after `timeout` seconds.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            while not self._try_lock(fd):
+                if not blocking:
+                    os.close(fd)
+                    return False
+                if deadline is not None and time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise FileLockTimeout(f"Timed out after {self.timeout}s waiting for lock {self.path}")
+                time.sleep(self.poll_interval)
+            if self._is_current(fd):
+                self._fd = fd
+                return True
+            # The previous holder deleted the file while we waited on it; lock the new one.
+            os.close(fd)
+
+    def _is_current(self, fd):
+        """True if `fd` is still the file at self.path (it may have been deleted meanwhile)."""
+        if not fcntl:
+            return True  # Windows cannot delete a file that is open
+        try:
+            return os.path.samestat(os.fstat(fd), os.stat(self.path))
+        except FileNotFoundError:
+            return False
+
+    def release(self, remove=False):
+        """Releases the lock; with `remove`, the lock file is deleted first (e.g. its repository is gone)."""
+        if self._fd is None:
+            return
+        if remove:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        try:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
@@ -1,28 +1,79 @@
 import os
+import base64
+import contextlib
+import itertools
 import subprocess
 import shutil
 import re
+import tempfile
+import threading
 from urllib.parse import urlparse
 from config import settings
+from services.file_lock import FileLock, FileLockTimeout
+from services.diff_model import ParsedDiff
+from services.diff_stream import gitlab_diff_entries, iter_gitlab_diff_lines, read_capped_diff
+
+FULL_SHA_RE = re.compile(r'[0-9a-f]{40}|[0-9a-f]{64}')
+# 'git log' starts every commit of its default (medium) format with this line; diff content lines
+# always begin with ' ', '+', '-', '@' or a header keyword, so it can't appear inside a patch.
+COMMIT_HEADER_RE = re.compile(r'^commit ([0-9a-f]{40}|[0-9a-f]{64})$', re.MULTILINE)
+
+
+# Bare, blobless mirrors live here (relative to LOCAL_GIT_REPO_PATH), keyed by full project path.
+MIRRORS_DIR = "mirrors"
+
+def _group_commits(log_lines):
+    """Lazily groups the lines of 'git log' output by commit: yields (full_sha, lines)."""
+    current = {"sha": None}
+    def commit_of(line):
+        match = COMMIT_HEADER_RE.match(line.rstrip("\n"))
+        if match:
+            current["sha"] = match.group(1)
+        return current["sha"]
+    return itertools.groupby(log_lines, key=commit_of)
+
+
+class GitCommandError(Exception):
+    """A streamed git command exited with a non-zero status after its output was read."""
+
 
 class GitService:
     def __init__(self):
         """Initializes the Git Service."""
         self.temp_repo_dir = settings.LOCAL_GIT_REPO_PATH # From settings, e.g., 'temp_repos'
         os.makedirs(self.temp_repo_dir, exist_ok=True)
+        self._held = threading.local()  # mirror locks held by the current thread, see _repo_lock
         print(f"GitService initialized. Temporary repository directory: {self.temp_repo_dir}")
 
-    def _execute_git_command(self, command, cwd=None):
-        """Executes a git command and returns its output."""
+    def _git_env(self):
+        """
+        Environment for git subprocesses: never prompt for credentials, and authenticate to
+        GITLAB_SERVER with the private token via GIT_CONFIG_* so it never shows up in argv or logs.
+        """
+        env = dict(os.environ)
+        env["GIT_TERMINAL_PROMPT"] = "0"
+        # Same policy as the GitLab API client, which runs with ssl_verify=False for self-signed certs.
+        env["GIT_SSL_NO_VERIFY"] = "1"
+        if settings.GITLAB_SERVER and settings.GITLAB_PRIVATE_TOKEN:
+            credentials = base64.b64encode(f"oauth2:{settings.GITLAB_PRIVATE_TOKEN}".encode()).decode()
+            env["GIT_CONFIG_COUNT"] = "1"
+            env["GIT_CONFIG_KEY_0"] = f"http.{settings.GITLAB_SERVER.rstrip('/')}/.extraHeader"
+            env["GIT_CONFIG_VALUE_0"] = f"Authorization: Basic {credentials}"
+        return env
+
+    def _execute_git_command(self, command, cwd=None, input_text=None, extra_env=None):
+        """Executes a git command (optionally feeding `input_text` to its stdin) and returns its output."""
         try:
             full_command = ["git"] + command
             print(f"Executing Git command: {' '.join(full_command)}")
             result = subprocess.run(
                 full_command,
                 cwd=cwd if cwd else self.temp_repo_dir,
+                input=input_text,
                 capture_output=True,
                 text=True,
-                check=True
+                check=True,
+                env={**self._git_env(), **(extra_env or {})}
             )
             return result.stdout.strip()
         except subprocess.CalledProcessError as e:
@@ -32,6 +83,46 @@ class GitService:
             print("Git executable not found. Please ensure Git is installed and in your PATH.")
             return None
 
+    def _stream_git_command(self, command, cwd=None):
+        """
+        Runs a git command and yields its stdout line by line as it is produced, so large
+        output (e.g. 'git show' of a huge commit) is never buffered whole. Closing the
+        generator early kills the process. If the command fails after all its output was
+        read (e.g. a lazy blob fetch in a blobless mirror), GitCommandError is raised, so a
+        truncated diff is never mistaken for a complete one.
+        """
+        full_command = ["git"] + command
+        print(f"Executing Git command: {' '.join(full_command)}")
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                process = subprocess.Popen(
+                    full_command,
+                    cwd=cwd if cwd else self.temp_repo_dir,
+                    stdout=subprocess.PIPE,
+                    stderr=stderr,
+                    text=True,
+                    encoding="utf-8",
+                    errors="replace",
+                    env=self._git_env()
+                )
+            except FileNotFoundError:
+                print("Git executable not found. Please ensure Git is installed and in your PATH.")
+                return
+            finished = False
+            try:
+                yield from process.stdout
+                finished = True
+            finally:
+                if not finished and process.poll() is None:
+                    process.kill()
+                process.stdout.close()
+                returncode = process.wait()
+            if returncode != 0:
+                stderr.seek(0)
+                error = stderr.read().decode('utf-8', 'replace')
+                print(f"Git command failed: {' '.join(full_command)}\nError: {error}")
+                raise GitCommandError(f"'{' '.join(full_command)}' exited with status {returncode}: {error.strip()}")
+
     def _get_repo_name_from_url(self, repo_url):
         """Extracts the repository name from a GitLab URL."""
         path = urlparse(repo_url).path
@@ -61,98 +152,430 @@ class GitService:
             return repo_name
         return None
 
+    def _get_project_path_from_url(self, repo_url):
+        """
+        Extracts the full project path (e.g. 'group/subgroup/project') from a GitLab
+        repository, MR or commit URL.
+        """
+        match = re.search(r'https?://[^/]+/(.*?)(?:\.git)?(?:/-)?(?:/merge_requests/\d+|/commit/[a-f0-9]+|/?$)', repo_url)
+        if not match or not match.group(1):
+            return None
+        return match.group(1).strip('/')
+
+    def get_mirror_path(self, repo_url):
+        """
+        Returns the local mirror directory for a repository, keyed by its full project path
+        so that e.g. 'group-a/api' and 'group-b/api' never share a directory.
+        """
+        project_path = self._get_project_path_from_url(repo_url)
+        if not project_path or '..' in project_path.split('/'):
+            return None
+        return os.path.join(self.temp_repo_dir, MIRRORS_DIR, *project_path.split('/')) + ".git"
+
     def clone_repository(self, repo_url, force_clone=False):
         """
-        Clones a repository into a temporary directory.
-        If the directory already exists, it will pull the latest changes
-        unless force_clone is True, in which case it will re-clone.
+        Makes sure a bare, blobless (--filter=blob:none) partial clone of the repository
+        exists in the mirror store and returns its path. No working tree is ever checked
+        out, and an existing mirror is reused as is: get_commit_diff fetches exactly the
+        commit it needs. With force_clone=True an existing mirror is discarded first.
         """
-        repo_name = self._get_repo_name_from_url(repo_url)
-        if not repo_name:
+        repo_path = self.get_mirror_path(repo_url)
+        if not repo_path:
             print(f"Could not determine repository name from URL: {repo_url}")
             return None
+        repo_name = self._get_project_path_from_url(repo_url)
 
-        repo_path = os.path.join(self.temp_repo_dir, repo_name)
+        try:
+            with self._repo_lock(repo_path):
+                repo_path, cloned = self._clone_locked(repo_url, repo_path, repo_name, force_clone)
+                # Only a new clone grows the store; reusing a mirror needs no walk over the store.
+                if cloned:
+                    self.enforce_disk_budget(keep=repo_path)
+        except FileLockTimeout as e:
+            print(f"Could not lock mirror for {repo_name}: {e}")
+            return None
+        return repo_path
+
+    @contextlib.contextmanager
+    def mirror_lock(self, repo_url):
+        """
+        Holds the lock of the mirror for `repo_url` across several calls, e.g. clone_repository
+        and the get_commit_diff that reads from it, so enforce_disk_budget in another worker or
+        run cannot evict the mirror in between. Yields False if the lock could not be taken.
+        """
+        repo_path = self.get_mirror_path(repo_url)
+        with contextlib.ExitStack() as stack:
+            if repo_path:
+                try:
+                    stack.enter_context(self._repo_lock(repo_path))
+                except FileLockTimeout as e:
+                    print(f"Could not lock mirror {repo_path}: {e}")
+                    yield False
+                    return
+            yield True
 
+    def _clone_locked(self, repo_url, repo_path, repo_name, force_clone):
+        """
+        Creates (or reuses) the mirror at `repo_path`; the caller holds its lock.
+        Returns (repo_path or None, whether a new clone was made).
+        """
         if os.path.exists(repo_path):
             if force_clone:
-                print(f"Force cloning: Removing existing repository at {repo_path}")
+                print(f"Force cloning: Removing existing mirror at {repo_path}")
                 shutil.rmtree(repo_path)
             else:
-                print(f"Repository already exists at {repo_path}. Fetching latest changes.")
-                if self._execute_git_command(["pull"], cwd=repo_path):
-                    print(f"Successfully pulled latest changes for {repo_name}.")
-                    return repo_path
-                else:
-                    print(f"Failed to pull latest changes for {repo_name}.")
-                    return None
+                print(f"Mirror for {repo_name} already exists at {repo_path}.")
+                self._touch(repo_path)
+                return repo_path, False
         
         print(f"Cloning {repo_url} into {repo_path}...")
-        # Use a generic clone URL if the input is a commit/MR URL
-        # Assuming the base URL for cloning can be derived
-        # For simplicity, for now, we assume repo_url is clonable directly or we need a specific pattern
-        
-        # A more robust approach might extract the base project URL
-        # For GitLab, it often looks like https://gitlab.customs.go.id/group/project.git
-        # If the input URL is https://gitlab.customs.go.id/rest-api/smart-pcc-perencanaan/commit/...,
-        # we need to construct the clonable URL.
-        
-        # Attempt to construct a clonable URL
+        # Construct a clonable URL from the project path of the commit/MR/repository URL,
+        # e.g. https://gitlab.customs.go.id/rest-api/smart-pcc-perencanaan/-/commit/... ->
+        # https://gitlab.customs.go.id/rest-api/smart-pcc-perencanaan.git
         parsed_url = urlparse(repo_url)
-        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-        
-        # Regex to find the project path from the URL
-        project_path_match = re.search(r'https?://[^/]+/(.*?)(?:\.git)?(?:/-\/merge_requests|\/commit\/|$)', repo_url)
-        if project_path_match:
-            project_path = project_path_match.group(1)
-            clone_url = f"{base_url}/{project_path}.git"
-        else:
-            print(f"Warning: Could not reliably extract clone URL from {repo_url}. Attempting to clone original URL.")
-            # Ensure we don't double-add .git if it's already present
-            clone_url = repo_url if repo_url.endswith('.git') else f"{repo_url}.git"
+        clone_url = f"{parsed_url.scheme}://{parsed_url.netloc}/{repo_name}.git"
 
-        if self._execute_git_command(["clone", clone_url, repo_path], cwd=self.temp_repo_dir):
+        os.makedirs(os.path.dirname(repo_path), exist_ok=True)
+        if self._execute_git_command(["clone", "--bare", "--filter=blob:none", clone_url, repo_path],
+                                     cwd=self.temp_repo_dir) is not None:
+            # Bare clones have no fetch refspec; add one so a plain 'git fetch origin'
+            # (the fallback for abbreviated SHAs) still brings in new branch heads.
+            self._execute_git_command(["config", "remote.origin.fetch", "+refs/heads/*:refs/heads/*"], cwd=repo_path)
             print(f"Successfully cloned {repo_name}.")
-            return repo_path
+            return repo_path, True
         else:
             print(f"Failed to clone {repo_name}.")
-            return None
+            if os.path.exists(repo_path):
+                shutil.rmtree(repo_path, ignore_errors=True)
+            return None, False
+
+    def _fetch_commit(self, repo_path, commit_sha):
+        """
+        Fetches a single commit from origin. Full SHAs are fetched directly, so only that
+        commit (and, in a partial clone, none of its blobs) is transferred; abbreviated
+        SHAs cannot be requested from the server, so those fall back to fetching branches.
+        """
+        return self._fetch_commits(repo_path, [commit_sha])
+
+    def _fetch_commits(self, repo_path, commit_shas):
+        """Fetches several commits from origin in one 'git fetch' (see _fetch_commit)."""
+        if all(FULL_SHA_RE.fullmatch(sha) for sha in commit_shas):
+            if self._execute_git_command(["fetch", "--no-tags", "origin", *commit_shas], cwd=repo_path) is not None:
+                return True
+        return self._execute_git_command(["fetch", "--no-tags", "origin"], cwd=repo_path) is not None
+
+    def _resolve_commits(self, repo_path, commit_shas):
+        """
+        Checks which of `commit_shas` exist locally with a single 'git cat-file --batch-check'.
+        Returns {requested_sha: full_sha} for the ones that are commits.
+        """
+        # GIT_NO_LAZY_FETCH stops a partial clone from fetching each missing commit on its own
+        # here; missing commits are then fetched together by _fetch_commits.
+        output = self._execute_git_command(["cat-file", "--batch-check"], cwd=repo_path,
+                                           input_text="".join(f"{sha}\n" for sha in commit_shas),
+                                           extra_env={"GIT_NO_LAZY_FETCH": "1"})
+        if output is None:
+            return {}
+        resolved = {}
+        # One output line per input line, in order: '<full_sha> <type> <size>' or '<input> missing'.
+        for sha, line in zip(commit_shas, output.splitlines()):
+            fields = line.split()
+            if len(fields) == 3 and fields[1] == "commit":
+                resolved[sha] = fields[0]
+        return resolved
 
     def get_commit_diff(self, repo_path, commit_sha, fetch_remote=True):
         """
-        Fetches the diff for a specific commit in a locally cloned repository.
-        Returns the diff as a string.
-        If fetch_remote is True, it will first attempt to fetch from the remote 'origin'.
+        Fetches the diff for a specific commit in a locally cloned repository (a bare
+        mirror or a regular clone). Returns the diff as a string.
+        If the commit is not available locally and fetch_remote is True, only that commit
+        is fetched from the remote 'origin'.
         """
         if not os.path.exists(repo_path):
             print(f"Repository path does not exist: {repo_path}")
             return None
 
-        if fetch_remote:
-            # Attempt to fetch from origin, but don't fail the entire process if it doesn't work.
-            # This handles cases where the remote might be unreachable (e.g. strict firewall, no remote configured).
-            fetch_result = self._execute_git_command(["fetch", "origin"], cwd=repo_path)
-            if not fetch_result:
-                print(f"Warning: Failed to fetch from origin for {repo_path}. Proceeding with local commit check.")
-        
+        try:
+            with self._repo_lock(repo_path):
+                self._touch(repo_path)
+                return self._get_commit_diff_locked(repo_path, commit_sha, fetch_remote)
+        except FileLockTimeout as e:
+            print(f"Could not lock repository {repo_path}: {e}")
+            return None
+
+    def _get_commit_diff_locked(self, repo_path, commit_sha, fetch_remote):
         # Check if the commit exists locally
         commit_exists = self._execute_git_command(["cat-file", "-t", commit_sha], cwd=repo_path)
+        if commit_exists != "commit" and fetch_remote:
+            # Attempt to fetch from origin, but don't fail the entire process if it doesn't work.
+            # This handles cases where the remote might be unreachable (e.g. strict firewall, no remote configured).
+            if not self._fetch_commit(repo_path, commit_sha):
+                print(f"Warning: Failed to fetch {commit_sha} from origin for {repo_path}. Proceeding with local commit check.")
+            commit_exists = self._execute_git_command(["cat-file", "-t", commit_sha], cwd=repo_path)
+
         if commit_exists != "commit":
             print(f"Commit {commit_sha} not found in local repository {repo_path}.")
             return None
 
-        # Get the diff for the commit
+        # Get the diff for the commit, streamed and capped at DIFF_MAX_BYTES / DIFF_MAX_LINES
         # git show <commit_sha> --patch
-        diff_output = self._execute_git_command(["show", commit_sha, "--patch"], cwd=repo_path)
-        if diff_output:
+        try:
+            diff_output = read_capped_diff(self._stream_git_command(["show", commit_sha, "--patch"], cwd=repo_path))
+        except GitCommandError:
+            print(f"Failed to get local diff for commit {commit_sha}.")
+            return None
+        if diff_output.strip():
             print(f"Successfully fetched local diff for commit {commit_sha}.")
             return diff_output
         else:
             print(f"Failed to get local diff for commit {commit_sha}.")
             return None
 
+    def get_commit_diffs(self, repo_path, commit_shas, fetch_remote=True):
+        """
+        Batch version of get_commit_diff for many commits of one repository. Uses one
+        'cat-file --batch-check' existence pass, at most one 'git fetch' for all missing
+        commits, and one 'git log --no-walk --patch' for every diff. Returns
+        {commit_sha: diff}; commits that can't be found are left out.
+        """
+        commit_shas = list(dict.fromkeys(commit_shas))
+        if not commit_shas:
+            return {}
+        if not os.path.exists(repo_path):
+            print(f"Repository path does not exist: {repo_path}")
+            return {}
+
+        try:
+            with self._repo_lock(repo_path):
+                self._touch(repo_path)
+                return self._get_commit_diffs_locked(repo_path, commit_shas, fetch_remote)
+        except FileLockTimeout as e:
+            print(f"Could not lock repository {repo_path}: {e}")
+            return {}
+
+    def _get_commit_diffs_locked(self, repo_path, commit_shas, fetch_remote):
+        resolved = self._resolve_commits(repo_path, commit_shas)
+        missing = [sha for sha in commit_shas if sha not in resolved]
+        if missing and fetch_remote:
+            if not self._fetch_commits(repo_path, missing):
+                print(f"Warning: Failed to fetch {len(missing)} commits from origin for {repo_path}. Proceeding with local commits.")
+            resolved.update(self._resolve_commits(repo_path, missing))
+
+        for sha in commit_shas:
+            if sha not in resolved:
+                print(f"Commit {sha} not found in local repository {repo_path}.")
+        if not resolved:
+            return {}
+
+        # '--cc' gives merge commits the same combined diff 'git show' prints for them.
+        full_shas = list(dict.fromkeys(resolved.values()))
+        lines = self._stream_git_command(["log", "--no-walk=unsorted", "--cc", "--no-decorate",
+                                          "--pretty=medium", *full_shas], cwd=repo_path)
+        # Each commit's lines are capped on their own; lines past a commit's cap are skipped
+        # (not buffered) on the way to the next commit header.
+        diffs_by_full_sha = {}
+        try:
+            for full_sha, commit_lines in _group_commits(lines):
+                if full_sha:
+                    diffs_by_full_sha[full_sha] = read_capped_diff(commit_lines).rstrip("\n")
+        except GitCommandError:
+            # Any of the diffs may be cut short; the commits take the single-commit path instead.
+            print(f"Failed to get local diffs for {len(full_shas)} commits.")
+            return {}
+        if not diffs_by_full_sha:
+            print(f"Failed to get local diffs for {len(full_shas)} commits.")
+            return {}
+
+        diffs = {sha: diffs_by_full_sha[full_sha] for sha, full_sha in resolved.items() if full_sha in diffs_by_full_sha}
+        print(f"Successfully fetched local diffs for {len(diffs)} of {len(commit_shas)} commits.")
+        return diffs
+
+    def get_merge_request_diff(self, repo_path, mr_iid, base_sha=None):
+        """
+        Computes a merge request's diff locally: fetches refs/merge-requests/<iid>/head into
+        the mirror and diffs it against the merge base (`base_sha` from the MR's diff_refs, or
+        the merge base with the default branch). The output is rendered in the same format as
+        GitLabService.get_merge_request_diff. Returns None if anything is missing.
+        """
+        if not os.path.exists(repo_path):
+            print(f"Repository path does not exist: {repo_path}")
+            return None
+
+        try:
+            with self._repo_lock(repo_path):
+                self._touch(repo_path)
+                return self._get_merge_request_diff_locked(repo_path, mr_iid, base_sha)
+        except FileLockTimeout as e:
+            print(f"Could not lock repository {repo_path}: {e}")
+            return None
+
+    def _get_merge_request_diff_locked(self, repo_path, mr_iid, base_sha):
+        mr_ref = f"refs/merge-requests/{mr_iid}/head"
+        # The MR head moves with every push, so its ref is always re-fetched (commits only in a
+        # blobless mirror). The base is fetched with it when it isn't local yet.
+        refspecs = [f"+{mr_ref}:{mr_ref}"]
+        if base_sha:
+            if base_sha not in self._resolve_commits(repo_path, [base_sha]):
+                refspecs.append(base_sha)
+        else:
+            refspecs.append("+refs/heads/*:refs/heads/*")
+        if self._execute_git_command(["fetch", "--no-tags", "origin", *refspecs], cwd=repo_path) is None:
+            print(f"Failed to fetch {mr_ref} into {repo_path}.")
+            return None
+
+        if not base_sha:
+            base_sha = self._execute_git_command(["merge-base", "HEAD", mr_ref], cwd=repo_path)
+            if not base_sha:
+                print(f"Could not determine the merge base of !{mr_iid} in {repo_path}.")
+                return None
+        return self._local_diff(repo_path, base_sha, mr_ref)
+
+    def get_range_diff(self, repo_path, from_sha, to_sha):
+        """
+        Returns 'git diff from_sha..to_sha' from a local repository, fetching whichever of the
+        two commits is missing, in the same format as GitLabService.get_compare_diff.
+        """
+        if not os.path.exists(repo_path):
+            print(f"Repository path does not exist: {repo_path}")
+            return None
+
+        try:
+            with self._repo_lock(repo_path):
+                self._touch(repo_path)
+                missing = [sha for sha in (from_sha, to_sha) if sha not in self._resolve_commits(repo_path, [from_sha, to_sha])]
+                if missing and not self._fetch_commits(repo_path, missing):
+                    print(f"Failed to fetch {', '.join(missing)} into {repo_path}.")
+                    return None
+                return self._local_diff(repo_path, from_sha, to_sha)
+        except FileLockTimeout as e:
+            print(f"Could not lock repository {repo_path}: {e}")
+            return None
+
+    def _local_diff(self, repo_path, base, head):
+        """'git diff base head', streamed, capped and rendered like a GitLab API diff."""
+        try:
+            diff = read_capped_diff(self._stream_git_command(
+                ["diff", "--no-color", "--no-ext-diff", "-M", base, head], cwd=repo_path))
+        except GitCommandError:
+            diff = None
+        if not diff:
+            print(f"Failed to get local diff for {base[:8]}..{head}.")
+            return None
+        print(f"Successfully computed local diff for {base[:8]}..{head}.")
+        return read_capped_diff(iter_gitlab_diff_lines(gitlab_diff_entries(ParsedDiff.parse(diff))))
+
+    # --- Mirror store housekeeping: locks, LRU disk budget and maintenance ---
+
+    def _mirrors_root(self):
+        return os.path.join(self.temp_repo_dir, MIRRORS_DIR)
+
+    def _is_mirror(self, repo_path):
+        root = os.path.abspath(self._mirrors_root()) + os.sep
+        return os.path.abspath(repo_path).startswith(root)
+
+    @contextlib.contextmanager
+    def _repo_lock(self, repo_path):
+        """
+        Per-repository lock shared by threads, concurrent workers and cron runs.
+        Repositories outside the mirror store (e.g. --local-repo-path) are not locked,
+        so no lock file is ever written next to a user's own checkout. The lock is
+        re-entrant within a thread, so mirror_lock can hold it around other calls.
+        """
+        key = os.path.abspath(repo_path)
+        held = getattr(self._held, "paths", None)
+        if held is None:
+            held = self._held.paths = set()
+        if not self._is_mirror(repo_path) or key in held:
+            yield
+            return
+        with FileLock(repo_path + ".lock", timeout=settings.GIT_LOCK_TIMEOUT):
+            held.add(key)
+            try:
+                yield
+            finally:
+                held.discard(key)
+
+    def _touch(self, repo_path):
+        """Records a use of the mirror; its mtime is the LRU timestamp."""
+        if self._is_mirror(repo_path):
+            try:
+                os.utime(repo_path, None)
+            except OSError:
+                pass
+
+    def _directory_size(self, path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def list_mirrors(self):
+        """Returns [(path, size_in_bytes, last_used_timestamp)] for every mirror, least recently used first."""
+        mirrors = []
+        for root, dirs, _ in os.walk(self._mirrors_root()):
+            for name in list(dirs):
+                if name.endswith(".git"):
+                    path = os.path.join(root, name)
+                    dirs.remove(name) # Don't descend into the repository itself
+                    mirrors.append((path, self._directory_size(path), os.path.getmtime(path)))
+        return sorted(mirrors, key=lambda mirror: mirror[2])
+
+    def enforce_disk_budget(self, max_bytes=None, keep=None):
+        """
+        Evicts least recently used mirrors until the store fits LOCAL_GIT_REPO_MAX_MB.
+        Mirrors that are locked by another worker or run (or equal to `keep`) are skipped.
+        """
+        if max_bytes is None:
+            max_bytes = settings.LOCAL_GIT_REPO_MAX_MB * 1024 * 1024
+        mirrors = self.list_mirrors()
+        total = sum(size for _, size, _ in mirrors)
+        if total <= max_bytes:
+            return
+        print(f"Mirror store uses {total / 1024 / 1024:.1f} MB, over the {max_bytes / 1024 / 1024:.1f} MB budget. Evicting...")
+        for path, size, _ in mirrors:
+            if total <= max_bytes:
+                break
+            if keep and os.path.abspath(path) == os.path.abspath(keep):
+                continue
+            lock = FileLock(path + ".lock")
+            if not lock.acquire(blocking=False):
+                print(f"   Skipping {path}: in use.")
+                continue
+            evicted = False
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+                evicted = not os.path.exists(path)
+                total -= size
+                print(f"   Evicted {path} ({size / 1024 / 1024:.1f} MB).")
+            finally:
+                # The lock file goes with its mirror, so evictions don't leave .lock files behind.
+                lock.release(remove=evicted)
+
+    def run_maintenance(self):
+        """
+        Idle-time housekeeping: runs 'git maintenance run --auto' (or 'git gc --auto' on
+        older git) in every mirror not currently in use, then enforces the disk budget.
+        """
+        for path, _, _ in self.list_mirrors():
+            lock = FileLock(path + ".lock")
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                if self._execute_git_command(["maintenance", "run", "--auto"], cwd=path) is None:
+                    self._execute_git_command(["gc", "--auto"], cwd=path)
+            finally:
+                lock.release()
+        self.enforce_disk_budget()
+
     def cleanup_temp_repos(self):
-        """Removes all temporary repositories."""
+        """
+        Removes all temporary repositories, including every mirror.
+        Prefer enforce_disk_budget(), which keeps recently used mirrors and skips locked ones.
+        """
         if os.path.exists(self.temp_repo_dir):
             print(f"Cleaning up temporary repositories in {self.temp_repo_dir}...")
             shutil.rmtree(self.temp_repo_dir)
@@ -1,27 +1,78 @@
+import functools
 import gitlab
 import re
+import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import time # Tambahkan import time
 from config import settings
+from services.cache_store import get_cache_store, make_cache_key
+from services.http_transport import requests_session, requests_timeout
+from services.diff_stream import iter_gitlab_diff_lines, read_capped_diff
+
+# Length of a full (SHA-1) commit ID; anything shorter is an abbreviated SHA.
+FULL_SHA_LENGTH = 40
+
+# Process-wide project path -> numeric project ID map, shared by every GitLabService.
+_project_ids = {}
+_project_ids_lock = threading.Lock()
+
+def merge_request_refs(mr):
+    """The diff_refs of a fetched MR ({'base_sha', 'head_sha', 'start_sha'}), or None."""
+    return getattr(mr, 'diff_refs', None) or None
 
 class GitLabService:
     def __init__(self):
-        """Initializes the GitLab Service and connects to the server."""
+        """
+        Initializes the GitLab Service. The connection (and its auth() round trip) is
+        opened on first use, so runs that never talk to GitLab need no network.
+        """
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.server = (settings.GITLAB_SERVER or "").rstrip("/")
+        self.diff_cache = None
+        if settings.DIFF_CACHE_ENABLED:
+            self.diff_cache = get_cache_store(
+                settings.DIFF_CACHE_PATH,
+                max_bytes=settings.DIFF_CACHE_MAX_MB * 1024 * 1024,
+            )
+
+    @property
+    def client(self):
+        """The python-gitlab client, connecting to the GitLab server on first access."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._connect()
+        return self._client
+
+    def _connect(self):
+        """Connects and authenticates to the GitLab server."""
         try:
-            self.client = gitlab.Gitlab(
+            client = gitlab.Gitlab(
                 settings.GITLAB_SERVER,
                 private_token=settings.GITLAB_PRIVATE_TOKEN,
-                ssl_verify=False
+                ssl_verify=False,
+                timeout=requests_timeout(),
+                session=requests_session(),
+                retry_transient_errors=False,
             )
-            self.client.auth()
+            # The session's ThrottledAdapter already waits out 429s and retries transient errors;
+            # python-gitlab would otherwise retry each 429 up to 10 more times on top of that.
+            # Its rate-limit handling is a per-request option, so it is defaulted off here.
+            client.http_request = functools.partial(client.http_request, obey_rate_limit=False, max_retries=0)
+            client.auth()
             print("Successfully connected to GitLab (SSL verification disabled).")
+            return client
         except gitlab.exceptions.GitlabAuthenticationError:
             print("GitLab authentication failed. Please check your token.")
             raise
 
-    def get_merge_request_diff(self, mr_url):
+    def get_merge_request_diff(self, mr_url, mr=None):
         """
         Fetches the code diff from a GitLab Merge Request URL.
-        Returns a string containing the diff.
+        Returns a string containing the diff. `mr`, if the caller already fetched it
+        (see get_merge_request), saves looking the MR up again.
         """
         project_path = self._parse_project_path_from_mr_url(mr_url)
         mr_iid = self._parse_mr_iid_from_url(mr_url)
@@ -31,26 +82,116 @@ class GitLabService:
             return None
 
         try:
-            project = self.client.projects.get(project_path)
-            mr = project.mergerequests.get(mr_iid)
-            
+            if mr is None:
+                mr = self._with_project(project_path, lambda project: project.mergerequests.get(mr_iid))
+                self._remember_project_id(project_path, getattr(mr, 'project_id', None))
+
+            # An MR diff is fully determined by its base and head commits, so it can be
+            # served from the diff cache until new commits are pushed.
+            diff_refs = getattr(mr, 'diff_refs', None) or {}
+            mr_cache_key = None
+            if diff_refs.get('base_sha') and diff_refs.get('head_sha'):
+                mr_cache_key = self._diff_cache_key("mr", project_path, diff_refs['base_sha'], diff_refs['head_sha'])
+                cached_diff = self._get_cached(mr_cache_key)
+                if cached_diff is not None:
+                    print(f"Using cached diff for MR !{mr_iid} (head {diff_refs['head_sha'][:8]}) in project {project_path}")
+                    return cached_diff
+
             start_time = time.time()
-            changes = mr.changes()['changes']
+            diff_text = read_capped_diff(iter_gitlab_diff_lines(self._merge_request_diff_entries(mr)))
             end_time = time.time()
-            print(f"Time taken to fetch MR changes from GitLab API: {end_time - start_time:.2f} seconds")
-
-            diff_text = ""
-            for change in changes:
-                diff_text += f"--- a/{change['old_path']}\n"
-                diff_text += f"+++ b/{change['new_path']}\n"
-                diff_text += f"{change['diff']}\n"
-            
-            print(f"Successfully fetched diff for MR !{mr_iid} in project {project.path_with_namespace}")
+            print(f"Time taken to fetch MR diffs from GitLab API: {end_time - start_time:.2f} seconds")
+
+            print(f"Successfully fetched diff for MR !{mr_iid} in project {project_path}")
+            if mr_cache_key:
+                self._set_cached(mr_cache_key, diff_text)
             return diff_text
-        except gitlab.exceptions.GitlabGetError as e:
+        except (gitlab.exceptions.GitlabError, requests.RequestException) as e:
             print(f"Error finding project or MR. Project: '{project_path}', MR: '!{mr_iid}'. Details: {e}")
             return None
 
+    def get_merge_request(self, mr_url):
+        """
+        Returns the MR of `mr_url` (one API call), or None if it can't be fetched. It can be
+        passed on to get_merge_request_diff so that the MR is not looked up twice.
+        """
+        project_path = self._parse_project_path_from_mr_url(mr_url)
+        mr_iid = self._parse_mr_iid_from_url(mr_url)
+        if not project_path or not mr_iid:
+            return None
+        try:
+            mr = self._with_project(project_path, lambda project: project.mergerequests.get(mr_iid))
+        except (gitlab.exceptions.GitlabError, requests.RequestException) as e:
+            print(f"Error finding project or MR. Project: '{project_path}', MR: '!{mr_iid}'. Details: {e}")
+            return None
+        self._remember_project_id(project_path, getattr(mr, 'project_id', None))
+        return mr
+
+    def get_merge_request_refs(self, mr_url):
+        """Returns the MR's diff_refs ({'base_sha', 'head_sha', 'start_sha'}), or None."""
+        return merge_request_refs(self.get_merge_request(mr_url))
+
+    def get_compare_diff(self, url, from_sha, to_sha):
+        """
+        Returns the straight diff between two commits of the project of `url` (an MR or commit
+        URL), i.e. 'git diff from_sha..to_sha', via the repository compare API. Used to review
+        only what was pushed to an MR since its last review. Cached like commit diffs.
+        """
+        project_path = self._parse_project_path_from_mr_url(url) or self._parse_project_path_from_commit_url(url)
+        if not project_path:
+            print(f"Could not parse project path from URL: {url}")
+            return None
+
+        cache_key = self._diff_cache_key("compare", project_path, from_sha, to_sha)
+        cached_diff = self._get_cached(cache_key)
+        if cached_diff is not None:
+            print(f"Using cached diff for {from_sha[:8]}..{to_sha[:8]} in project {project_path}")
+            return cached_diff
+
+        try:
+            comparison = self._with_project(project_path, lambda project: self.client.http_get(
+                f"/projects/{project.encoded_id}/repository/compare",
+                query_data={"from": from_sha, "to": to_sha, "straight": "true"}))
+        except (gitlab.exceptions.GitlabGetError, gitlab.exceptions.GitlabHttpError) as e:
+            print(f"Error comparing {from_sha[:8]}..{to_sha[:8]} in project '{project_path}'. Details: {e}")
+            return None
+        diff_text = read_capped_diff(iter_gitlab_diff_lines(comparison.get('diffs') or []))
+        self._set_cached(cache_key, diff_text)
+        return diff_text
+
+    def _merge_request_diff_entries(self, mr):
+        """
+        Yields the MR's file diffs from the paginated /merge_requests/:iid/diffs endpoint.
+        The first page reports the page count; the remaining pages are requested concurrently
+        (MR_DIFF_PAGE_CONCURRENCY) and yielded in order. Unlike mr.changes() this is never
+        truncated for large MRs. GitLab versions without the endpoint fall back to changes().
+        """
+        path = f"/projects/{mr.project_id}/merge_requests/{mr.iid}/diffs"
+        def get_page(page):
+            return self.client.http_get(path, query_data={"page": page, "per_page": settings.MR_DIFF_PAGE_SIZE},
+                                        raw=True)
+        try:
+            first_page = get_page(1)
+        except gitlab.exceptions.GitlabError as e:
+            print(f"Paginated MR diffs are not available ({e}). Falling back to MR changes.")
+            yield from mr.changes()['changes']
+            return
+        yield from first_page.json()
+
+        total_pages = int(first_page.headers.get("X-Total-Pages") or 0)
+        if total_pages > 1:
+            workers = max(1, min(settings.MR_DIFF_PAGE_CONCURRENCY, total_pages - 1))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mr-diffs") as executor:
+                for page in executor.map(get_page, range(2, total_pages + 1)):
+                    yield from page.json()
+            return
+        # Very large collections may omit X-Total-Pages; follow X-Next-Page instead.
+        next_page = first_page.headers.get("X-Next-Page")
+        while next_page:
+            page = get_page(int(next_page))
+            yield from page.json()
+            next_page = page.headers.get("X-Next-Page")
+
     def get_commit_diff(self, commit_url):
         """
         Fetches the code diff from a GitLab Commit URL.
@@ -63,27 +204,97 @@ class GitLabService:
             print(f"Could not parse project path or commit SHA from URL: {commit_url}")
             return None
 
+        # Commit diffs never change, so a cached diff for the full SHA needs no network at all.
+        full_sha = commit_sha if len(commit_sha) >= FULL_SHA_LENGTH else self._get_cached(
+            self._diff_cache_key("sha", project_path, commit_sha))
+        if full_sha:
+            cached_diff = self._get_cached(self._diff_cache_key("commit", project_path, full_sha))
+            if cached_diff is not None:
+                print(f"Using cached diff for commit {full_sha[:8]} in project {project_path}")
+                return cached_diff
+
         try:
-            project = self.client.projects.get(project_path)
-            commit = project.commits.get(commit_sha)
-            
             start_time = time.time()
-            # Pass all=True to ensure we get all changes, not just the first page
-            diffs = commit.diff(all=True)
-            end_time = time.time()
-            print(f"Time taken to fetch commit diff from GitLab API: {end_time - start_time:.2f} seconds. Files changed: {len(diffs)}")
+            if full_sha:
+                # With the full SHA known, a lazy commit handle lets us go straight to the diff.
+                commit_id = full_sha
+                # iterator=True walks all pages lazily, one page in memory at a time
+                diffs = self._with_project(
+                    project_path, lambda project: project.commits.get(full_sha, lazy=True).diff(iterator=True))
+            else:
+                commit = self._with_project(project_path, lambda project: project.commits.get(commit_sha))
+                commit_id = commit.id
+                # Remember the short SHA from the ticket comment -> full SHA mapping.
+                self._set_cached(self._diff_cache_key("sha", project_path, commit_sha), commit_id)
+                diffs = commit.diff(iterator=True)
 
-            diff_text = ""
-            for diff in diffs:
-                diff_text += f"--- a/{diff['old_path']}\n"
-                diff_text += f"+++ b/{diff['new_path']}\n"
-                diff_text += f"{diff['diff']}\n"
+            # Pages are consumed as the diff is assembled; once DIFF_MAX_BYTES / DIFF_MAX_LINES
+            # is reached no further pages are requested.
+            diff_text = read_capped_diff(iter_gitlab_diff_lines(diffs))
+            end_time = time.time()
+            print(f"Time taken to fetch commit diff from GitLab API: {end_time - start_time:.2f} seconds")
 
-            print(f"Successfully fetched diff for commit {commit.short_id} in project {project.path_with_namespace}")
+            print(f"Successfully fetched diff for commit {commit_id[:8]} in project {project_path}")
+            self._set_cached(self._diff_cache_key("commit", project_path, commit_id), diff_text)
             return diff_text
-        except gitlab.exceptions.GitlabGetError as e:
-            print(f"Error finding project or commit. Project: '{project_path}', Commit: '{commit_sha}'. Details: {e}")
+        except (gitlab.exceptions.GitlabError, requests.RequestException) as e:
+            # Pages are fetched while the diff is assembled, so a failure can come mid-iteration;
+            # a partial diff is never returned or cached.
+            print(f"Error fetching diff for commit. Project: '{project_path}', Commit: '{commit_sha}'. Details: {e}")
+            return None
+
+    def _project_id(self, project_path):
+        """Returns the known numeric ID for `project_path`, from memory or the persistent cache."""
+        with _project_ids_lock:
+            project_id = _project_ids.get((self.server, project_path))
+        if project_id is None and settings.GITLAB_PROJECT_ID_CACHE_PERSIST:
+            cached = self._get_cached(self._diff_cache_key("project-id", project_path))
+            if cached is not None:
+                project_id = int(cached)
+                with _project_ids_lock:
+                    _project_ids[(self.server, project_path)] = project_id
+        return project_id
+
+    def _remember_project_id(self, project_path, project_id):
+        if project_id is None:
+            return
+        with _project_ids_lock:
+            known = _project_ids.get((self.server, project_path))
+            _project_ids[(self.server, project_path)] = project_id
+        if known != project_id and settings.GITLAB_PROJECT_ID_CACHE_PERSIST:
+            self._set_cached(self._diff_cache_key("project-id", project_path), str(project_id))
+
+    def _forget_project_id(self, project_path):
+        with _project_ids_lock:
+            _project_ids.pop((self.server, project_path), None)
+
+    def _with_project(self, project_path, action):
+        """
+        Runs `action(project)` with a lazy project handle, which costs no API call: the
+        project is addressed by its cached numeric ID, or by its URL-encoded path.
+        A stale cached ID (e.g. project moved) is dropped and the call retried by path.
+        """
+        project_id = self._project_id(project_path)
+        try:
+            return action(self.client.projects.get(project_id or project_path, lazy=True))
+        except gitlab.exceptions.GitlabGetError:
+            if project_id is None:
+                raise
+            self._forget_project_id(project_path)
+            return action(self.client.projects.get(project_path, lazy=True))
+
+    def _diff_cache_key(self, kind, project_path, *shas):
+        """Cache key for an immutable diff (or SHA mapping) on this GitLab server."""
+        return make_cache_key(kind, self.server, project_path, *shas)
+
+    def _get_cached(self, key):
+        if not self.diff_cache:
             return None
+        return self.diff_cache.get(key)
+
+    def _set_cached(self, key, value):
+        if self.diff_cache:
+            self.diff_cache.set(key, value)
 
     def _parse_project_path_from_mr_url(self, url):
         """Parses the project path from a GitLab Merge Request URL."""
@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+# Token of the hedged leg running in the current thread (sync legs) or task (async legs).
+_current_token = contextvars.ContextVar("hedge_leg_token", default=None)
+
+
+class LegCancelled(Exception):
+    """Raised inside a hedged leg that lost the race, before it sends (another) request."""
+
+
+class CancelToken:
+    """
+    Cancellation handle of one hedged leg. Provider calls running on the leg's thread register
+    how to abort themselves (e.g. closing their response stream) through register_cancel.
+    `sent` tells whether the leg got as far as sending a request, i.e. whether it is billed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._event = threading.Event()
+        self.cancelled = False
+        self.sent = False
+
+    def on_cancel(self, callback):
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Failed to cancel hedged request: {e}")
+
+
+def register_cancel(callback):
+    """Registers how to abort the current call if it runs as a hedged leg that lost the race."""
+    token = _current_token.get()
+    if token is not None:
+        token.on_cancel(callback)
+
+
+def check_cancelled():
+    """Raises LegCancelled if the current call runs as a hedged leg that already lost."""
+    token = _current_token.get()
+    if token is not None and token.cancelled:
+        raise LegCancelled("hedged request no longer needed")
+
+
+def begin_send():
+    """Called right before a request goes out: stops a lost leg, otherwise marks the leg as sent."""
+    token = _current_token.get()
+    if token is not None:
+        check_cancelled()
+        token.sent = True
+
+
+def cancellable_sleep(seconds):
+    """time.sleep that a hedged leg's cancellation cuts short (raising LegCancelled)."""
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+    elif token._event.wait(seconds):
+        check_cancelled()
+
+
+class LatencyTracker:
+    """Latencies of the most recent calls, for percentile-based hedge deadlines."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent, min_samples=1):
+        """The `percent`th percentile of the recent latencies, or None with fewer than `min_samples`."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, max(0, round(percent / 100 * len(samples)) - 1))
+        return samples[index]
+
+
+def _run_leg(call, token):
+    reset = _current_token.set(token)
+    try:
+        return call()
+    finally:
+        _current_token.reset(reset)
+
+
+async def _run_leg_async(call, token):
+    # Each task runs in a copy of the context, so this only applies to the leg's own task.
+    _current_token.set(token)
+    return await call()
+
+
+def _report_lost(on_lost, leg, token, future):
+    """Passes a finished leg whose outcome was not used to `on_lost`, if it sent a request."""
+    if not token.sent:
+        return
+    if future.cancelled():
+        on_lost(leg, None, LegCancelled("hedged request cancelled"))
+    elif future.exception() is not None:
+        on_lost(leg, None, future.exception())
+    else:
+        on_lost(leg, future.result(), None)
+
+
+def _settle(started, used, tokens, on_lost):
+    """Cancels the legs whose outcome is not `used` and reports them to `on_lost` once finished."""
+    for leg, future in started.items():
+        if leg == used:
+            continue
+        future.cancel()
+        tokens[leg].cancel()
+        if on_lost:
+            future.add_done_callback(lambda f, leg=leg: _report_lost(on_lost, leg, tokens[leg], f))
+
+
+def hedged_call(primary, secondary, delay, is_valid, executor, on_lost=None):
+    """
+    Runs `primary()` on `executor`. If it has not produced a valid result after `delay` seconds
+    (or failed before that), `secondary()` is started too, and the first valid result wins; the
+    other leg is cancelled. Returns (result, winner, hedged) with winner 0 (primary) or
+    1 (secondary). If neither leg is valid, the first result received is returned (winner
+    None) so the caller can report it, or the last error is raised if both legs raised.
+    Every other leg that sent a request is passed to `on_lost(leg, result, error)` when it
+    finishes, so the caller can account for what it cost.
+    """
+    tokens = (CancelToken(), CancelToken())
+    started = {0: executor.submit(_run_leg, primary, tokens[0])}
+    futures = {started[0]: 0}
+    deadline = time.monotonic() + delay
+    hedged = False
+    fallback = fallback_leg = None
+    error = error_leg = None
+    while futures or not hedged:
+        timeout = None if hedged else max(0.0, deadline - time.monotonic())
+        done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED) if futures else (set(), None)
+        for future in done:
+            leg = futures.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                error, error_leg = e, leg
+                continue
+            if is_valid(result):
+                _settle(started, leg, tokens, on_lost)
+                return result, leg, hedged
+            if fallback is None:
+                fallback, fallback_leg = result, leg
+        if not hedged and (not futures or time.monotonic() >= deadline):
+            hedged = True
+            started[1] = executor.submit(_run_leg, secondary, tokens[1])
+            futures[started[1]] = 1
+    if fallback is not None:
+        _settle(started, fallback_leg, tokens, on_lost)
+        return fallback, None, hedged
+    _settle(started, error_leg, tokens, on_lost)
+    raise error
+
+
+async def hedged_call_async(primary, secondary, delay, is_valid, on_lost=None):
+    """hedged_call for coroutine functions; the losing leg's task is cancelled."""
+    tokens = (CancelToken(), CancelToken())
+    started = {0: asyncio.ensure_future(_run_leg_async(primary, tokens[0]))}
+    tasks = {started[0]: 0}
+    deadline = time.monotonic() + delay
+    hedged = False
+    fallback = fallback_leg = None
+    error = error_leg = None
+    used = None
+    try:
+        while tasks or not hedged:
+            timeout = None if hedged else max(0.0, deadline - time.monotonic())
+            done = set()
+            if tasks:
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                leg = tasks.pop(task)
+                if task.exception() is not None:
+                    error, error_leg = task.exception(), leg
+                    continue
+                if is_valid(task.result()):
+                    used = leg
+                    return task.result(), leg, hedged
+                if fallback is None:
+                    fallback, fallback_leg = task.result(), leg
+            if not hedged and (not tasks or time.monotonic() >= deadline):
+                hedged = True
+                started[1] = asyncio.ensure_future(_run_leg_async(secondary, tokens[1]))
+                tasks[started[1]] = 1
+        used = fallback_leg if fallback is not None else error_leg
+    finally:
+        _settle(started, used, tokens, on_lost)
+    if fallback is not None:
+        return fallback, None, hedged
+    raise error
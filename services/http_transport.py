@@ -0,0 +1,100 @@
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from config import settings
+from services.throttle import send_with_retry, send_with_retry_async
+
+# Methods that can be repeated safely after a transient error.
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+class ThrottledAdapter(HTTPAdapter):
+    """HTTPAdapter that sends through the per-host token bucket and retries transient failures."""
+
+    def send(self, request, **kwargs):
+        return send_with_retry(
+            urlsplit(request.url).hostname,
+            lambda: super(ThrottledAdapter, self).send(request, **kwargs),
+            transient_errors=(requests.ConnectionError, requests.Timeout),
+            idempotent=request.method in IDEMPOTENT_METHODS,
+        )
+
+
+def requests_timeout():
+    """(connect, read) timeout tuple for requests-based clients (Jira, GitLab)."""
+    return (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+
+
+def mount_pool(session):
+    """
+    Mounts a ThrottledAdapter sized by HTTP_POOL_SIZE on `session`. The default adapter keeps
+    only 10 connections per host, so concurrent workers beyond that reconnect (and redo the TLS
+    handshake) on every request.
+    """
+    adapter = ThrottledAdapter(pool_connections=settings.HTTP_POOL_SIZE, pool_maxsize=settings.HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def requests_session():
+    """A requests.Session with a connection pool sized for the configured concurrency."""
+    return mount_pool(requests.Session())
+
+
+def _httpx_options(verify):
+    """Transport options (TLS verification, HTTP/2, pool limits) shared by the httpx clients."""
+    import httpx
+
+    http2 = settings.HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("HTTP2_ENABLED is set but the 'h2' package is not installed. Using HTTP/1.1.")
+            http2 = False
+    return {
+        "verify": verify,
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_connections=settings.HTTP_POOL_SIZE,
+            max_keepalive_connections=settings.HTTP_POOL_SIZE,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS,
+        ),
+    }
+
+
+def _httpx_timeout():
+    import httpx
+    return httpx.Timeout(settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+
+
+def httpx_client(verify=False, idempotent=False):
+    """
+    An httpx.Client with the configured pool limits, keep-alive expiry and timeouts, whose
+    requests go through the per-host token bucket and are retried on transient failures
+    (`idempotent` allows retrying POSTs on 5xx, e.g. for LLM calls). HTTP/2 (one multiplexed
+    connection per host) needs the optional 'h2' package; without it the client uses HTTP/1.1.
+    """
+    import httpx
+
+    class ThrottledTransport(httpx.HTTPTransport):
+        def handle_request(self, request):
+            send = lambda: super(ThrottledTransport, self).handle_request(request)
+            return send_with_retry(request.url.host, send, transient_errors=(httpx.TransportError,),
+                                   idempotent=idempotent or request.method in IDEMPOTENT_METHODS)
+
+    return httpx.Client(transport=ThrottledTransport(**_httpx_options(verify)), timeout=_httpx_timeout())
+
+
+def httpx_async_client(verify=False, idempotent=False):
+    """httpx_client for asyncio: an httpx.AsyncClient with the same pool, throttling and retries."""
+    import httpx
+
+    class ThrottledAsyncTransport(httpx.AsyncHTTPTransport):
+        async def handle_async_request(self, request):
+            send = lambda: super(ThrottledAsyncTransport, self).handle_async_request(request)
+            return await send_with_retry_async(request.url.host, send, transient_errors=(httpx.TransportError,),
+                                               idempotent=idempotent or request.method in IDEMPOTENT_METHODS)
+
+    return httpx.AsyncClient(transport=ThrottledAsyncTransport(**_httpx_options(verify)), timeout=_httpx_timeout())
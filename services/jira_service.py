@@ -1,9 +1,31 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from jira import JIRA, JIRAError
 from config import settings
+from services.http_transport import mount_pool, requests_timeout
 
 class JiraService:
     def __init__(self):
-        """Initializes the Jira Service and connects to the Jira server using Personal Access Token."""
+        """
+        Initializes the Jira Service. The connection is opened on first use, so runs
+        that never talk to Jira (e.g. local repository analysis) need no network.
+        """
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._prefetched = {}  # issue key -> issue, filled by search_issues
+        self._prefetched_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The JIRA client, connecting to the Jira server on first access."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._connect()
+        return self._client
+
+    def _connect(self):
+        """Connects to the Jira server using Personal Access Token."""
         try:
             headers = {'Authorization': f'Bearer {settings.JIRA_PAT}'}
             options = {
@@ -11,19 +33,86 @@ class JiraService:
                 'headers': headers
             }
             # We pass token_auth=True to hint the library we are using a PAT
-            self.client = JIRA(options, token_auth=settings.JIRA_PAT)
+            # Retries happen in the shared transport (see services/throttle.py), not in the Jira session.
+            client = JIRA(options, token_auth=settings.JIRA_PAT, timeout=requests_timeout(), max_retries=0)
+            mount_pool(client._session)
             print("Successfully connected to Jira using PAT.")
+            return client
         except JIRAError as e:
             print(f"Failed to connect to Jira: {e.status_code}, {e.text}")
             raise
 
-    def get_ticket_details(self, ticket_id):
+    def search_issues(self, jql):
         """
-        Fetches details for a specific Jira ticket.
+        Returns every issue matching `jql`, fetched with only JIRA_ISSUE_FIELDS. On Jira
+        Server/Data Center the first page reports the total and the remaining pages are
+        requested concurrently; Jira Cloud only pages by nextPageToken, one page after another.
+        The issues are kept so get_ticket_details can hand them to the workflow without
+        another request.
+        """
+        fields = ",".join(settings.JIRA_ISSUE_FIELDS)
+        page_size = settings.JIRA_SEARCH_PAGE_SIZE
+        def get_page(start_at):
+            return self.client.search_issues(jql, startAt=start_at, maxResults=page_size, fields=fields)
+
+        try:
+            if self.client._is_cloud:
+                issues = self._search_cloud_issues(jql, fields, page_size)
+            else:
+                issues = self._search_server_issues(get_page)
+        except JIRAError as e:
+            print(f"Failed to search issues with JQL '{jql}': {e.text}")
+            return []
+
+        with self._prefetched_lock:
+            for issue in issues:
+                self._prefetched[issue.key] = issue
+        print(f"Found {len(issues)} issues for JQL: {jql}")
+        return issues
+
+    def _search_cloud_issues(self, jql, fields, page_size):
+        """
+        Jira Cloud's /search/jql: no total and no startAt, each page carries the token of the
+        next one, so pages can only be fetched in order.
+        """
+        issues = []
+        token = None
+        while True:
+            page = self.client.enhanced_search_issues(jql, nextPageToken=token, maxResults=page_size, fields=fields)
+            issues.extend(page)
+            token = getattr(page, 'nextPageToken', None)
+            if not token or not len(page):
+                return issues
+
+    def _search_server_issues(self, get_page):
+        """Jira Server/Data Center: the first page reports the total, the rest are fetched concurrently."""
+        first_page = get_page(0)
+        issues = list(first_page)
+        # The server may cap maxResults below page_size; page by what it actually returned.
+        step = len(issues)
+        total = getattr(first_page, 'total', None) or step
+        if step and total > step:
+            starts = range(step, total, step)
+            workers = max(1, min(settings.JIRA_SEARCH_CONCURRENCY, len(starts)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jira-search") as executor:
+                for page in executor.map(get_page, starts):
+                    issues.extend(page)
+        return issues
+
+    def get_ticket_details(self, ticket_id, include_comments=True):
+        """
+        Fetches details for a specific Jira ticket (only JIRA_ISSUE_FIELDS), or returns the
+        issue already fetched by search_issues. With include_comments=False the comment field
+        is left out; use get_comments_since to read only new comments.
         Returns the issue object if found, otherwise None.
         """
+        with self._prefetched_lock:
+            issue = self._prefetched.pop(ticket_id, None)
+        if issue is not None:
+            return issue
+        fields = [field for field in settings.JIRA_ISSUE_FIELDS if include_comments or field != "comment"]
         try:
-            issue = self.client.issue(ticket_id)
+            issue = self.client.issue(ticket_id, fields=",".join(fields))
             print(f"Successfully fetched details for ticket: {ticket_id}")
             return issue
         except JIRAError as e:
@@ -33,15 +122,42 @@ class JiraService:
                 print(f"An error occurred while fetching ticket {ticket_id}: {e.text}")
             return None
 
+    def get_comments_since(self, ticket_id, after_comment_id=0, issue=None):
+        """
+        Returns [(comment_id, body)] for the ticket's comments with an ID above
+        `after_comment_id`, oldest first. Comments already loaded on `issue` are used as is;
+        otherwise comments are paged newest first and paging stops at the first old one.
+        """
+        loaded = getattr(getattr(getattr(issue, 'fields', None), 'comment', None), 'comments', None)
+        if loaded is not None:
+            return [(int(c.id), c.body) for c in loaded if int(c.id) > after_comment_id]
+
+        comments = []
+        start_at = 0
+        try:
+            while True:
+                page = self.client._get_json(f"issue/{ticket_id}/comment", params={
+                    "startAt": start_at, "maxResults": settings.JIRA_SEARCH_PAGE_SIZE, "orderBy": "-created"})
+                batch = page.get("comments", [])
+                new = [(int(c["id"]), c.get("body") or "") for c in batch if int(c["id"]) > after_comment_id]
+                comments.extend(new)
+                start_at += len(batch)
+                if not batch or len(new) < len(batch) or start_at >= page.get("total", 0):
+                    break
+        except JIRAError as e:
+            print(f"Failed to fetch comments for ticket {ticket_id}: {e.text}")
+            return None
+        return sorted(comments)
+
     def post_comment(self, ticket_id, comment):
-        """Posts a comment to a specific Jira ticket."""
+        """Posts a comment to a specific Jira ticket. Returns the new comment's ID, or None if posting failed."""
         try:
-            self.client.add_comment(ticket_id, comment)
+            posted = self.client.add_comment(ticket_id, comment)
             print(f"Successfully posted comment to ticket {ticket_id}.")
-            return True
+            return posted.id
         except JIRAError as e:
             print(f"Failed to post comment to ticket {ticket_id}: {e.text}")
-            return False
+            return None
 
     def transition_ticket_status(self, ticket_id, transition_name):
         """Transitions a Jira ticket to a new status."""
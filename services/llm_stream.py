@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+
+
+class StreamTimeout(Exception):
+    """A streamed completion missed its time-to-first-token or stall deadline."""
+
+
+class JsonObjectScanner:
+    """
+    Incremental scanner for the first top-level JSON object in streamed text. It tracks brace
+    depth outside of strings as chunks arrive, so the object is known to be complete (and can be
+    cut out of any surrounding prose or code fences) without rescanning the whole buffer.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._length = 0
+        self._start = None
+        self._end = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text):
+        """Adds streamed text. Returns True once the first object is complete."""
+        offset = self._length
+        self._parts.append(text)
+        self._length += len(text)
+        if self._end is not None:
+            return True
+        for i, char in enumerate(text):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._start is not None:
+                self._in_string = True
+            elif char == "{":
+                if self._start is None:
+                    self._start = offset + i
+                self._depth += 1
+            elif char == "}" and self._start is not None:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._end = offset + i + 1
+                    return True
+        return False
+
+    @property
+    def complete(self):
+        return self._end is not None
+
+    @property
+    def text(self):
+        """Everything received so far."""
+        return "".join(self._parts)
+
+    @property
+    def json_text(self):
+        """The first complete JSON object, or the whole text if none was completed."""
+        text = self.text
+        return text[self._start:self._end] if self._end is not None else text
+
+
+class StreamDeadline:
+    """
+    Watchdog for one streamed call: the first token must arrive within `first_token_timeout`
+    seconds and later chunks within `stall_timeout` seconds of each other. When a deadline
+    passes, `cancel()` is called from the watchdog thread to unblock the reader, which then
+    raises StreamTimeout. A timeout of 0 disables that deadline.
+    """
+
+    def __init__(self, first_token_timeout, stall_timeout, cancel=None):
+        self.first_token_timeout = first_token_timeout
+        self.stall_timeout = stall_timeout
+        self.cancel = cancel
+        self.started_at = time.monotonic()
+        self.ttft = None
+        self.expired = None  # reason, once a deadline passed
+        self._last_chunk = self.started_at
+        self._done = threading.Event()
+        self._thread = None
+
+    def _deadline(self):
+        if self.ttft is None:
+            return self.started_at + self.first_token_timeout if self.first_token_timeout else None
+        return self._last_chunk + self.stall_timeout if self.stall_timeout else None
+
+    def chunk(self, has_text):
+        """Marks a received chunk; the first one carrying text sets the time to first token."""
+        now = time.monotonic()
+        self._last_chunk = now
+        if has_text and self.ttft is None:
+            self.ttft = now - self.started_at
+
+    def check(self):
+        """Raises StreamTimeout if a deadline passed (also when the watchdog noticed it first)."""
+        deadline = self._deadline()
+        if self.expired is None and deadline is not None and time.monotonic() > deadline:
+            self.expired = self._reason()
+        if self.expired:
+            raise StreamTimeout(self.expired)
+
+    def _reason(self):
+        if self.ttft is None:
+            return f"no token within {self.first_token_timeout:g}s"
+        return f"stream stalled for more than {self.stall_timeout:g}s"
+
+    def _watch(self):
+        while not self._done.is_set():
+            deadline = self._deadline()
+            if deadline is None:
+                self._done.wait(0.5)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                self._done.wait(min(remaining, 0.5))
+                continue
+            self.expired = self._reason()
+            if self.cancel:
+                try:
+                    self.cancel()
+                except Exception as e:
+                    print(f"Failed to cancel stalled stream: {e}")
+            return
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._watch, name="llm-stream-watchdog", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        return False
+
+
+def collect_stream(chunks, extract, first_token_timeout, stall_timeout, cancel=None):
+    """
+    Reads a provider stream. `extract(chunk)` returns (text, usage) for one chunk; usage is the
+    provider's token accounting, usually only on the last chunk.
+    Returns (scanner, usage, ttft) or raises StreamTimeout when a deadline passes.
+    """
+    scanner = JsonObjectScanner()
+    usage = None
+    with StreamDeadline(first_token_timeout, stall_timeout, cancel) as deadline:
+        try:
+            for chunk in chunks:
+                text, chunk_usage = extract(chunk)
+                deadline.chunk(bool(text))
+                if text:
+                    scanner.feed(text)
+                usage = chunk_usage or usage
+                deadline.check()
+        except StreamTimeout:
+            raise
+        except Exception:
+            # Cancelling the stream makes the blocked read fail; report why it was cancelled.
+            if deadline.expired:
+                raise StreamTimeout(deadline.expired) from None
+            raise
+        deadline.check()
+    return scanner, usage, deadline.ttft
+
+
+async def collect_stream_async(chunks, extract, first_token_timeout, stall_timeout):
+    """collect_stream for async iterators; deadlines are enforced with asyncio timeouts."""
+    scanner = JsonObjectScanner()
+    usage = None
+    deadline = StreamDeadline(first_token_timeout, stall_timeout)
+    iterator = chunks.__aiter__()
+    while True:
+        limit = deadline._deadline()
+        timeout = None if limit is None else max(0.0, limit - time.monotonic())
+        try:
+            chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+        except StopAsyncIteration:
+            break
+        except asyncio.TimeoutError:
+            close = getattr(chunks, "close", None) or getattr(iterator, "aclose", None)
+            if close:
+                result = close()
+                if asyncio.iscoroutine(result):
+                    await result
+            raise StreamTimeout(deadline._reason()) from None
+        text, chunk_usage = extract(chunk)
+        deadline.chunk(bool(text))
+        if text:
+            scanner.feed(text)
+        usage = chunk_usage or usage
+    return scanner, usage, deadline.ttft
@@ -0,0 +1,112 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+
+def canonical_url(url):
+    """
+    Normalizes a GitLab MR or commit URL so the same change is recorded once, e.g.
+    'HTTPS://Host/g/p/merge_requests/5/' and 'https://host/g/p/-/merge_requests/5' are equal.
+    """
+    parsed = urlparse(url.strip())
+    path = parsed.path.rstrip("/")
+    match = re.match(r"^(.*?)(?:/-)?/(merge_requests/\d+|commit/[0-9a-fA-F]+)$", path)
+    if match:
+        path = f"{match.group(1)}/-/{match.group(2).lower()}"
+    return f"{parsed.scheme.lower()}://{parsed.netloc.lower()}{path}"
+
+
+class ReviewLedger:
+    """
+    Persistent record of what the bot has reviewed, in SQLite: every MR/commit URL found on a
+    ticket, the reviews posted for them (head SHA, prompt version, Jira comment ID), and a
+    per-ticket watermark of the last Jira comment scanned. A run only needs to read comments
+    newer than the watermark; everything older is already in the ledger.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # WAL lets concurrent runs (e.g. cron + manual) read while another one writes.
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            " ticket_id TEXT NOT NULL, url TEXT NOT NULL, url_type TEXT NOT NULL, first_seen REAL NOT NULL,"
+            " PRIMARY KEY (ticket_id, url));"
+            "CREATE TABLE IF NOT EXISTS reviews ("
+            " ticket_id TEXT NOT NULL, url TEXT NOT NULL, head_sha TEXT, prompt_version TEXT,"
+            " comment_id TEXT, reviewed_at REAL NOT NULL,"
+            " PRIMARY KEY (ticket_id, url));"
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            " ticket_id TEXT PRIMARY KEY, last_comment_id INTEGER NOT NULL, updated_at REAL NOT NULL);"
+        )
+        self._conn.commit()
+
+    def add_url(self, ticket_id, url, url_type):
+        """Records a URL found on the ticket (no-op if it is already known)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO urls (ticket_id, url, url_type, first_seen) VALUES (?, ?, ?, ?)",
+                (ticket_id, canonical_url(url), url_type, time.time()),
+            )
+            self._conn.commit()
+
+    def urls(self, ticket_id):
+        """Returns every (url, url_type) found on the ticket, in the order first seen."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, url_type FROM urls WHERE ticket_id = ? ORDER BY first_seen, url", (ticket_id,)
+            ).fetchall()
+        return [(url, url_type) for url, url_type in rows]
+
+    def record_review(self, ticket_id, url, head_sha=None, prompt_version=None, comment_id=None):
+        """Records (or updates) the latest review of `url`; unknown values keep what was stored."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO reviews (ticket_id, url, head_sha, prompt_version, comment_id, reviewed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(ticket_id, url) DO UPDATE SET"
+                " head_sha = COALESCE(excluded.head_sha, head_sha),"
+                " prompt_version = COALESCE(excluded.prompt_version, prompt_version),"
+                " comment_id = COALESCE(excluded.comment_id, comment_id),"
+                " reviewed_at = excluded.reviewed_at",
+                (ticket_id, canonical_url(url), head_sha, prompt_version,
+                 None if comment_id is None else str(comment_id), time.time()),
+            )
+            self._conn.commit()
+
+    def reviewed_heads(self, ticket_id):
+        """Returns {url: head_sha} for every reviewed URL of the ticket (head_sha None for commits)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, head_sha FROM reviews WHERE ticket_id = ?", (ticket_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def watermark(self, ticket_id):
+        """The ID of the newest Jira comment already scanned on the ticket (0 if none)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_comment_id FROM watermarks WHERE ticket_id = ?", (ticket_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def set_watermark(self, ticket_id, comment_id):
+        """Moves the watermark forward (never back) to `comment_id`."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO watermarks (ticket_id, last_comment_id, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(ticket_id) DO UPDATE SET"
+                " last_comment_id = MAX(last_comment_id, excluded.last_comment_id),"
+                " updated_at = excluded.updated_at",
+                (ticket_id, int(comment_id), time.time()),
+            )
+            self._conn.commit()
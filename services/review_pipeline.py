@@ -0,0 +1,151 @@
+import asyncio
+import inspect
+from config import settings
+
+# Sentinel placed on a stage queue to tell one worker of that stage to stop.
+_STOP = object()
+
+
+class ReviewResult:
+    """Outcome of pushing one GitLab URL through the review pipeline."""
+
+    def __init__(self, index, url, url_type):
+        self.index = index
+        self.url = url
+        self.url_type = url_type
+        self.code_diff = None
+        self.analysis_result = None
+        self.comment = None
+        self.status = "pending"  # pending | fetch_failed | empty | analysis_failed | post_failed | posted
+        self.error = None
+
+    @property
+    def posted(self):
+        return self.status == "posted"
+
+
+class ReviewPipeline:
+    """
+    Runs the fetch → analyze → post steps for many URLs as separate asyncio stages
+    linked by bounded queues, so the diff for URL n+1 downloads while URL n is analyzed.
+
+    The stage callables are the existing service calls; blocking ones run in a worker thread,
+    coroutine functions are awaited on the pipeline's loop, and every stage has its own
+    concurrency limit:
+      - fetch_fn(url, url_type) -> code diff (None if it failed, empty if nothing is left to review)
+      - analyze_fn(code_diff) -> analysis result dict (or None)
+      - post_fn(url, analysis_result) -> posted comment text (or None)
+    close_fn, if given, is awaited once all stages have drained, before the loop ends
+    (e.g. to close async HTTP clients bound to it).
+    """
+
+    def __init__(self, fetch_fn, analyze_fn, post_fn,
+                 fetch_concurrency=None, analyze_concurrency=None, post_concurrency=None,
+                 queue_size=None, close_fn=None):
+        self.fetch_fn = fetch_fn
+        self.analyze_fn = analyze_fn
+        self.post_fn = post_fn
+        self.close_fn = close_fn
+        self.fetch_concurrency = max(1, fetch_concurrency or settings.PIPELINE_FETCH_CONCURRENCY)
+        self.analyze_concurrency = max(1, analyze_concurrency or settings.PIPELINE_ANALYZE_CONCURRENCY)
+        self.post_concurrency = max(1, post_concurrency or settings.PIPELINE_POST_CONCURRENCY)
+        self.queue_size = max(1, queue_size or settings.PIPELINE_QUEUE_SIZE)
+
+    def run(self, urls):
+        """Processes (url, url_type) pairs and returns one ReviewResult per URL, in input order."""
+        return asyncio.run(self.run_async(urls))
+
+    async def run_async(self, urls):
+        results = [ReviewResult(i, url, url_type) for i, (url, url_type) in enumerate(urls, 1)]
+        if not results:
+            return results
+
+        fetch_queue = asyncio.Queue()
+        analyze_queue = asyncio.Queue(maxsize=self.queue_size)
+        post_queue = asyncio.Queue(maxsize=self.queue_size)
+
+        for result in results:
+            fetch_queue.put_nowait(result)
+
+        fetch_workers = [asyncio.create_task(self._fetch_worker(fetch_queue, analyze_queue, len(results)))
+                         for _ in range(self.fetch_concurrency)]
+        analyze_workers = [asyncio.create_task(self._analyze_worker(analyze_queue, post_queue))
+                           for _ in range(self.analyze_concurrency)]
+        post_workers = [asyncio.create_task(self._post_worker(post_queue))
+                        for _ in range(self.post_concurrency)]
+
+        # Shut the stages down in order: each stage stops once the previous one has drained.
+        try:
+            for _ in fetch_workers:
+                fetch_queue.put_nowait(_STOP)
+            await asyncio.gather(*fetch_workers)
+            for _ in analyze_workers:
+                await analyze_queue.put(_STOP)
+            await asyncio.gather(*analyze_workers)
+            for _ in post_workers:
+                await post_queue.put(_STOP)
+            await asyncio.gather(*post_workers)
+        finally:
+            if self.close_fn:
+                await self._call(self.close_fn)
+
+        return results
+
+    async def _call(self, fn, *args):
+        """Awaits `fn` on this loop if it is a coroutine function, else runs it in a worker thread."""
+        if inspect.iscoroutinefunction(fn):
+            return await fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def _fetch_worker(self, in_queue, out_queue, total):
+        while True:
+            result = await in_queue.get()
+            if result is _STOP:
+                return
+            print(f"\n--- STEP 4: Fetching code diff for URL {result.index}/{total}: {result.url} ---")
+            try:
+                result.code_diff = await self._call(self.fetch_fn, result.url, result.url_type)
+            except Exception as e:
+                result.error = str(e)
+            if result.code_diff is None:
+                result.status = "fetch_failed"
+                print(f"--- SKIP URL: Failed to fetch code diff for {result.url}. ---")
+                continue
+            if not result.code_diff:
+                result.status = "empty"
+                print(f"--- SKIP URL: No reviewable changes in {result.url} (all pruned). ---")
+                continue
+            print(f"--- STEP 4 COMPLETE ({result.url}) ---")
+            await out_queue.put(result)
+
+    async def _analyze_worker(self, in_queue, out_queue):
+        while True:
+            result = await in_queue.get()
+            if result is _STOP:
+                return
+            print(f"\n--- STEP 5: Analyzing code diff with AI ({result.url})... ---")
+            try:
+                result.analysis_result = await self._call(self.analyze_fn, result.code_diff)
+            except Exception as e:
+                result.error = str(e)
+            if not result.analysis_result:
+                result.status = "analysis_failed"
+                print(f"--- SKIP URL: AI analysis failed for {result.url}. ---")
+                continue
+            print(f"--- STEP 5 COMPLETE ({result.url}) ---")
+            await out_queue.put(result)
+
+    async def _post_worker(self, in_queue):
+        while True:
+            result = await in_queue.get()
+            if result is _STOP:
+                return
+            try:
+                result.comment = await self._call(self.post_fn, result.url, result.analysis_result)
+            except Exception as e:
+                result.error = str(e)
+            if result.comment is None:
+                result.status = "post_failed"
+                print(f"--- SKIP URL: Failed to post review for {result.url}. ---")
+                continue
+            result.status = "posted"
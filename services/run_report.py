@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+import time
+import uuid
+from config import settings
+
+_report = None
+_report_lock = threading.Lock()
+
+
+def get_run_report():
+    """Returns the process-wide RunReport, creating it on first use."""
+    global _report
+    with _report_lock:
+        if _report is None:
+            _report = RunReport(settings.RUN_REPORT_PATH)
+        return _report
+
+
+def _empty_totals():
+    return {
+        "calls": 0,
+        "cached_calls": 0,
+        "failed_calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "latency_seconds": 0.0,
+    }
+
+
+class RunReport:
+    """
+    Machine-readable accounting of every LLM call in a run. Each call is appended to a
+    JSON lines file as it happens, followed by per-ticket and per-run totals.
+    An empty `path` keeps the totals in memory without writing a file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._run_totals = _empty_totals()
+        self._ticket_totals = {}
+        self._concurrency = {}  # limiter name -> current limit and number of changes
+        self._hedge = {"calls": 0, "hedged": 0, "hedge_wins": 0}
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _write(self, record):
+        if not self.path:
+            return
+        record = {"run_id": self.run_id, "timestamp": time.time(), **record}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def record_llm_call(self, provider, model, prompt_tokens, completion_tokens, latency,
+                        cached=False, ok=True, estimated=False, ticket_id=None, ttft=None, hedge_lost=False):
+        """
+        Records one LLM call (or cache hit) and adds it to the ticket and run totals. Streamed
+        calls also record their time to first token and generation speed in tokens per second.
+        `hedge_lost` marks the leg of a hedged call whose answer was not used; its tokens were
+        billed, so they count in the totals too.
+        """
+        record = {
+            "type": "llm_call",
+            "ticket_id": ticket_id,
+            "provider": provider,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency_seconds": round(latency, 3),
+            "cached": cached,
+            "ok": ok,
+            "tokens_estimated": estimated,
+        }
+        if hedge_lost:
+            record["hedge_lost"] = True
+        if ttft is not None:
+            record["ttft_seconds"] = round(ttft, 3)
+            generation = latency - ttft
+            record["tokens_per_second"] = round(completion_tokens / generation, 1) if generation > 0 else None
+        with self._lock:
+            totals = [self._run_totals]
+            if ticket_id:
+                totals.append(self._ticket_totals.setdefault(ticket_id, _empty_totals()))
+            for total in totals:
+                total["calls"] += 1
+                total["cached_calls"] += int(cached)
+                total["failed_calls"] += int(not ok and not hedge_lost)
+                total["prompt_tokens"] += prompt_tokens
+                total["completion_tokens"] += completion_tokens
+                total["latency_seconds"] += latency
+            self._write(record)
+
+    def record_concurrency_change(self, name, old_limit, new_limit, reason):
+        """Records a decision of an adaptive concurrency limiter (e.g. the LLM call limit)."""
+        with self._lock:
+            state = self._concurrency.setdefault(name, {"limit": old_limit, "changes": 0})
+            state["limit"] = new_limit
+            state["changes"] += 1
+            self._write({"type": "concurrency", "name": name, "from": old_limit, "to": new_limit,
+                         "reason": reason})
+
+    def record_hedge(self, hedged, hedge_won):
+        """Counts one hedged-mode LLM call: whether the hedge was sent, and whether it won."""
+        with self._lock:
+            self._hedge["calls"] += 1
+            self._hedge["hedged"] += int(hedged)
+            self._hedge["hedge_wins"] += int(hedge_won)
+
+    def ticket_totals(self, ticket_id):
+        with self._lock:
+            return dict(self._ticket_totals.get(ticket_id, _empty_totals()))
+
+    def run_totals(self):
+        with self._lock:
+            return dict(self._run_totals)
+
+    def write_ticket_summary(self, ticket_id, elapsed=None, ok=True):
+        """Appends the LLM totals of one ticket to the report."""
+        totals = self.ticket_totals(ticket_id)
+        with self._lock:
+            self._write({"type": "ticket_summary", "ticket_id": ticket_id, "ok": ok,
+                         "wall_seconds": round(elapsed, 3) if elapsed is not None else None, **totals})
+
+    def write_run_summary(self, tickets=None):
+        """Appends the LLM totals of the whole run to the report."""
+        totals = self.run_totals()
+        with self._lock:
+            if self._concurrency:
+                totals["concurrency"] = {name: dict(state) for name, state in self._concurrency.items()}
+            if self._hedge["calls"]:
+                hedge = dict(self._hedge)
+                hedge["hedge_rate"] = round(hedge["hedged"] / hedge["calls"], 3)
+                hedge["hedge_win_rate"] = round(hedge["hedge_wins"] / hedge["hedged"], 3) if hedge["hedged"] else None
+                totals["hedge"] = hedge
+            self._write({"type": "run_summary", "tickets": tickets,
+                         "wall_seconds": round(time.time() - self.started_at, 3), **totals})
+        return totals
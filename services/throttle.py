@@ -0,0 +1,250 @@
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from config import settings
+from services.hedging import begin_send, cancellable_sleep
+
+# Statuses worth another attempt: rate limiting and transient gateway/server errors.
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+# Seconds the current thread (or task) spent waiting for a bucket or a retry, see throttle_wait().
+_waited = contextvars.ContextVar("throttle_waited", default=None)
+
+
+def throttle_wait():
+    """
+    Total seconds the current thread or asyncio task has spent waiting in token buckets and
+    retry backoffs. Callers take the difference around a call to tell waiting from the call's
+    own latency (e.g. the adaptive concurrency limiter).
+    """
+    waited = _waited.get()
+    if waited is None:
+        waited = [0.0]
+        _waited.set(waited)
+    return waited[0]
+
+
+def _add_wait(seconds):
+    waited = _waited.get()
+    if waited is not None:
+        waited[0] += seconds
+
+
+def _backoff(seconds):
+    cancellable_sleep(seconds)
+    _add_wait(seconds)
+
+
+async def _backoff_async(seconds):
+    await asyncio.sleep(seconds)
+    _add_wait(seconds)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` requests per second on average, bursts of up to `burst`.
+    A 429 can pause the whole bucket, since Retry-After applies to the host, not one request.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self.rate_limited = 0  # 429s seen from the host, for callers that adapt to them
+        self._lock = threading.Lock()
+
+    def _try_acquire(self):
+        """Takes a token and returns 0, or returns the seconds to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            if self.rate > 0:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if now >= self._paused_until and (self.rate <= 0 or self._tokens >= 1):
+                if self.rate > 0:
+                    self._tokens -= 1
+                return 0
+            return max(self._paused_until - now, (1 - self._tokens) / self.rate if self.rate > 0 else 0)
+
+    def acquire(self):
+        """Blocks until a request may be sent. Returns the seconds spent waiting."""
+        waited = 0.0
+        while (delay := self._try_acquire()) > 0:
+            cancellable_sleep(delay)
+            waited += delay
+        _add_wait(waited)
+        return waited
+
+    async def acquire_async(self):
+        """acquire() for event loops: waits without blocking the loop."""
+        waited = 0.0
+        while (delay := self._try_acquire()) > 0:
+            await asyncio.sleep(delay)
+            waited += delay
+        _add_wait(waited)
+        return waited
+
+    def pause(self, seconds):
+        """Holds back every caller of this bucket for `seconds` after the host answered 429."""
+        with self._lock:
+            self.rate_limited += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _host_rates():
+    """THROTTLE_HOST_RATES entries ('host=rate') as {host: rate}."""
+    rates = {}
+    for entry in settings.THROTTLE_HOST_RATES:
+        host, _, rate = entry.partition("=")
+        try:
+            rates[host.strip().lower()] = float(rate)
+        except ValueError:
+            print(f"Ignoring invalid THROTTLE_HOST_RATES entry: {entry}")
+    return rates
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket_for(host):
+    """The process-wide token bucket of `host`, shared by every client talking to it."""
+    host = (host or "").lower()
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            rate = _host_rates().get(host, settings.THROTTLE_RATE)
+            bucket = _buckets[host] = TokenBucket(rate, settings.THROTTLE_BURST)
+        return bucket
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt, retry_after=None):
+    """Retry-After when the server sent one, else exponential backoff with full jitter."""
+    if retry_after is not None:
+        return min(retry_after, settings.RETRY_MAX_DELAY)
+    return random.uniform(0, min(settings.RETRY_MAX_DELAY, settings.RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _before_retry(host, bucket, attempt, reason, retry_after=None, rate_limited=False):
+    """Returns how long to wait before the next attempt, pausing the host's bucket on a 429."""
+    delay = retry_delay(attempt, retry_after)
+    if rate_limited:
+        bucket.pause(delay)
+    print(f"{host}: {reason}; retrying in {delay:.1f}s (attempt {attempt + 2}/{settings.RETRY_MAX_ATTEMPTS + 1}).")
+    return delay
+
+
+def _keep_response(status, attempt, idempotent):
+    """True if a response with `status` is final: not retryable, not safe to retry, or out of attempts."""
+    return (status not in RETRYABLE_STATUS or attempt == settings.RETRY_MAX_ATTEMPTS
+            or (status != 429 and not idempotent))
+
+
+def send_with_retry(host, send, transient_errors=(), idempotent=True):
+    """
+    Sends a request through the host's token bucket and retries it on RETRYABLE_STATUS and
+    `transient_errors`. `send()` returns a response with status_code, headers and close().
+    Requests that are not idempotent are only retried on 429, which the server did not process.
+    """
+    bucket = bucket_for(host)
+    for attempt in range(settings.RETRY_MAX_ATTEMPTS + 1):
+        bucket.acquire()
+        begin_send()
+        try:
+            response = send()
+        except transient_errors as e:
+            if not idempotent or attempt == settings.RETRY_MAX_ATTEMPTS:
+                raise
+            _backoff(_before_retry(host, bucket, attempt, f"{type(e).__name__}: {e}"))
+            continue
+        status = response.status_code
+        if _keep_response(status, attempt, idempotent):
+            return response
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        response.close()
+        _backoff(_before_retry(host, bucket, attempt, f"HTTP {status}", retry_after, rate_limited=status == 429))
+
+
+async def send_with_retry_async(host, send, transient_errors=(), idempotent=True):
+    """send_with_retry for event loops: `send()` is a coroutine function, responses close with aclose()."""
+    bucket = bucket_for(host)
+    for attempt in range(settings.RETRY_MAX_ATTEMPTS + 1):
+        await bucket.acquire_async()
+        begin_send()
+        try:
+            response = await send()
+        except transient_errors as e:
+            if not idempotent or attempt == settings.RETRY_MAX_ATTEMPTS:
+                raise
+            await _backoff_async(_before_retry(host, bucket, attempt, f"{type(e).__name__}: {e}"))
+            continue
+        status = response.status_code
+        if _keep_response(status, attempt, idempotent):
+            return response
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        await response.aclose()
+        await _backoff_async(_before_retry(host, bucket, attempt, f"HTTP {status}", retry_after,
+                                          rate_limited=status == 429))
+
+
+def _error_status(error):
+    """(HTTP status, Retry-After seconds) carried by an SDK exception, if any."""
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status is None and isinstance(getattr(error, "code", None), int):
+        status = error.code  # google.api_core exceptions
+    headers = getattr(response, "headers", None) or {}
+    return status, parse_retry_after(headers.get("Retry-After"))
+
+
+def throttled_call(host, call):
+    """
+    Like send_with_retry for SDK calls that raise on HTTP errors instead of returning a
+    response (e.g. the Gemini SDK): exceptions carrying a RETRYABLE_STATUS are retried.
+    """
+    bucket = bucket_for(host)
+    for attempt in range(settings.RETRY_MAX_ATTEMPTS + 1):
+        bucket.acquire()
+        begin_send()
+        try:
+            return call()
+        except Exception as e:
+            status, retry_after = _error_status(e)
+            if status not in RETRYABLE_STATUS or attempt == settings.RETRY_MAX_ATTEMPTS:
+                raise
+            _backoff(_before_retry(host, bucket, attempt, f"HTTP {status}", retry_after, rate_limited=status == 429))
+
+
+async def throttled_call_async(host, call):
+    """throttled_call for event loops: `call()` is a coroutine function."""
+    bucket = bucket_for(host)
+    for attempt in range(settings.RETRY_MAX_ATTEMPTS + 1):
+        await bucket.acquire_async()
+        begin_send()
+        try:
+            return await call()
+        except Exception as e:
+            status, retry_after = _error_status(e)
+            if status not in RETRYABLE_STATUS or attempt == settings.RETRY_MAX_ATTEMPTS:
+                raise
+            await _backoff_async(_before_retry(host, bucket, attempt, f"HTTP {status}", retry_after,
+                                              rate_limited=status == 429))
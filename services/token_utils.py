@@ -0,0 +1,15 @@
+# Rough characters-per-token ratio for code and diffs. Good enough for budgeting
+# without pulling in a provider-specific tokenizer.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Estimates the number of LLM tokens in `text`."""
+    if not text:
+        return 0
+    return estimate_tokens_for_length(len(text))
+
+
+def estimate_tokens_for_length(length):
+    """Estimates the number of LLM tokens in a text of `length` characters."""
+    return (length + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -0,0 +1,40 @@
+from unittest.mock import AsyncMock, Mock
+import pytest
+from services import run_report
+
+
+@pytest.fixture(autouse=True)
+def in_memory_run_report():
+    """Keeps LLM accounting in memory so tests never write a run report file."""
+    report = run_report.RunReport(None)
+    previous = run_report._report
+    run_report._report = report
+    yield report
+    run_report._report = previous
+
+
+@pytest.fixture
+def workflow_services():
+    """
+    A mocked ServiceContainer on which main_workflow reviews every URL it finds: the MR head
+    is "a" * 40, diffs are fetched, analysed ("NAIK STAGING") and the comment is posted.
+    Tests override what they need (ticket comments, ledger, head SHA, ...).
+    """
+    services = Mock()
+    services.diff_pruner = None
+    services.review_ledger = None
+    issue = Mock()
+    issue.fields.assignee.name = "dev"
+    issue.fields.comment.comments = []
+    services.jira.get_ticket_details.return_value = issue
+    services.jira.post_comment.return_value = "900"
+    services.gitlab.get_merge_request.return_value = Mock(diff_refs={"head_sha": "a" * 40})
+    services.diff_fetcher.prefetch_commit_diffs.return_value = 0
+    services.diff_fetcher.fetch_gitlab_mr_diff.return_value = "full diff"
+    services.diff_fetcher.fetch_mr_delta_diff.return_value = "delta diff"
+    services.diff_fetcher.fetch_commit_diff.return_value = "commit diff"
+    services.ai.analyze_code_diff_async = AsyncMock(
+        return_value={"change_summary": "s", "analysis": {}, "conclusion": "NAIK STAGING"})
+    services.ai.aclose = AsyncMock()
+    services.ai.prompt_version = "v1"
+    return services
@@ -0,0 +1,130 @@
+import threading
+import time
+from services.adaptive_limiter import AdaptiveLimiter
+from services.run_report import RunReport
+
+
+def run_calls(limiter, count, latency, tokens=1000, rate_limited=False):
+    for _ in range(count):
+        with limiter.slot() as slot:
+            slot.record(latency, tokens, rate_limited=rate_limited)
+
+
+def test_limit_grows_additively_while_latency_is_flat():
+    limiter = AdaptiveLimiter("llm", initial=2, min_limit=1, max_limit=4)
+    run_calls(limiter, 2, latency=1.0)
+    assert limiter.limit == 2
+    run_calls(limiter, 3, latency=1.1)
+    assert limiter.limit == 3
+    run_calls(limiter, 20, latency=1.0)
+    assert limiter.limit == 4
+
+
+def test_429_and_latency_spike_cut_the_limit():
+    limiter = AdaptiveLimiter("llm", initial=8, min_limit=1, max_limit=16)
+    run_calls(limiter, 1, latency=1.0)
+    run_calls(limiter, 1, latency=1.0, rate_limited=True)
+    assert limiter.limit == 4
+    run_calls(limiter, 1, latency=5.0)
+    assert limiter.limit == 2
+    assert [d["reason"] for d in limiter.decisions][-2:] == ["rate limited (429)", "latency spike (5.0x baseline)"]
+
+
+def test_latency_is_compared_per_token():
+    limiter = AdaptiveLimiter("llm", initial=4, min_limit=1, max_limit=16)
+    run_calls(limiter, 1, latency=1.0, tokens=1000)
+    run_calls(limiter, 1, latency=10.0, tokens=10000)
+    assert limiter.limit == 4
+
+
+def test_calls_started_before_a_cut_do_not_cut_again():
+    limiter = AdaptiveLimiter("llm", initial=8, min_limit=1, max_limit=16)
+    with limiter.slot() as early, limiter.slot() as late:
+        late.record(1.0, rate_limited=True)
+        early.record(1.0, rate_limited=True)
+    assert limiter.limit == 4
+
+
+def test_slots_block_beyond_the_limit():
+    limiter = AdaptiveLimiter("llm", initial=1, min_limit=1, max_limit=1)
+    entered = threading.Event()
+
+    def second_call():
+        with limiter.slot():
+            entered.set()
+
+    with limiter.slot():
+        thread = threading.Thread(target=second_call)
+        thread.start()
+        time.sleep(0.05)
+        assert not entered.is_set()
+    thread.join(timeout=1)
+    assert entered.is_set()
+
+
+def test_changes_are_reported_in_the_run_summary(tmp_path):
+    report = RunReport(str(tmp_path / "report.jsonl"))
+    limiter = AdaptiveLimiter("llm", initial=4, min_limit=1, max_limit=16,
+                              on_change=report.record_concurrency_change)
+    run_calls(limiter, 1, latency=1.0, rate_limited=True)
+
+    totals = report.write_run_summary()
+
+    assert totals["concurrency"] == {"llm": {"limit": 2, "changes": 1}}
+    assert '"type": "concurrency"' in (tmp_path / "report.jsonl").read_text()
+
+
+def test_waiting_for_a_slot_can_be_aborted():
+    limiter = AdaptiveLimiter("llm", initial=1, min_limit=1, max_limit=1)
+    aborted = threading.Event()
+    errors = []
+
+    def abort():
+        if aborted.is_set():
+            raise RuntimeError("not needed anymore")
+
+    def waiter():
+        try:
+            with limiter.slot(abort=abort):
+                pass
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    with limiter.slot():
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.05)
+        aborted.set()
+        limiter.wake()
+        thread.join(timeout=2)
+        assert errors == ["not needed anymore"]
+    assert limiter.in_flight == 0
+
+
+def test_small_calls_after_a_big_one_are_not_a_spike():
+    """Latency is overhead plus per-token cost: 1.5k tokens in 3s is normal after 24.8k in 12s."""
+    limiter = AdaptiveLimiter("llm", initial=4, min_limit=1, max_limit=16)
+    run_calls(limiter, 1, latency=12.0, tokens=24800)
+    run_calls(limiter, 3, latency=3.0, tokens=1500)
+    run_calls(limiter, 2, latency=12.5, tokens=24800)
+    run_calls(limiter, 2, latency=3.2, tokens=1500)
+    assert limiter.limit >= 4
+    assert not any("spike" in d["reason"] for d in limiter.decisions)
+
+
+def test_baseline_follows_a_gateway_that_became_slower():
+    limiter = AdaptiveLimiter("llm", initial=8, min_limit=1, max_limit=16)
+    run_calls(limiter, 5, latency=1.0)
+    run_calls(limiter, 1, latency=3.0)
+    assert limiter.limit == 4
+    # Steady at the new speed: after re-learning, the limit grows again instead of being cut.
+    run_calls(limiter, 20, latency=3.0)
+    assert limiter.limit >= 5
+    assert [d["reason"] for d in limiter.decisions].count("latency flat") >= 1
+
+
+def test_throttle_waits_are_not_counted_as_gateway_latency():
+    from services.throttle import _add_wait, throttle_wait
+    before = throttle_wait()
+    _add_wait(2.5)
+    assert throttle_wait() - before == 2.5
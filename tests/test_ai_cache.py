@@ -0,0 +1,71 @@
+import json
+import time
+from unittest.mock import Mock, patch
+import pytest
+from services.cache_store import CacheStore, make_cache_key
+from services.ai_service import AIService
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CacheStore(str(tmp_path / "cache.sqlite3"), max_bytes=100, max_age_seconds=60)
+
+
+def test_make_cache_key_is_stable_and_unambiguous():
+    assert make_cache_key("a", "b") == make_cache_key("a", "b")
+    assert make_cache_key("ab", "c") != make_cache_key("a", "bc")
+
+
+def test_cache_store_counts_hits_and_misses(store):
+    assert store.get("k") is None
+    store.set("k", "value")
+    assert store.get("k") == "value"
+
+    stats = store.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_cache_store_evicts_least_recently_used_over_budget(store):
+    store.set("old", "x" * 40)
+    store.set("new", "y" * 40)
+    store.get("old")  # "new" is now the least recently used entry
+    store.set("newest", "z" * 40)
+
+    assert store.get("new") is None
+    assert store.get("old") == "x" * 40
+    assert store.get("newest") == "z" * 40
+
+
+def test_cache_store_expires_old_entries(store):
+    store.set("k", "value")
+    with patch("services.cache_store.time.time", return_value=time.time() + 120):
+        assert store.get("k") is None
+
+
+@pytest.fixture
+def ai_service(tmp_path):
+    with patch.multiple("config.settings", AI_SERVICE_PROVIDER="openai", OPENAI_API_KEY="key",
+                        AI_CACHE_ENABLED=True, AI_CACHE_PATH=str(tmp_path / "ai.sqlite3"),
+                        AI_STREAMING_ENABLED=False):
+        service = AIService()
+    service.client = Mock()
+    service.client.chat.completions.create.return_value = Mock(
+        choices=[Mock(message=Mock(content=json.dumps({"conclusion": "NAIK STAGING"})))]
+    )
+    return service
+
+
+def test_analyze_code_diff_served_from_cache_on_repeat(ai_service):
+    first = ai_service.analyze_code_diff("diff --git a/x b/x")
+    second = ai_service.analyze_code_diff("diff --git a/x b/x")
+
+    assert first == second == {"conclusion": "NAIK STAGING"}
+    ai_service.client.chat.completions.create.assert_called_once()
+    assert ai_service.cache.hits == 1
+
+
+def test_cache_key_changes_with_model_and_diff(ai_service):
+    key = ai_service._cache_key("diff")
+    assert ai_service._cache_key("other diff") != key
+    ai_service.model_name = "another-model"
+    assert ai_service._cache_key("diff") != key
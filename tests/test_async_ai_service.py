@@ -0,0 +1,137 @@
+import asyncio
+import json
+import threading
+from unittest.mock import AsyncMock, Mock, patch
+import httpx
+import pytest
+from services import throttle
+from services.ai_service import AIService
+from services.http_transport import httpx_async_client
+
+RESULT = {"change_summary": "s", "analysis": {"perubahan_diperlukan": [], "sudah_baik": []},
+          "conclusion": "NAIK STAGING"}
+
+
+def make_file(name, lines=10):
+    body = "".join(f"+line {i} of {name}\n" for i in range(lines))
+    return f"diff --git a/{name} b/{name}\n--- a/{name}\n+++ b/{name}\n@@ -0,0 +1,{lines} @@\n{body}"
+
+
+@pytest.fixture
+def ai_service(tmp_path):
+    with patch.multiple("config.settings", AI_SERVICE_PROVIDER="openai", OPENAI_API_KEY="key",
+                        AI_CACHE_ENABLED=True, AI_CACHE_PATH=str(tmp_path / "ai.sqlite3"),
+                        AI_STREAMING_ENABLED=False):
+        service = AIService()
+    async_client = Mock()
+    async_client.chat.completions.create = AsyncMock(return_value=Mock(
+        choices=[Mock(message=Mock(content=json.dumps(RESULT)))], usage=None))
+    service._get_async_client = Mock(return_value=async_client)
+    return service
+
+
+def test_async_analysis_returns_the_parsed_result_and_caches_it(ai_service):
+    first = asyncio.run(ai_service.analyze_code_diff_async("diff --git a/x b/x"))
+    second = asyncio.run(ai_service.analyze_code_diff_async("diff --git a/x b/x"))
+
+    assert first == second == RESULT
+    ai_service._get_async_client.return_value.chat.completions.create.assert_awaited_once()
+
+
+def test_async_analysis_returns_none_on_api_errors(ai_service):
+    ai_service._get_async_client.return_value.chat.completions.create.side_effect = RuntimeError("boom")
+    assert asyncio.run(ai_service.analyze_code_diff_async("diff --git a/x b/x")) is None
+    assert ai_service.run_report.run_totals()["failed_calls"] >= 1
+
+
+def test_async_analysis_of_many_chunks_runs_on_one_loop(ai_service):
+    with patch.multiple("config.settings", AI_CHUNK_TOKEN_BUDGET=100, AI_CHUNK_CONCURRENCY=2):
+        result = asyncio.run(ai_service.analyze_code_diff_async("".join(make_file(f"f{i}.py") for i in range(4))))
+
+    assert ai_service._get_async_client.return_value.chat.completions.create.await_count == 4
+    assert result["conclusion"] == "NAIK STAGING"
+
+
+def test_gemini_async_calls_work_on_every_event_loop():
+    service = AIService.__new__(AIService)
+    service.provider = "gemini"
+    service.temperature = 0
+    service.streaming = False
+    service._genai = Mock()
+    service.client = Mock()
+    service.client.generate_content.return_value = Mock(
+        text="{}", usage_metadata=Mock(prompt_token_count=3, candidates_token_count=1))
+
+    # Each ticket runs its own asyncio.run; the SDK's async client only works on the first loop.
+    for _ in range(2):
+        assert asyncio.run(service._call_provider_async("prompt")) == ("{}", 3, 1, None)
+    assert service.client.generate_content.call_count == 2
+    service.client.generate_content_async.assert_not_called()
+
+
+def test_async_client_retries_rate_limited_requests():
+    throttle._buckets.clear()
+    responses = [httpx.Response(429, headers={"Retry-After": "0"}), httpx.Response(200, json={"ok": True})]
+
+    async def run():
+        async with httpx_async_client(idempotent=True) as client:
+            return await client.post("https://llm.example.com/v1/chat/completions", json={})
+
+    with patch("httpx.AsyncHTTPTransport.handle_async_request", AsyncMock(side_effect=responses)) as send, \
+            patch.multiple("config.settings", THROTTLE_RATE=0):
+        response = asyncio.run(run())
+
+    assert response.status_code == 200
+    assert send.await_count == 2
+    throttle._buckets.clear()
+
+
+def test_async_client_is_closed_by_aclose_and_recreated_on_the_next_loop(tmp_path):
+    with patch.multiple("config.settings", AI_SERVICE_PROVIDER="openai", OPENAI_API_KEY="key",
+                        AI_CACHE_ENABLED=False, AI_STREAMING_ENABLED=False):
+        service = AIService()
+
+    async def use_and_close():
+        client = service._get_async_client()
+        assert service._get_async_client() is client
+        await service.aclose()
+        return client
+
+    first = asyncio.run(use_and_close())
+    assert first.is_closed()
+    assert asyncio.run(use_and_close()) is not first
+
+
+def test_each_event_loop_keeps_its_own_client_until_it_closes_it():
+    with patch.multiple("config.settings", AI_SERVICE_PROVIDER="openai", OPENAI_API_KEY="key",
+                        AI_CACHE_ENABLED=False, AI_STREAMING_ENABLED=False):
+        service = AIService()
+    both_open, first_closed = threading.Barrier(2, timeout=5), threading.Barrier(2, timeout=5)
+    clients, errors = {}, []
+
+    def ticket(name):
+        async def run():
+            client = clients[name] = service._get_async_client()
+            both_open.wait()
+            if name == "b":
+                first_closed.wait()
+            # The other worker's loop opening or closing its client leaves this one alone.
+            assert service._get_async_client() is client and not client.is_closed()
+            await service.aclose()
+            if name == "a":
+                first_closed.wait()
+        try:
+            asyncio.run(run())
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=ticket, args=(name,)) for name in ("a", "b")]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert errors == []
+    assert clients["a"] is not clients["b"]
+    assert clients["a"].is_closed() and clients["b"].is_closed()
+    assert service._async_clients == {}
@@ -0,0 +1,88 @@
+import json
+from unittest.mock import Mock, patch
+from services.diff_chunker import chunk_diff, split_diff_files
+from services.token_utils import estimate_tokens
+from services.ai_service import AIService
+
+
+def make_file(name, hunks=1, lines_per_hunk=10):
+    text = f"diff --git a/{name} b/{name}\n--- a/{name}\n+++ b/{name}\n"
+    for h in range(hunks):
+        text += f"@@ -{h * 100},{lines_per_hunk} +{h * 100},{lines_per_hunk} @@\n"
+        text += "".join(f"+line {i} of {name}\n" for i in range(lines_per_hunk))
+    return text
+
+
+def test_small_diff_is_not_split():
+    diff = make_file("a.py")
+    assert chunk_diff(diff, 10_000) == [diff]
+
+
+def test_split_diff_files_handles_gitlab_style_headers():
+    diff = "--- a/x.py\n+++ b/x.py\n@@ -1 +1 @@\n-a\n+b\n--- a/y.py\n+++ b/y.py\n@@ -1 +1 @@\n-c\n+d\n"
+    preamble, files = split_diff_files(diff)
+    assert preamble == ""
+    assert [header for header, _ in files] == ["--- a/x.py\n+++ b/x.py\n", "--- a/y.py\n+++ b/y.py\n"]
+
+
+def test_chunks_respect_budget_and_file_boundaries():
+    files = [make_file(f"f{i}.py") for i in range(6)]
+    diff = "commit abc\nAuthor: dev\n\n" + "".join(files)
+    budget = estimate_tokens(files[0]) * 2 + 20
+
+    chunks = chunk_diff(diff, budget)
+
+    assert len(chunks) == 3
+    assert all(estimate_tokens(chunk) <= budget for chunk in chunks)
+    assert "".join(chunks) == diff
+
+
+def test_oversized_file_is_split_at_hunks_with_repeated_header():
+    diff = make_file("big.py", hunks=4)
+    header = "diff --git a/big.py b/big.py\n--- a/big.py\n+++ b/big.py\n"
+    budget = estimate_tokens(header) + 60
+
+    chunks = chunk_diff(diff, budget)
+
+    assert len(chunks) == 4
+    assert all(chunk.startswith(header) for chunk in chunks)
+
+
+def test_chunk_results_are_merged_and_capped(tmp_path):
+    with patch.multiple("config.settings", AI_SERVICE_PROVIDER="openai", OPENAI_API_KEY="key",
+                        AI_CACHE_ENABLED=False, AI_MAX_ISSUES=5):
+        service = AIService()
+        chunk_results = [
+            {"change_summary": "Part 1", "conclusion": "NAIK STAGING",
+             "analysis": {"perubahan_diperlukan": [{"file": "a", "comment": f"[COMPLIANCE] c{i}"} for i in range(4)],
+                          "sudah_baik": [{"file": "a", "comment": "ok"}]}},
+            {"change_summary": "Part 2", "conclusion": "REVISI",
+             "analysis": {"perubahan_diperlukan": [{"file": "b", "comment": "[SECURITY] sql injection"},
+                                                   {"file": "b", "comment": "[BUG] npe"}],
+                          "sudah_baik": [{"file": "a", "comment": "ok"}]}},
+        ]
+        merged = service._merge_chunk_results(chunk_results)
+
+    issues = merged["analysis"]["perubahan_diperlukan"]
+    assert len(issues) == 5
+    assert issues[0]["comment"] == "[SECURITY] sql injection"
+    assert issues[1]["comment"] == "[BUG] npe"
+    assert merged["analysis"]["sudah_baik"] == [{"file": "a", "comment": "ok"}]
+    assert merged["conclusion"] == "REVISI"
+    assert merged["change_summary"] == "Part 1\nPart 2"
+
+
+def test_large_diff_is_analyzed_per_chunk():
+    with patch.multiple("config.settings", AI_SERVICE_PROVIDER="openai", OPENAI_API_KEY="key",
+                        AI_CACHE_ENABLED=False, AI_CHUNK_TOKEN_BUDGET=100, AI_CHUNK_CONCURRENCY=2,
+                        AI_STREAMING_ENABLED=False):
+        service = AIService()
+        service.client = Mock()
+        service.client.chat.completions.create.return_value = Mock(choices=[Mock(message=Mock(content=json.dumps(
+            {"change_summary": "s", "analysis": {"perubahan_diperlukan": [], "sudah_baik": []},
+             "conclusion": "NAIK STAGING"})))])
+
+        result = service.analyze_code_diff("".join(make_file(f"f{i}.py") for i in range(4)))
+
+    assert service.client.chat.completions.create.call_count == 4
+    assert result["conclusion"] == "NAIK STAGING"
@@ -1,9 +1,12 @@
+import contextlib
+import io
 import pytest
 import os
 import sys
 import shutil
+import subprocess
 from unittest.mock import Mock, patch
-from main import DiffFetcher
+from services.diff_fetcher import DiffFetcher
 from services.gitlab_service import GitLabService
 from services.git_service import GitService
 from config import settings
@@ -28,6 +31,7 @@ def gitlab_service_mock():
 def git_service_mock():
     """Mock for GitService."""
     mock = Mock(spec=GitService)
+    mock.mirror_lock.side_effect = lambda repo_url: contextlib.nullcontext(True)
     # Ensure cleanup is called
     yield mock
     if os.path.exists(settings.LOCAL_GIT_REPO_PATH):
@@ -104,7 +108,7 @@ def test_fetch_gitlab_mr_diff(diff_fetcher):
     diff = diff_fetcher.fetch_gitlab_mr_diff(mr_url)
 
     assert diff == expected_mr_diff
-    diff_fetcher.gitlab_service.get_merge_request_diff.assert_called_once_with(mr_url)
+    diff_fetcher.gitlab_service.get_merge_request_diff.assert_called_once_with(mr_url, mr=None)
     diff_fetcher.git_service.clone_repository.assert_not_called() # Ensure local git is not used for MRs
     diff_fetcher.git_service.get_commit_diff.assert_not_called()
 
@@ -137,56 +141,217 @@ def test_get_repo_name_from_url_direct_repo_url_no_git(real_git_service):
     repo_name = real_git_service._get_repo_name_from_url(repo_url)
     assert repo_name == "another_project"
 
+def test_get_mirror_path_keyed_by_full_project_path(real_git_service):
+    path_a = real_git_service.get_mirror_path("https://gitlab.com/group-a/api/-/commit/abc123")
+    path_b = real_git_service.get_mirror_path("https://gitlab.com/group-b/api/-/merge_requests/7")
+    assert path_a == os.path.join(settings.LOCAL_GIT_REPO_PATH, "mirrors", "group-a", "api.git")
+    assert path_b == os.path.join(settings.LOCAL_GIT_REPO_PATH, "mirrors", "group-b", "api.git")
+
 @patch('subprocess.run')
 def test_clone_repository_new_clone(mock_subprocess_run, real_git_service):
-    mock_subprocess_run.return_value = Mock(stdout="Cloned successfully", stderr="", returncode=0)
+    mock_subprocess_run.return_value = Mock(stdout="", stderr="Cloning into bare repository", returncode=0)
     repo_url = "https://gitlab.com/test_group/test_project.git"
     
     with patch('os.path.exists', return_value=False): # Simulate repo not existing
         repo_path = real_git_service.clone_repository(repo_url)
-        assert repo_path == os.path.join(settings.LOCAL_GIT_REPO_PATH, "test_project")
-        mock_subprocess_run.assert_called_with(
-            ['git', 'clone', repo_url, repo_path],
-            cwd=settings.LOCAL_GIT_REPO_PATH,
-            capture_output=True, text=True, check=True
-        )
+        assert repo_path == os.path.join(settings.LOCAL_GIT_REPO_PATH, "mirrors", "test_group", "test_project.git")
+        clone_call, config_call = mock_subprocess_run.call_args_list
+        assert clone_call.args[0] == ['git', 'clone', '--bare', '--filter=blob:none', repo_url, repo_path]
+        assert clone_call.kwargs['cwd'] == settings.LOCAL_GIT_REPO_PATH
+        assert config_call.args[0] == ['git', 'config', 'remote.origin.fetch', '+refs/heads/*:refs/heads/*']
 
 @patch('subprocess.run')
-def test_clone_repository_existing_pull(mock_subprocess_run, real_git_service):
-    mock_subprocess_run.return_value = Mock(stdout="Already up to date", stderr="", returncode=0)
+def test_clone_repository_existing_mirror_is_reused(mock_subprocess_run, real_git_service):
     repo_url = "https://gitlab.com/test_group/test_project.git"
-    repo_name = real_git_service._get_repo_name_from_url(repo_url)
-    repo_path = os.path.join(settings.LOCAL_GIT_REPO_PATH, repo_name)
+    repo_path = real_git_service.get_mirror_path(repo_url)
+    os.makedirs(repo_path) # Simulate mirror existing
     
-    with patch('os.path.exists', return_value=True): # Simulate repo existing
-        with patch('shutil.rmtree') as mock_rmtree:
-            repo_path_result = real_git_service.clone_repository(repo_url)
-            assert repo_path_result == repo_path
-            mock_subprocess_run.assert_called_with(
-                ['git', 'pull'],
-                cwd=repo_path,
-                capture_output=True, text=True, check=True
-            )
-            mock_rmtree.assert_not_called() # Should not remove for pull
+    with patch('shutil.rmtree') as mock_rmtree:
+        repo_path_result = real_git_service.clone_repository(repo_url)
+        assert repo_path_result == repo_path
+        mock_subprocess_run.assert_not_called() # No pull: commits are fetched by SHA on demand
+        mock_rmtree.assert_not_called()
+
+def fake_popen(stdout, returncode=0):
+    """A subprocess.Popen stand-in for streamed git commands that prints `stdout`."""
+    def popen(*args, **kwargs):
+        process = Mock(returncode=returncode)
+        process.stdout = io.StringIO(stdout)
+        process.poll.return_value = returncode
+        process.wait.return_value = returncode
+        return process
+    return Mock(side_effect=popen)
 
 @patch('subprocess.run')
 def test_get_commit_diff_success(mock_subprocess_run, real_git_service):
-    expected_diff = "some diff content"
-    # The sequence of git commands: fetch, cat-file -t, show
+    expected_diff = "some diff content\n"
+    # The sequence of git commands: cat-file -t (missing), fetch <sha>, cat-file -t, then show (streamed)
     mock_subprocess_run.side_effect = [
-        Mock(stdout="Fetched origin", stderr="", returncode=0), # For git fetch origin
+        subprocess.CalledProcessError(128, "git cat-file", stderr="fatal: Not a valid object name"),
+        Mock(stdout="", stderr="", returncode=0), # For git fetch origin <commit_sha>
         Mock(stdout="commit", stderr="", returncode=0), # For git cat-file -t <commit_sha>
-        Mock(stdout=expected_diff, stderr="", returncode=0) # For git show <commit_sha> --patch
     ]
     repo_path = os.path.join(settings.LOCAL_GIT_REPO_PATH, "project") # Use os.path.join for consistency
-    commit_sha = "abcdef12345"
+    commit_sha = "c7ffb5ffa55bb5d437b67780d1138033f01e7a20"
 
-    with patch('os.path.exists', return_value=True): # Simulate repo path existing
+    with patch('os.path.exists', return_value=True), \
+         patch('subprocess.Popen', fake_popen(expected_diff)) as mock_popen: # Simulate repo path existing
         diff = real_git_service.get_commit_diff(repo_path, commit_sha)
         assert diff == expected_diff
         # Assert calls in sequence
-        calls = mock_subprocess_run.call_args_list
-        assert len(calls) == 3
-        calls[0].assert_called_with(['git', 'fetch', 'origin'], cwd=repo_path, capture_output=True, text=True, check=True)
-        calls[1].assert_called_with(['git', 'cat-file', '-t', commit_sha], cwd=repo_path, capture_output=True, text=True, check=True)
-        calls[2].assert_called_with(['git', 'show', commit_sha, '--patch'], cwd=repo_path, capture_output=True, text=True, check=True)
\ No newline at end of file
+        commands = [c.args[0] for c in mock_subprocess_run.call_args_list]
+        assert commands == [
+            ['git', 'cat-file', '-t', commit_sha],
+            ['git', 'fetch', '--no-tags', 'origin', commit_sha],
+            ['git', 'cat-file', '-t', commit_sha],
+        ]
+        assert mock_popen.call_args.args[0] == ['git', 'show', commit_sha, '--patch']
+
+@patch('subprocess.run')
+def test_get_commit_diff_skips_fetch_when_commit_is_local(mock_subprocess_run, real_git_service):
+    mock_subprocess_run.side_effect = [
+        Mock(stdout="commit", stderr="", returncode=0),
+    ]
+    with patch('os.path.exists', return_value=True), patch('subprocess.Popen', fake_popen("diff\n")):
+        assert real_git_service.get_commit_diff("repo", "abc123") == "diff\n"
+    assert mock_subprocess_run.call_count == 1
+
+def test_get_commit_diff_fails_when_git_exits_non_zero_after_partial_output(real_git_service):
+    """E.g. a lazy blob fetch failing halfway through 'git show' in a blobless mirror."""
+    with patch.object(real_git_service, "_execute_git_command", return_value="commit"), \
+         patch('os.path.exists', return_value=True), patch('subprocess.Popen', fake_popen("+partial\n", returncode=128)):
+        assert real_git_service.get_commit_diff("repo", "abc123") is None
+        assert real_git_service._local_diff("repo", "abc12345", "def456") is None
+
+@patch('config.settings.DIFF_MAX_LINES', 3)
+def test_get_commit_diff_is_truncated_at_line_cap(real_git_service):
+    patch_text = "".join(f"+line {i}\n" for i in range(10))
+    with patch.object(real_git_service, "_execute_git_command", return_value="commit"), \
+         patch('os.path.exists', return_value=True), patch('subprocess.Popen', fake_popen(patch_text)):
+        diff = real_git_service.get_commit_diff("repo", "abc123")
+    assert diff.startswith("+line 0\n+line 1\n+line 2\n")
+    assert "+line 3" not in diff
+    assert "diff truncated: more than 3 lines" in diff
+
+def test_get_commit_diff_from_blobless_mirror(tmp_path, real_git_service):
+    """End to end against real git: only the requested commit is fetched into a bare partial clone."""
+    def git(*args, cwd):
+        return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+    origin = tmp_path / "origin"
+    origin.mkdir()
+    git("init", "-q", cwd=origin)
+    git("config", "uploadpack.allowFilter", "true", cwd=origin)
+    (origin / "app.py").write_text("a = 1\n")
+    git("add", ".", cwd=origin)
+    git("-c", "user.name=dev", "-c", "user.email=dev@example.com", "commit", "-qm", "one", cwd=origin)
+    mirror = tmp_path / "mirror.git"
+    git("clone", "-q", "--bare", "--filter=blob:none", origin.as_uri(), str(mirror), cwd=tmp_path)
+
+    (origin / "app.py").write_text("a = 2\n")
+    git("-c", "user.name=dev", "-c", "user.email=dev@example.com", "commit", "-qam", "two", cwd=origin)
+    new_sha = git("rev-parse", "HEAD", cwd=origin)
+
+    diff = real_git_service.get_commit_diff(str(mirror), new_sha)
+
+    assert "-a = 1" in diff and "+a = 2" in diff
+    assert not (mirror / "app.py").exists()
+
+def test_get_commit_diffs_batches_commits_of_one_repository(tmp_path, real_git_service):
+    """One fetch, one cat-file --batch-check pass and one git log for many commits; diffs match git show."""
+    def git(*args, cwd):
+        return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+    origin = tmp_path / "origin"
+    origin.mkdir()
+    git("init", "-q", cwd=origin)
+    git("config", "uploadpack.allowFilter", "true", cwd=origin)
+    git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=origin)
+    shas = []
+    for i in range(3):
+        (origin / "app.py").write_text(f"a = {i}\ncommit {i}\n")
+        git("add", ".", cwd=origin)
+        git("-c", "user.name=dev", "-c", "user.email=dev@example.com", "commit", "-qm", f"change {i}", cwd=origin)
+        shas.append(git("rev-parse", "HEAD", cwd=origin))
+    mirror = tmp_path / "mirror.git"
+    git("clone", "-q", "--bare", "--filter=blob:none", origin.as_uri(), str(mirror), cwd=tmp_path)
+    (origin / "app.py").write_text("a = 3\n")
+    git("-c", "user.name=dev", "-c", "user.email=dev@example.com", "commit", "-qam", "change 3", cwd=origin)
+    shas.append(git("rev-parse", "HEAD", cwd=origin)) # Not in the mirror yet
+
+    requested = shas + [shas[0][:10]]
+    with patch.object(real_git_service, "_execute_git_command", wraps=real_git_service._execute_git_command) as execute, \
+         patch.object(real_git_service, "_stream_git_command", wraps=real_git_service._stream_git_command) as stream:
+        diffs = real_git_service.get_commit_diffs(str(mirror), requested)
+
+    commands = [c.args[0][0] for c in execute.call_args_list + stream.call_args_list]
+    assert commands == ["cat-file", "fetch", "cat-file", "log"]
+    assert set(diffs) == set(shas) | {shas[0][:10]}
+    for sha in shas:
+        assert diffs[sha] == git("show", sha, "--patch", cwd=mirror)
+    assert diffs[shas[0][:10]] == diffs[shas[0]]
+
+def test_prefetch_commit_diffs_groups_urls_by_project(diff_fetcher, git_service_mock):
+    urls = [
+        "https://gitlab.com/group/api/-/commit/aaa111",
+        "https://gitlab.com/group/api/-/commit/bbb222",
+        "https://gitlab.com/group/web/-/commit/ccc333",
+    ]
+    git_service_mock._get_project_path_from_url.side_effect = lambda url: url.split("/-/")[0].split("gitlab.com/")[1]
+    diff_fetcher.gitlab_service._parse_commit_sha_from_url.side_effect = lambda url: url.rsplit("/", 1)[1]
+    git_service_mock.clone_repository.return_value = "mirrors/group/api.git"
+    git_service_mock.get_commit_diffs.return_value = {"aaa111": "diff a", "bbb222": "diff b"}
+
+    assert diff_fetcher.prefetch_commit_diffs(urls) == 2
+
+    git_service_mock.get_commit_diffs.assert_called_once_with("mirrors/group/api.git", ["aaa111", "bbb222"])
+    assert diff_fetcher.fetch_commit_diff(urls[1]) == "diff b"
+    assert diff_fetcher.fetch_commit_diff(urls[0]) == "diff a"
+    git_service_mock.clone_repository.assert_called_once() # Only for the batch; web's commit isn't prefetched
+    git_service_mock.get_commit_diff.assert_not_called()
+
+def test_get_merge_request_diff_from_local_mirror(tmp_path, real_git_service):
+    """refs/merge-requests/<iid>/head is diffed against the merge base, in the GitLab API output format."""
+    def git(*args, cwd):
+        return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+    def commit(message):
+        git("add", ".", cwd=origin)
+        git("-c", "user.name=dev", "-c", "user.email=dev@example.com", "commit", "-qm", message, cwd=origin)
+        return git("rev-parse", "HEAD", cwd=origin)
+
+    origin = tmp_path / "origin"
+    origin.mkdir()
+    git("init", "-q", "-b", "main", cwd=origin)
+    git("config", "uploadpack.allowFilter", "true", cwd=origin)
+    git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=origin)
+    (origin / "app.py").write_text("a = 1\n")
+    base = commit("base")
+    mirror = tmp_path / "mirror.git"
+    git("clone", "-q", "--bare", "--filter=blob:none", origin.as_uri(), str(mirror), cwd=tmp_path)
+
+    git("checkout", "-qb", "feature", cwd=origin)
+    (origin / "app.py").write_text("a = 2\n")
+    (origin / "new.py").write_text("b = 1\n")
+    head = commit("feature")
+    git("update-ref", "refs/merge-requests/1/head", head, cwd=origin)
+    git("checkout", "-q", "main", cwd=origin)
+    (origin / "other.py").write_text("c = 1\n")
+    commit("main moves on") # Not part of the MR diff
+
+    expected = ("--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n-a = 1\n+a = 2\n\n"
+                "--- /dev/null\n+++ b/new.py\n@@ -0,0 +1 @@\n+b = 1\n\n")
+    assert real_git_service.get_merge_request_diff(str(mirror), 1, base_sha=base) == expected
+    assert real_git_service.get_merge_request_diff(str(mirror), 1) == expected
+
+def test_fetch_gitlab_mr_diff_uses_local_mirror_when_configured(diff_fetcher, git_service_mock):
+    mr_url = "https://gitlab.com/group/project/-/merge_requests/5"
+    diff_fetcher.gitlab_service._parse_mr_iid_from_url.return_value = 5
+    diff_fetcher.gitlab_service.get_merge_request.return_value = Mock(diff_refs={"base_sha": "b" * 40})
+    git_service_mock.clone_repository.return_value = "mirrors/group/project.git"
+    git_service_mock.get_merge_request_diff.return_value = "local mr diff"
+
+    with patch.multiple('config.settings', MR_DIFF_SOURCE="local", GIT_MIRROR_ENABLED=True):
+        assert diff_fetcher.fetch_gitlab_mr_diff(mr_url) == "local mr diff"
+
+    git_service_mock.get_merge_request_diff.assert_called_once_with("mirrors/group/project.git", 5, "b" * 40)
+    diff_fetcher.gitlab_service.get_merge_request_diff.assert_not_called()
@@ -0,0 +1,92 @@
+from services.diff_model import ParsedDiff
+from services.diff_pruner import DiffPruner
+from services.diff_stream import iter_gitlab_diff_lines, read_capped_diff
+
+GIT_DIFF = (
+    "commit abc\n"
+    "\n"
+    "    Change things\n"
+    "\n"
+    "diff --git a/app.py b/app.py\n"
+    "index 1111111..2222222 100644\n"
+    "--- a/app.py\n"
+    "+++ b/app.py\n"
+    "@@ -1,2 +1,2 @@\n"
+    " x = 1\n"
+    "-y = 2\n"
+    "+y = 3\n"
+    "@@ -10 +10,2 @@\n"
+    "+z = 4\n"
+    " w = 5\n"
+    "diff --git a/new.py b/new.py\n"
+    "new file mode 100644\n"
+    "--- /dev/null\n"
+    "+++ b/new.py\n"
+    "@@ -0,0 +1 @@\n"
+    "+print('hi')\n"
+    "diff --git a/old.py b/old.py\n"
+    "deleted file mode 100644\n"
+    "--- a/old.py\n"
+    "+++ /dev/null\n"
+    "@@ -1 +0,0 @@\n"
+    "-gone = True\n"
+    "diff --git a/a.txt b/b.txt\n"
+    "similarity index 100%\n"
+    "rename from a.txt\n"
+    "rename to b.txt\n"
+    "diff --git a/logo.png b/logo.png\n"
+    "Binary files a/logo.png and b/logo.png differ\n"
+)
+
+
+def test_parse_records_paths_change_types_and_ranges():
+    parsed = ParsedDiff.parse(GIT_DIFF)
+
+    assert parsed.preamble == "commit abc\n\n    Change things\n\n"
+    assert [(f.path, f.change_type) for f in parsed.files] == [
+        ("app.py", "modified"), ("new.py", "added"), ("old.py", "deleted"), ("b.txt", "renamed"), ("logo.png", "modified"),
+    ]
+    assert parsed.files[3].old_path == "a.txt"
+    assert parsed.files[4].binary
+    first, second = parsed.files[0].hunks
+    assert (first.old_start, first.old_count, first.new_start, first.new_count) == (1, 2, 1, 2)
+    assert (second.old_start, second.old_count, second.new_start, second.new_count) == (10, 1, 10, 2)
+    assert parsed.hunk_text(second) == "@@ -10 +10,2 @@\n+z = 4\n w = 5\n"
+    assert parsed.stats() == {"files": 5, "additions": 3, "deletions": 2}
+
+
+def test_render_round_trips_and_size_needs_no_rendering():
+    parsed = ParsedDiff.parse(GIT_DIFF)
+    assert parsed.render() == GIT_DIFF
+    assert len(parsed) == len(GIT_DIFF)
+
+
+def test_views_share_the_buffer():
+    parsed = ParsedDiff.parse(GIT_DIFF)
+    app = parsed.files[0]
+    view = parsed.select([app.with_hunks(app.hunks[1:])], preamble=False)
+
+    assert view.text is parsed.text
+    assert view.render() == "diff --git a/app.py b/app.py\nindex 1111111..2222222 100644\n--- a/app.py\n+++ b/app.py\n" \
+                            "@@ -10 +10,2 @@\n+z = 4\n w = 5\n"
+    assert len(view) == len(view.render())
+
+
+def test_gitlab_api_diffs_keep_change_types():
+    diffs = [
+        {"old_path": "a.py", "new_path": "a.py", "diff": "@@ -1 +1 @@\n-a\n+b\n"},
+        {"old_path": "n.py", "new_path": "n.py", "new_file": True, "diff": "@@ -0,0 +1 @@\n+n\n"},
+        {"old_path": "d.py", "new_path": "d.py", "deleted_file": True, "diff": "@@ -1 +0,0 @@\n-d\n"},
+    ]
+    parsed = ParsedDiff.parse(read_capped_diff(iter_gitlab_diff_lines(diffs)))
+    assert [(f.path, f.change_type) for f in parsed.files] == [("a.py", "modified"), ("n.py", "added"), ("d.py", "deleted")]
+
+
+def test_pruner_returns_a_view_for_parsed_input():
+    parsed = ParsedDiff.parse(GIT_DIFF)
+    pruned, report = DiffPruner(path_globs=["*.png"], path_regexes=[], drop_whitespace_only=True).prune(parsed)
+
+    assert isinstance(pruned, ParsedDiff) and pruned.text is parsed.text
+    assert [f.path for f in pruned.files] == ["app.py", "new.py", "old.py", "b.txt"]
+    assert report.removed_files == [("logo.png", "glob *.png")]
+    assert report.bytes_saved == len(GIT_DIFF) - len(pruned.render())
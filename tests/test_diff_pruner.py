@@ -0,0 +1,100 @@
+from services.diff_model import ParsedDiff
+from services.diff_pruner import DiffPruner
+
+
+def file_diff(path, body="@@ -1,2 +1,2 @@\n-old\n+new\n"):
+    return f"diff --git a/{path} b/{path}\nindex 111..222 100644\n--- a/{path}\n+++ b/{path}\n{body}"
+
+
+def make_pruner(**kwargs):
+    options = dict(path_globs=["package-lock.json", "*.min.js", "vendor/*"],
+                   path_regexes=[r"(^|/)generated/"], drop_whitespace_only=True)
+    options.update(kwargs)
+    return DiffPruner(**options)
+
+
+def test_prunes_lockfiles_vendored_and_generated_paths():
+    diff = (file_diff("src/app.py") + file_diff("package-lock.json") + file_diff("web/dist/app.min.js")
+            + file_diff("vendor/lib/x.go") + file_diff("api/generated/client.ts"))
+
+    pruned, report = make_pruner().prune(diff)
+
+    assert pruned == file_diff("src/app.py")
+    assert [path for path, _ in report.removed_files] == [
+        "package-lock.json", "web/dist/app.min.js", "vendor/lib/x.go", "api/generated/client.ts"]
+    assert report.bytes_saved == len(diff) - len(pruned)
+    assert report.tokens_saved > 0
+
+
+def test_prunes_binary_and_generated_marker_files():
+    binary = "diff --git a/logo.png b/logo.png\nindex 1..2 100644\nBinary files a/logo.png and b/logo.png differ\n"
+    generated = file_diff("model.go", "@@ -0,0 +1,2 @@\n+// Code generated by protoc-gen-go. DO NOT EDIT.\n+package model\n")
+
+    pruned, report = make_pruner().prune(file_diff("main.go") + binary + generated)
+
+    assert pruned == file_diff("main.go")
+    assert [rule for _, rule in report.removed_files] == ["binary", "generated"]
+
+
+def test_drops_whitespace_only_hunks_but_keeps_real_changes():
+    reformat = "@@ -1,2 +1,2 @@\n-if (x){\n-  y();\n+if (x) {\n+    y();\n"
+    change = "@@ -10 +10 @@\n-return a;\n+return b;\n"
+
+    pruned, report = make_pruner().prune(file_diff("App.java", reformat + change))
+
+    assert pruned == file_diff("App.java", change)
+    assert report.removed_hunks == 1
+
+
+def test_gitlab_style_diff_and_disabled_whitespace_rule():
+    diff = "--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n-x=1\n+x = 1\n--- a/yarn.lock\n+++ b/yarn.lock\n@@ -1 +1 @@\n-a\n+b\n"
+
+    pruned, report = make_pruner(path_globs=["yarn.lock"], drop_whitespace_only=False).prune(diff)
+
+    assert pruned == "--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n-x=1\n+x = 1\n"
+    assert report.removed_files == [("yarn.lock", "glob yarn.lock")]
+
+
+def test_generated_marker_must_be_a_header_comment_at_the_top_of_the_file():
+    entity = file_diff("User.java", "@@ -12,2 +12,4 @@\n @Id\n @GeneratedValue(strategy = GenerationType.IDENTITY)\n"
+                                    "+private String plainPassword;\n+// auto-generated getters below\n")
+    body = file_diff("schema.ts", "@@ -0,0 +1,2 @@\n+export const generated = 'Auto-generated';\n+// @generated\n")
+    header = file_diff("Api.java", "@@ -0,0 +1,2 @@\n+/* @generated by openapi-generator */\n+class Api {}\n")
+
+    pruned, report = make_pruner().prune(entity + body + header)
+
+    assert pruned == entity + body
+    assert report.removed_files == [("Api.java", "generated")]
+
+
+def test_reindented_python_and_yaml_are_not_whitespace_only():
+    dedent = "@@ -1,2 +1,2 @@\n for x in items:\n-    delete_all()\n+delete_all()\n"
+    spacing = "@@ -9 +9 @@\n-x=1\n+x = 1\n"
+    yaml = "@@ -1,2 +1,2 @@\n-  key: value\n+key: value\n"
+
+    pruned, report = make_pruner().prune(file_diff("jobs.py", dedent + spacing) + file_diff("ci.yml", yaml))
+
+    assert pruned == file_diff("jobs.py", dedent) + file_diff("ci.yml", yaml)
+    assert report.removed_hunks == 1
+
+
+def test_lines_are_compared_pairwise_like_git_diff_w():
+    joined = "@@ -1,2 +1 @@\n-foo\n-bar\n+foobar\n"
+
+    pruned, report = make_pruner().prune(file_diff("a.js", joined))
+
+    assert pruned == file_diff("a.js", joined)
+    assert report.removed_hunks == 0
+
+
+def test_git_show_diff_pruned_down_to_no_files_is_empty():
+    header = "commit abc123\nAuthor: Dev <dev@example.com>\n\n    Bump lockfile\n\n"
+    diff = header + file_diff("package-lock.json")
+
+    pruned, report = make_pruner().prune(diff)
+
+    assert pruned == ""
+    assert report.bytes_after == 0
+    assert not make_pruner().prune(ParsedDiff.parse(diff))[0]  # the pipeline's "empty" status
+    kept, _ = make_pruner().prune(header + file_diff("src/app.py") + file_diff("package-lock.json"))
+    assert kept == header + file_diff("src/app.py")
@@ -0,0 +1,74 @@
+from services.diff_stream import cap_lines, iter_file_patches, iter_gitlab_diff_lines, read_capped_diff
+
+GIT_DIFF = (
+    "commit abc\n"
+    "Author: dev\n"
+    "\n"
+    "diff --git a/a.py b/a.py\n"
+    "--- a/a.py\n"
+    "+++ b/a.py\n"
+    "@@ -1 +1 @@\n"
+    "-a = 1\n"
+    "+a = 2\n"
+    "diff --git a/b.py b/b.py\n"
+    "--- a/b.py\n"
+    "+++ b/b.py\n"
+    "@@ -1 +1 @@\n"
+    "-b = 1\n"
+    "+b = 2\n"
+)
+
+
+def test_iter_file_patches_yields_preamble_then_one_patch_per_file():
+    patches = list(iter_file_patches(GIT_DIFF.splitlines(keepends=True)))
+    assert len(patches) == 3
+    assert patches[0].startswith("commit abc")
+    assert patches[1].startswith("diff --git a/a.py") and "+a = 2" in patches[1]
+    assert patches[2].startswith("diff --git a/b.py")
+    assert "".join(patches) == GIT_DIFF
+
+
+def test_gitlab_diff_lines_match_the_previous_string_assembly():
+    diffs = [
+        {"old_path": "a.py", "new_path": "a.py", "diff": "@@ -1 +1 @@\n-a\n+b\n"},
+        {"old_path": "b.py", "new_path": "c.py", "diff": "@@ -1 +1 @@\n-x\n+y"},
+        {"old_path": "img.png", "new_path": "img.png", "diff": ""},
+    ]
+    expected = "".join(f"--- a/{d['old_path']}\n+++ b/{d['new_path']}\n{d['diff']}\n" for d in diffs)
+    assert read_capped_diff(iter_gitlab_diff_lines(diffs), 0, 0) == expected
+    assert len(list(iter_file_patches(iter_gitlab_diff_lines(diffs)))) == 3
+
+
+def test_byte_cap_keeps_whole_lines_and_adds_marker():
+    diff = read_capped_diff(GIT_DIFF.splitlines(keepends=True), max_bytes=60, max_lines=0)
+    kept, marker = diff.split("\n[... ", 1)
+    assert GIT_DIFF.startswith(kept) and kept.endswith("\n")
+    assert len(kept.encode()) <= 60
+    assert "diff truncated: more than 60 bytes" in marker
+
+
+def test_cap_stops_reading_the_source():
+    pages_read = []
+    def pages():
+        for page in range(100):
+            pages_read.append(page)
+            yield {"old_path": f"f{page}.py", "new_path": f"f{page}.py", "diff": "+x\n" * 10}
+
+    diff = read_capped_diff(iter_gitlab_diff_lines(pages()), max_bytes=0, max_lines=25)
+
+    assert len(pages_read) == 2
+    assert diff.count("+x\n") == 20
+    assert "more than 25 lines" in diff
+
+
+def test_cap_closes_the_producer():
+    closed = []
+    def producer():
+        try:
+            while True:
+                yield "+line\n"
+        finally:
+            closed.append(True)
+
+    assert len(list(cap_lines(producer(), max_bytes=0, max_lines=5))) == 6
+    assert closed == [True]
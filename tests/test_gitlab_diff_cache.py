@@ -0,0 +1,142 @@
+from unittest.mock import Mock, patch
+import pytest
+from services import gitlab_service as gitlab_service_module
+from services.gitlab_service import GitLabService
+
+FULL_SHA = "c7ffb5ffa55bb5d437b67780d1138033f01e7a20"
+
+
+@pytest.fixture
+def gitlab_service(tmp_path):
+    gitlab_service_module._project_ids.clear()
+    with patch('gitlab.Gitlab'), patch.multiple('config.settings', GITLAB_SERVER="https://gitlab.example.com/",
+                                                 DIFF_CACHE_ENABLED=True,
+                                                 DIFF_CACHE_PATH=str(tmp_path / "diff.sqlite3")):
+        service = GitLabService()
+        commit = Mock(id=FULL_SHA, short_id=FULL_SHA[:8])
+        commit.diff.return_value = [{'old_path': 'a.py', 'new_path': 'a.py', 'diff': '@@ -1 +1 @@\n-x\n+y'}]
+        service.client.projects.get.return_value.commits.get.return_value = commit
+        yield service
+
+
+def test_commit_diff_is_served_from_cache_without_network(gitlab_service):
+    url = f"https://gitlab.example.com/group/project/-/commit/{FULL_SHA}"
+
+    first = gitlab_service.get_commit_diff(url)
+    gitlab_service.client.projects.get.reset_mock()
+    second = gitlab_service.get_commit_diff(url)
+
+    assert first == second
+    assert "+++ b/a.py" in second
+    gitlab_service.client.projects.get.assert_not_called()
+
+
+def test_short_sha_is_resolved_once_and_remembered(gitlab_service):
+    short_url = f"https://gitlab.example.com/group/project/-/commit/{FULL_SHA[:8]}"
+    full_url = f"https://gitlab.example.com/group/project/-/commit/{FULL_SHA}"
+
+    gitlab_service.get_commit_diff(short_url)
+    gitlab_service.client.projects.get.reset_mock()
+
+    assert gitlab_service.get_commit_diff(short_url) == gitlab_service.get_commit_diff(full_url)
+    gitlab_service.client.projects.get.assert_not_called()
+
+
+def test_cache_is_keyed_by_project_path(gitlab_service):
+    gitlab_service.get_commit_diff(f"https://gitlab.example.com/group-a/api/-/commit/{FULL_SHA}")
+    gitlab_service.client.projects.get.reset_mock()
+    gitlab_service.get_commit_diff(f"https://gitlab.example.com/group-b/api/-/commit/{FULL_SHA}")
+
+    gitlab_service.client.projects.get.assert_called_once_with("group-b/api", lazy=True)
+
+
+def test_full_sha_commit_fetch_uses_lazy_handles(gitlab_service):
+    gitlab_service.get_commit_diff(f"https://gitlab.example.com/group/project/-/commit/{FULL_SHA}")
+
+    project = gitlab_service.client.projects.get.return_value
+    gitlab_service.client.projects.get.assert_called_once_with("group/project", lazy=True)
+    project.commits.get.assert_called_once_with(FULL_SHA, lazy=True)
+
+
+def test_project_id_learned_from_mr_is_reused(gitlab_service):
+    project = gitlab_service.client.projects.get.return_value
+    mr = project.mergerequests.get.return_value
+    mr.project_id = 42
+    mr.diff_refs = {'base_sha': 'b' * 40, 'head_sha': 'h' * 40}
+    gitlab_service.client.http_get.return_value = Mock(
+        json=Mock(return_value=[{'old_path': 'a', 'new_path': 'a', 'diff': '@@ -1 +1 @@\n-x\n+y'}]), headers={})
+
+    gitlab_service.get_merge_request_diff("https://gitlab.example.com/group/project/-/merge_requests/1")
+    gitlab_service.get_merge_request_diff("https://gitlab.example.com/group/project/-/merge_requests/2")
+
+    assert gitlab_service.client.projects.get.call_args_list[-1].args == (42,)
+    assert gitlab_service.client.projects.get.call_args_list[-1].kwargs == {"lazy": True}
+
+
+def test_mr_diff_pages_are_fetched_concurrently_and_kept_in_order(gitlab_service):
+    project = gitlab_service.client.projects.get.return_value
+    mr = project.mergerequests.get.return_value
+    mr.project_id, mr.iid = 42, 7
+    mr.diff_refs = {'base_sha': 'b' * 40, 'head_sha': 'h' * 40}
+
+    def http_get(path, query_data, raw):
+        page = query_data["page"]
+        entries = [{'old_path': f'p{page}.py', 'new_path': f'p{page}.py', 'diff': '@@ -1 +1 @@\n-x\n+y\n'}]
+        return Mock(json=Mock(return_value=entries), headers={"X-Total-Pages": "3"})
+    gitlab_service.client.http_get.side_effect = http_get
+
+    diff = gitlab_service.get_merge_request_diff("https://gitlab.example.com/group/project/-/merge_requests/7")
+
+    paths = [call.args[0] for call in gitlab_service.client.http_get.call_args_list]
+    assert set(paths) == {"/projects/42/merge_requests/7/diffs"}
+    assert sorted(call.kwargs["query_data"]["page"] for call in gitlab_service.client.http_get.call_args_list) == [1, 2, 3]
+    assert diff.index("p1.py") < diff.index("p2.py") < diff.index("p3.py")
+    mr.changes.assert_not_called()
+
+
+def test_compare_diff_is_straight_and_cached(gitlab_service):
+    project = gitlab_service.client.projects.get.return_value
+    project.encoded_id = 42
+    gitlab_service.client.http_get.return_value = {
+        'diffs': [{'old_path': 'a.py', 'new_path': 'a.py', 'diff': '@@ -1 +1 @@\n-x\n+y\n'}]}
+    url = "https://gitlab.example.com/group/project/-/merge_requests/3"
+
+    first = gitlab_service.get_compare_diff(url, 'a' * 40, 'b' * 40)
+    second = gitlab_service.get_compare_diff(url, 'a' * 40, 'b' * 40)
+
+    assert first == second == "--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n-x\n+y\n\n"
+    gitlab_service.client.http_get.assert_called_once_with(
+        "/projects/42/repository/compare", query_data={"from": 'a' * 40, "to": 'b' * 40, "straight": "true"})
+
+
+def test_commit_diff_failing_mid_pagination_is_not_returned_or_cached(gitlab_service):
+    import gitlab
+
+    def pages():
+        yield {'old_path': 'a.py', 'new_path': 'a.py', 'diff': '@@ -1 +1 @@\n-x\n+y'}
+        raise gitlab.exceptions.GitlabHttpError("502 Bad Gateway", response_code=502)
+
+    commit = gitlab_service.client.projects.get.return_value.commits.get.return_value
+    commit.diff.side_effect = lambda iterator: pages()
+    url = f"https://gitlab.example.com/group/project/-/commit/{FULL_SHA}"
+
+    assert gitlab_service.get_commit_diff(url) is None
+    assert gitlab_service._get_cached(gitlab_service._diff_cache_key("commit", "group/project", FULL_SHA)) is None
+
+
+def test_merge_request_lookup_survives_network_errors_and_is_reused_for_the_diff(gitlab_service):
+    import gitlab
+    import requests
+    url = "https://gitlab.example.com/group/project/-/merge_requests/7"
+    mergerequests = gitlab_service.client.projects.get.return_value.mergerequests
+    mergerequests.get.side_effect = requests.ConnectionError("connection reset")
+
+    assert gitlab_service.get_merge_request(url) is None
+    assert gitlab_service.get_merge_request_refs(url) is None
+
+    mr = Mock(project_id=42, iid=7, diff_refs={'base_sha': 'a' * 40, 'head_sha': 'b' * 40})
+    mr.changes.return_value = {'changes': []}
+    gitlab_service.client.http_get.side_effect = gitlab.exceptions.GitlabHttpError("404", response_code=404)
+    mergerequests.get.reset_mock()
+    gitlab_service.get_merge_request_diff(url, mr=mr)
+    mergerequests.get.assert_not_called()
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+import pytest
+from services.ai_service import AIService
+from services.hedging import LatencyTracker, hedged_call, hedged_call_async, register_cancel
+from services.run_report import RunReport
+
+RESULT = {"change_summary": "s", "analysis": {}, "conclusion": "NAIK STAGING"}
+
+
+def is_valid(result):
+    return result != "invalid"
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        yield pool
+
+
+def test_fast_primary_is_not_hedged(executor):
+    secondary = Mock(return_value="secondary")
+    assert hedged_call(lambda: "primary", secondary, 5, is_valid, executor) == ("primary", 0, False)
+    secondary.assert_not_called()
+
+
+def test_slow_primary_is_hedged_and_cancelled(executor):
+    released = threading.Event()
+
+    def slow_primary():
+        register_cancel(released.set)
+        released.wait(timeout=5)
+        return "primary"
+
+    result = hedged_call(slow_primary, lambda: "secondary", 0.05, is_valid, executor)
+
+    assert result == ("secondary", 1, True)
+    assert released.wait(timeout=1)
+
+
+def test_invalid_primary_is_hedged_at_once(executor):
+    started = time.monotonic()
+    assert hedged_call(lambda: "invalid", lambda: "secondary", 5, is_valid, executor) == ("secondary", 1, True)
+    assert time.monotonic() - started < 1
+
+
+def test_invalid_answers_are_returned_when_nothing_is_valid(executor):
+    def failing():
+        raise RuntimeError("down")
+
+    assert hedged_call(lambda: "invalid", failing, 0, is_valid, executor) == ("invalid", None, True)
+    with pytest.raises(RuntimeError):
+        hedged_call(failing, failing, 0, is_valid, executor)
+
+
+def test_async_hedge_cancels_the_losing_task():
+    cancelled = []
+
+    async def slow_primary():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def secondary():
+        return "secondary"
+
+    assert asyncio.run(hedged_call_async(slow_primary, secondary, 0.05, is_valid)) == ("secondary", 1, True)
+    assert cancelled == [True]
+
+
+def test_latency_percentile_needs_enough_samples():
+    tracker = LatencyTracker()
+    for seconds in range(1, 11):
+        tracker.add(float(seconds))
+    assert tracker.percentile(90, min_samples=20) is None
+    assert tracker.percentile(90) == 9.0
+
+
+def completion(content):
+    return Mock(choices=[Mock(message=Mock(content=content))], usage=None)
+
+
+def test_ai_service_reports_hedges_and_wins(tmp_path):
+    report = RunReport(str(tmp_path / "report.jsonl"))
+    with patch.multiple("config.settings", AI_SERVICE_PROVIDER="openai", OPENAI_API_KEY="key",
+                        AI_CACHE_ENABLED=False, AI_STREAMING_ENABLED=False, AI_HEDGE_ENABLED=True,
+                        AI_HEDGE_PROVIDER="openai", AI_HEDGE_MODEL_NAME="backup-model"):
+        service = AIService(run_report=report)
+    released = threading.Event()
+
+    def slow_create(**kwargs):
+        released.wait(timeout=5)
+        return completion(json.dumps(RESULT))
+    service.client = Mock()
+    service.client.chat.completions.create.side_effect = slow_create
+    service.hedge.client = Mock()
+    service.hedge.client.chat.completions.create.return_value = completion(json.dumps(RESULT))
+
+    with patch.multiple("config.settings", AI_HEDGE_MIN_DELAY=0.05):
+        assert service.analyze_code_diff("diff --git a/x b/x") == RESULT
+    released.set()
+
+    totals = report.write_run_summary()
+    assert totals["hedge"] == {"calls": 1, "hedged": 1, "hedge_wins": 1, "hedge_rate": 1.0, "hedge_win_rate": 1.0}
+    record = json.loads((tmp_path / "report.jsonl").read_text().splitlines()[0])
+    assert record["model"] == "backup-model"
+
+
+def test_lost_legs_stop_before_sending_and_are_reported_once_they_sent(executor):
+    from services.hedging import begin_send, cancellable_sleep
+    lost = []
+    finished = threading.Event()
+
+    def waiting_primary():
+        # E.g. waiting for a limiter slot or in a retry backoff when the hedge wins.
+        cancellable_sleep(5)
+        begin_send()
+        return "primary"
+
+    started = time.monotonic()
+    result = hedged_call(waiting_primary, lambda: "secondary", 0.05, is_valid, executor,
+                         on_lost=lambda leg, response, error: lost.append((leg, response)))
+    assert result == ("secondary", 1, True)
+    executor.shutdown(wait=True)
+    assert time.monotonic() - started < 1
+    assert lost == []  # never sent, never billed
+
+    def sent_primary():
+        begin_send()
+        finished.wait(timeout=5)
+        return "primary"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        hedged_call(sent_primary, lambda: "secondary", 0.05, is_valid, pool,
+                    on_lost=lambda leg, response, error: lost.append((leg, response)))
+        finished.set()
+    assert lost == [(0, "primary")]
+
+
+def test_hedge_answer_is_cached_under_the_hedge_key_and_loser_usage_is_reported(tmp_path):
+    report = RunReport(str(tmp_path / "report.jsonl"))
+    with patch.multiple("config.settings", AI_SERVICE_PROVIDER="openai", OPENAI_API_KEY="key",
+                        AI_CACHE_ENABLED=True, AI_CACHE_PATH=str(tmp_path / "ai.sqlite3"),
+                        AI_STREAMING_ENABLED=False, AI_HEDGE_ENABLED=True,
+                        AI_HEDGE_PROVIDER="openai", AI_HEDGE_MODEL_NAME="backup-model"):
+        service = AIService(run_report=report)
+    released = threading.Event()
+    primary_done = threading.Event()
+
+    def slow_create(**kwargs):
+        released.wait(timeout=5)
+        primary_done.set()
+        return completion(json.dumps(RESULT))
+    service.client = Mock()
+    service.client.chat.completions.create.side_effect = slow_create
+    service.hedge.client = Mock()
+    service.hedge.client.chat.completions.create.return_value = completion(json.dumps(RESULT))
+    diff = "diff --git a/x b/x"
+
+    with patch.multiple("config.settings", AI_HEDGE_MIN_DELAY=0.05):
+        assert service.analyze_code_diff(diff) == RESULT
+    released.set()
+    assert primary_done.wait(timeout=5)
+    service._hedge_executor.shutdown(wait=True)
+
+    assert service.cache.get(service._cache_key(diff)) is None
+    assert json.loads(service.cache.get(service.hedge._cache_key(diff))) == RESULT
+    # The primary's lost race still counts, as a lower bound of its latency.
+    assert service._latencies.percentile(50) >= 0.05
+    records = [json.loads(line) for line in (tmp_path / "report.jsonl").read_text().splitlines()]
+    calls = [record for record in records if record["type"] == "llm_call"]
+    assert [(call["model"], call.get("hedge_lost", False)) for call in calls] == [
+        ("backup-model", False), (service.model_name, True)]
@@ -0,0 +1,28 @@
+from unittest.mock import patch
+from services.http_transport import httpx_client, requests_session, requests_timeout
+
+
+def test_requests_session_pool_is_sized_from_settings():
+    with patch('config.settings.HTTP_POOL_SIZE', 24):
+        session = requests_session()
+
+    adapter = session.get_adapter("https://jira.example.com/rest/api/2/issue/T-1")
+    assert adapter._pool_connections == 24
+    assert adapter._pool_maxsize == 24
+    assert session.get_adapter("http://gitlab.example.com/") is adapter
+
+
+def test_requests_timeout_is_connect_and_read():
+    with patch.multiple('config.settings', HTTP_CONNECT_TIMEOUT=5.0, HTTP_READ_TIMEOUT=90.0):
+        assert requests_timeout() == (5.0, 90.0)
+
+
+def test_httpx_client_falls_back_to_http1_without_h2():
+    with patch.multiple('config.settings', HTTP2_ENABLED=True, HTTP_POOL_SIZE=8, HTTP_CONNECT_TIMEOUT=3.0), \
+            patch.dict('sys.modules', {'h2': None}):
+        client = httpx_client()
+
+    assert client.timeout.connect == 3.0
+    assert client._transport._pool._http2 is False
+    assert client._transport._pool._max_connections == 8
+    client.close()
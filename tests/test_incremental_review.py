@@ -0,0 +1,88 @@
+from unittest.mock import Mock
+import pytest
+from main import extract_reviewed_heads, format_comment, main_workflow
+
+MR_URL = "https://gitlab.example.com/group/project/-/merge_requests/3"
+OLD_HEAD = "a" * 40
+NEW_HEAD = "b" * 40
+ANALYSIS = {"change_summary": "s", "analysis": {}, "conclusion": "NAIK STAGING"}
+
+
+@pytest.fixture
+def make_services(workflow_services):
+    def make(comments, head_sha):
+        workflow_services.jira.get_ticket_details.return_value.fields.comment.comments = [
+            Mock(body=body) for body in comments]
+        workflow_services.gitlab.get_merge_request.return_value.diff_refs = {"head_sha": head_sha}
+        return workflow_services
+    return make
+
+
+def test_review_comment_records_the_reviewed_head():
+    comment = format_comment(ANALYSIS, MR_URL, "dev", head_sha=OLD_HEAD)
+    assert extract_reviewed_heads([comment]) == {MR_URL: OLD_HEAD}
+
+
+def test_latest_review_wins():
+    comments = [format_comment(ANALYSIS, MR_URL, "dev", head_sha=OLD_HEAD),
+                format_comment(ANALYSIS, MR_URL, "dev", head_sha=NEW_HEAD, base_sha=OLD_HEAD)]
+    assert extract_reviewed_heads(comments) == {MR_URL: NEW_HEAD}
+
+
+def test_new_mr_review_records_its_head(make_services):
+    services = make_services([f"Please review {MR_URL}"], OLD_HEAD)
+
+    main_workflow("T-1", services)
+
+    # The MR is looked up once, for its head and then for its diff.
+    services.gitlab.get_merge_request.assert_called_once_with(MR_URL)
+    services.diff_fetcher.fetch_gitlab_mr_diff.assert_called_once_with(
+        MR_URL, mr=services.gitlab.get_merge_request.return_value)
+    posted = services.jira.post_comment.call_args.args[1]
+    assert extract_reviewed_heads([posted]) == {MR_URL: OLD_HEAD}
+    assert "Review inkremental" not in posted
+
+
+def test_pushed_mr_is_re_reviewed_incrementally(make_services):
+    services = make_services([f"Please review {MR_URL}", format_comment(ANALYSIS, MR_URL, "dev", head_sha=OLD_HEAD)],
+                             NEW_HEAD)
+
+    main_workflow("T-1", services)
+
+    services.diff_fetcher.fetch_mr_delta_diff.assert_called_once_with(MR_URL, OLD_HEAD, NEW_HEAD)
+    services.diff_fetcher.fetch_gitlab_mr_diff.assert_not_called()
+    services.ai.analyze_code_diff_async.assert_awaited_once_with("delta diff", ticket_id="T-1")
+    posted = services.jira.post_comment.call_args.args[1]
+    assert "Review inkremental" in posted
+    assert extract_reviewed_heads([posted]) == {MR_URL: NEW_HEAD}
+
+
+def test_unchanged_mr_is_not_reviewed_again(make_services):
+    services = make_services([f"Please review {MR_URL}", format_comment(ANALYSIS, MR_URL, "dev", head_sha=OLD_HEAD)],
+                             OLD_HEAD)
+
+    main_workflow("T-1", services)
+
+    services.ai.analyze_code_diff_async.assert_not_awaited()
+    services.jira.post_comment.assert_not_called()
+
+
+def test_failed_delta_falls_back_to_full_review(make_services):
+    services = make_services([f"Please review {MR_URL}", format_comment(ANALYSIS, MR_URL, "dev", head_sha=OLD_HEAD)],
+                             NEW_HEAD)
+    services.diff_fetcher.fetch_mr_delta_diff.return_value = None
+
+    main_workflow("T-1", services)
+
+    services.ai.analyze_code_diff_async.assert_awaited_once_with("full diff", ticket_id="T-1")
+    assert "Review inkremental" not in services.jira.post_comment.call_args.args[1]
+
+
+def test_failed_post_does_not_transition_the_ticket(make_services):
+    services = make_services([f"Please review {MR_URL}"], OLD_HEAD)
+    services.jira.post_comment.return_value = None
+
+    main_workflow("T-1", services)
+
+    services.jira.post_comment.assert_called_once()
+    services.jira.transition_ticket_status.assert_not_called()
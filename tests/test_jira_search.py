@@ -0,0 +1,69 @@
+from unittest.mock import Mock, patch
+import pytest
+from services.jira_service import JiraService
+
+
+class Page(list):
+    def __init__(self, issues, total, next_page_token=None):
+        super().__init__(issues)
+        self.total = total
+        self.nextPageToken = next_page_token
+
+
+def make_issue(key):
+    issue = Mock()
+    issue.key = key
+    return issue
+
+
+@pytest.fixture
+def jira_service():
+    with patch.multiple('config.settings', JIRA_SEARCH_PAGE_SIZE=2, JIRA_SEARCH_CONCURRENCY=3,
+                        JIRA_ISSUE_FIELDS=["assignee", "comment", "status"]):
+        service = JiraService()
+        service._client = Mock(_is_cloud=False)
+        yield service
+
+
+def test_search_issues_fetches_all_pages_with_minimal_fields(jira_service):
+    issues = [make_issue(f"PROJ-{i}") for i in range(5)]
+    jira_service.client.search_issues.side_effect = \
+        lambda jql, startAt, maxResults, fields: Page(issues[startAt:startAt + maxResults], len(issues))
+
+    found = jira_service.search_issues("project = PROJ")
+
+    assert [issue.key for issue in found] == [f"PROJ-{i}" for i in range(5)]
+    calls = jira_service.client.search_issues.call_args_list
+    assert sorted(call.kwargs["startAt"] for call in calls) == [0, 2, 4]
+    assert all(call.kwargs["fields"] == "assignee,comment,status" for call in calls)
+
+
+def test_searched_issues_are_not_fetched_again(jira_service):
+    issue = make_issue("PROJ-1")
+    jira_service.client.search_issues.return_value = Page([issue], 1)
+
+    jira_service.search_issues("project = PROJ")
+
+    assert jira_service.get_ticket_details("PROJ-1") is issue
+    jira_service.client.issue.assert_not_called()
+    jira_service.get_ticket_details("PROJ-1")
+    jira_service.client.issue.assert_called_once_with("PROJ-1", fields="assignee,comment,status")
+
+
+def test_search_issues_on_jira_cloud_follows_next_page_tokens(jira_service):
+    issues = [make_issue(f"PROJ-{i}") for i in range(5)]
+    jira_service.client._is_cloud = True
+
+    def enhanced_search(jql, nextPageToken, maxResults, fields):
+        start = int(nextPageToken or 0)
+        end = start + maxResults
+        # On Cloud, total is only the page length.
+        return Page(issues[start:end], len(issues[start:end]), str(end) if end < len(issues) else None)
+    jira_service.client.enhanced_search_issues.side_effect = enhanced_search
+
+    found = jira_service.search_issues("project = PROJ")
+
+    assert [issue.key for issue in found] == [f"PROJ-{i}" for i in range(5)]
+    tokens = [call.kwargs["nextPageToken"] for call in jira_service.client.enhanced_search_issues.call_args_list]
+    assert tokens == [None, "2", "4"]
+    jira_service.client.search_issues.assert_not_called()
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import threading
+from unittest.mock import Mock, patch
+import pytest
+from services.ai_service import AIService
+from services.llm_stream import JsonObjectScanner, StreamTimeout, collect_stream, collect_stream_async
+from services.run_report import RunReport
+
+RESULT = {"change_summary": "uses \"}\" and {braces}", "analysis": {}, "conclusion": "NAIK STAGING"}
+
+
+def text_chunk(text):
+    return text, None
+
+
+def test_scanner_finds_the_object_across_chunks_and_ignores_braces_in_strings():
+    scanner = JsonObjectScanner()
+    text = "Here you go:\n```json\n" + json.dumps(RESULT) + "\n```\n{\"second\": 1}"
+    pieces = [text[i:i + 7] for i in range(0, len(text), 7)]
+
+    completed_at = next(i for i, piece in enumerate(pieces) if scanner.feed(piece))
+
+    assert completed_at < len(pieces) - 1
+    assert json.loads(scanner.json_text) == RESULT
+
+
+def test_incomplete_object_is_returned_as_received():
+    scanner = JsonObjectScanner()
+    assert not scanner.feed('{"a": {"b": 1}')
+    assert scanner.json_text == '{"a": {"b": 1}'
+
+
+def test_collect_stream_reports_ttft_and_usage():
+    chunks = [("", None), ('{"a"', None), (': 1}', None), (None, (10, 4))]
+    scanner, usage, ttft = collect_stream(chunks, lambda chunk: chunk, 5, 5)
+    assert scanner.json_text == '{"a": 1}'
+    assert usage == (10, 4)
+    assert ttft is not None and ttft >= 0
+
+
+def test_stalled_stream_is_cancelled():
+    cancelled = threading.Event()
+
+    def chunks():
+        yield "{"
+        if cancelled.wait(timeout=5):
+            raise ConnectionError("stream closed")
+        yield "}"
+
+    with pytest.raises(StreamTimeout, match="stalled"):
+        collect_stream(chunks(), text_chunk, 5, 0.1, cancel=cancelled.set)
+    assert cancelled.is_set()
+
+
+def test_async_stream_without_first_token_times_out():
+    async def chunks():
+        await asyncio.sleep(5)
+        yield "{}"
+
+    with pytest.raises(StreamTimeout, match="no token"):
+        asyncio.run(collect_stream_async(chunks(), text_chunk, 0.05, 5))
+
+
+def openai_chunks(text, usage=(50, 20)):
+    chunks = [Mock(choices=[Mock(delta=Mock(content=text[i:i + 10]))], usage=None) for i in range(0, len(text), 10)]
+    chunks.append(Mock(choices=[], usage=Mock(prompt_tokens=usage[0], completion_tokens=usage[1])))
+    return chunks
+
+
+@pytest.fixture
+def ai_service(tmp_path):
+    report = RunReport(str(tmp_path / "report.jsonl"))
+    with patch.multiple("config.settings", AI_SERVICE_PROVIDER="openai", OPENAI_API_KEY="key",
+                        AI_CACHE_ENABLED=False, AI_STREAMING_ENABLED=True):
+        service = AIService(run_report=report)
+    service.client = Mock()
+    return service
+
+
+def test_streamed_completion_is_parsed_and_timed(ai_service, tmp_path):
+    stream = Mock()
+    stream.__iter__ = Mock(return_value=iter(openai_chunks(json.dumps(RESULT))))
+    ai_service.client.chat.completions.create.return_value = stream
+
+    assert ai_service.analyze_code_diff("diff --git a/x b/x") == RESULT
+
+    assert ai_service.client.chat.completions.create.call_args.kwargs["stream"] is True
+    record = json.loads((tmp_path / "report.jsonl").read_text().splitlines()[0])
+    assert record["completion_tokens"] == 20
+    assert "ttft_seconds" in record and "tokens_per_second" in record
+
+
+def test_timed_out_stream_is_retried(ai_service):
+    scanner = JsonObjectScanner()
+    scanner.feed(json.dumps(RESULT))
+
+    with patch("services.ai_service.collect_stream",
+               side_effect=[StreamTimeout("no token within 60s"), (scanner, None, 0.1)]), \
+            patch.multiple("config.settings", AI_STREAM_RETRIES=1):
+        assert ai_service.analyze_code_diff("diff --git a/x b/x") == RESULT
+
+    assert ai_service.client.chat.completions.create.call_count == 2
@@ -0,0 +1,115 @@
+import os
+import subprocess
+import sys
+import time
+from unittest.mock import patch
+import pytest
+from services.file_lock import FileLock, FileLockTimeout
+from services.git_service import GitService
+
+
+@pytest.fixture
+def git_service(tmp_path):
+    with patch('config.settings.LOCAL_GIT_REPO_PATH', str(tmp_path / "repos")):
+        yield GitService()
+
+
+def make_mirror(service, project_path, size, last_used):
+    path = service.get_mirror_path(f"https://gitlab.com/{project_path}.git")
+    os.makedirs(path)
+    with open(os.path.join(path, "pack"), "wb") as f:
+        f.write(b"x" * size)
+    os.utime(path, (last_used, last_used))
+    return path
+
+
+def test_file_lock_excludes_other_holders(tmp_path):
+    lock_path = str(tmp_path / "repo.git.lock")
+    with FileLock(lock_path):
+        assert FileLock(lock_path).acquire(blocking=False) is False
+        with pytest.raises(FileLockTimeout):
+            FileLock(lock_path, timeout=0.2).acquire()
+    other = FileLock(lock_path)
+    assert other.acquire(blocking=False) is True
+    other.release()
+
+
+def test_file_lock_excludes_other_processes(tmp_path):
+    lock_path = str(tmp_path / "repo.git.lock")
+    code = ("import sys; from services.file_lock import FileLock; "
+            f"sys.exit(0 if FileLock({lock_path!r}).acquire(blocking=False) else 3)")
+    with FileLock(lock_path):
+        result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(__file__)))
+    assert result.returncode == 3
+
+
+def test_enforce_disk_budget_evicts_least_recently_used(git_service):
+    now = time.time()
+    oldest = make_mirror(git_service, "group-a/api", 1000, now - 300)
+    middle = make_mirror(git_service, "group-b/api", 1000, now - 200)
+    newest = make_mirror(git_service, "group-c/web", 1000, now - 100)
+
+    git_service.enforce_disk_budget(max_bytes=2000)
+
+    assert not os.path.exists(oldest)
+    assert os.path.exists(middle) and os.path.exists(newest)
+
+
+def test_enforce_disk_budget_skips_locked_mirrors(git_service):
+    now = time.time()
+    oldest = make_mirror(git_service, "group-a/api", 1000, now - 300)
+    newer = make_mirror(git_service, "group-b/api", 1000, now - 100)
+
+    with FileLock(oldest + ".lock"):
+        git_service.enforce_disk_budget(max_bytes=1000)
+
+    assert os.path.exists(oldest)
+    assert not os.path.exists(newer)
+
+
+def test_local_repo_paths_are_not_locked(git_service, tmp_path):
+    user_repo = tmp_path / "checkout"
+    user_repo.mkdir()
+    with patch.object(git_service, "_execute_git_command", return_value="commit"), \
+         patch.object(git_service, "_stream_git_command", return_value=iter(["diff\n"])):
+        assert git_service.get_commit_diff(str(user_repo), "abc123") == "diff\n"
+    assert not os.path.exists(str(user_repo) + ".lock")
+
+
+def test_eviction_removes_the_lock_file_and_waiters_relock_the_new_one(git_service):
+    now = time.time()
+    oldest = make_mirror(git_service, "group-a/api", 1000, now - 300)
+    newer = make_mirror(git_service, "group-b/api", 1000, now - 100)
+    with FileLock(newer + ".lock"):
+        pass  # a finished run left its lock file behind
+
+    git_service.enforce_disk_budget(max_bytes=0)
+
+    assert not os.path.exists(oldest) and not os.path.exists(newer)
+    assert not os.path.exists(newer + ".lock")
+
+    lock_path = oldest + ".lock"
+    holder, waiter = FileLock(lock_path), FileLock(lock_path, timeout=0.2)
+    holder.acquire()
+    holder.release(remove=True)
+    assert waiter.acquire() is True and os.path.exists(lock_path)
+    waiter.release()
+
+
+def test_mirror_lock_protects_the_mirror_until_the_diff_is_read(git_service):
+    url = "https://gitlab.com/group-a/api.git"
+    path = make_mirror(git_service, "group-a/api", 1000, time.time())
+
+    with git_service.mirror_lock(url) as locked:
+        assert locked
+        assert git_service.clone_repository(url) == path  # re-entrant within the thread
+        git_service.enforce_disk_budget(max_bytes=0)
+        assert os.path.exists(path)
+
+
+def test_reusing_a_mirror_does_not_walk_the_store(git_service):
+    url = "https://gitlab.com/group-a/api.git"
+    make_mirror(git_service, "group-a/api", 1000, time.time())
+    with patch.object(git_service, "enforce_disk_budget") as enforce:
+        git_service.clone_repository(url)
+    enforce.assert_not_called()
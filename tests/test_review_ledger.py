@@ -0,0 +1,72 @@
+import pytest
+from main import format_comment, main_workflow
+from services.review_ledger import ReviewLedger, canonical_url
+
+MR_URL = "https://gitlab.example.com/group/project/-/merge_requests/3"
+COMMIT_URL = "https://gitlab.example.com/group/project/-/commit/abcdef1234567"
+ANALYSIS = {"change_summary": "s", "analysis": {}, "conclusion": "NAIK STAGING"}
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return ReviewLedger(str(tmp_path / "ledger.sqlite3"))
+
+
+@pytest.fixture
+def make_services(workflow_services):
+    def make(ledger, comments):
+        workflow_services.review_ledger = ledger
+        workflow_services.jira.get_comments_since.side_effect = lambda ticket_id, after, issue: [
+            (comment_id, body) for comment_id, body in comments if comment_id > after]
+        return workflow_services
+    return make
+
+
+def test_canonical_url_normalizes_legacy_and_trailing_forms():
+    assert canonical_url("HTTPS://GitLab.example.com/group/project/merge_requests/3/") == MR_URL
+    assert canonical_url(MR_URL) == MR_URL
+    assert canonical_url("https://gitlab.example.com/group/project/commit/ABCDEF1234567") == COMMIT_URL
+
+
+def test_watermark_only_moves_forward(ledger):
+    assert ledger.watermark("T-1") == 0
+    ledger.set_watermark("T-1", 20)
+    ledger.set_watermark("T-1", 10)
+    assert ledger.watermark("T-1") == 20
+
+
+def test_record_review_keeps_known_values(ledger):
+    ledger.record_review("T-1", MR_URL, "a" * 40, "v1", 500)
+    ledger.record_review("T-1", MR_URL + "/")
+    assert ledger.reviewed_heads("T-1") == {MR_URL: "a" * 40}
+
+
+def test_workflow_reviews_once_and_then_scans_only_new_comments(ledger, make_services):
+    services = make_services(ledger, [(10, f"Please review {MR_URL}")])
+
+    main_workflow("T-1", services)
+
+    services.jira.get_ticket_details.assert_called_once_with("T-1", include_comments=False)
+    services.diff_fetcher.fetch_gitlab_mr_diff.assert_called_once_with(
+        MR_URL, mr=services.gitlab.get_merge_request.return_value)
+    assert ledger.watermark("T-1") == 10
+    assert ledger.reviewed_heads("T-1") == {MR_URL: "a" * 40}
+
+    services.jira.get_comments_since.side_effect = None
+    services.jira.get_comments_since.return_value = [(11, f"One more: {COMMIT_URL}")]
+    main_workflow("T-1", services)
+
+    assert services.jira.get_comments_since.call_args.args[1] == 10
+    services.diff_fetcher.fetch_gitlab_mr_diff.assert_called_once()
+    services.diff_fetcher.fetch_commit_diff.assert_called_once_with(COMMIT_URL)
+    assert ledger.watermark("T-1") == 11
+
+
+def test_legacy_bot_comments_are_imported_as_reviews(ledger, make_services):
+    review = format_comment(ANALYSIS, MR_URL, "dev", head_sha="a" * 40)
+    services = make_services(ledger, [(10, f"Please review {MR_URL}"), (11, review)])
+
+    main_workflow("T-1", services)
+
+    services.ai.analyze_code_diff_async.assert_not_awaited()
+    assert ledger.reviewed_heads("T-1") == {MR_URL: "a" * 40}
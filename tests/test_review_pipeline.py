@@ -0,0 +1,93 @@
+import threading
+from services.review_pipeline import ReviewPipeline
+
+
+def test_pipeline_processes_all_urls_in_input_order():
+    urls = [(f"https://gitlab.com/g/p/-/commit/{i}", "Commit") for i in range(6)]
+    posted = []
+
+    pipeline = ReviewPipeline(
+        fetch_fn=lambda url, url_type: f"diff for {url}",
+        analyze_fn=lambda diff: {"conclusion": "NAIK STAGING", "diff": diff},
+        post_fn=lambda url, analysis: posted.append(url) or f"comment for {url}",
+        fetch_concurrency=3, analyze_concurrency=2, post_concurrency=1, queue_size=1,
+    )
+    results = pipeline.run(urls)
+
+    assert [r.url for r in results] == [url for url, _ in urls]
+    assert all(r.posted for r in results)
+    assert sorted(posted) == sorted(url for url, _ in urls)
+    assert results[0].comment == f"comment for {urls[0][0]}"
+
+
+def test_pipeline_skips_failed_urls_without_stopping_others():
+    def fetch(url, url_type):
+        return None if url.endswith("/1") else f"diff {url[-1]}"
+
+    def analyze(diff):
+        if diff == "diff 2":
+            raise RuntimeError("llm down")
+        return {"conclusion": ""}
+
+    pipeline = ReviewPipeline(fetch, analyze, lambda url, analysis: "comment",
+                              fetch_concurrency=1, analyze_concurrency=1, post_concurrency=1, queue_size=1)
+    results = pipeline.run([(f"https://x/commit/{i}", "Commit") for i in range(3)])
+
+    assert [r.status for r in results] == ["posted", "fetch_failed", "analysis_failed"]
+    assert results[2].error == "llm down"
+
+
+def test_pipeline_overlaps_fetch_with_analysis():
+    """The diff for the next URL must download while the previous one is being analyzed."""
+    analysis_started = threading.Event()
+    fetched_during_analysis = threading.Event()
+
+    def fetch(url, url_type):
+        if url.endswith("/1"):
+            # Only succeeds if the first URL is already in the analyze stage.
+            assert analysis_started.wait(timeout=5)
+            fetched_during_analysis.set()
+        return "diff"
+
+    def analyze(diff):
+        analysis_started.set()
+        fetched_during_analysis.wait(timeout=5)
+        return {"conclusion": ""}
+
+    pipeline = ReviewPipeline(fetch, analyze, lambda url, analysis: "comment",
+                              fetch_concurrency=1, analyze_concurrency=1, post_concurrency=1, queue_size=2)
+    results = pipeline.run([("https://x/commit/0", "Commit"), ("https://x/commit/1", "Commit")])
+
+    assert fetched_during_analysis.is_set()
+    assert all(r.posted for r in results)
+
+
+def test_pipeline_reports_fully_pruned_diffs_separately_from_fetch_failures():
+    pipeline = ReviewPipeline(lambda url, url_type: "" if url.endswith("/0") else None,
+                              lambda diff: {"conclusion": ""}, lambda url, analysis: "comment",
+                              fetch_concurrency=1, analyze_concurrency=1, post_concurrency=1, queue_size=1)
+    results = pipeline.run([("https://x/commit/0", "Commit"), ("https://x/commit/1", "Commit")])
+
+    assert [r.status for r in results] == ["empty", "fetch_failed"]
+
+
+def test_async_analyze_fn_is_awaited_on_the_pipeline_loop_and_close_fn_runs_last():
+    loops, events = set(), []
+
+    async def analyze(diff):
+        import asyncio
+        loops.add(asyncio.get_running_loop())
+        events.append("analyze")
+        return {"conclusion": ""}
+
+    async def close():
+        events.append("close")
+
+    pipeline = ReviewPipeline(lambda url, url_type: "diff", analyze, lambda url, analysis: "comment",
+                              fetch_concurrency=1, analyze_concurrency=2, post_concurrency=1, queue_size=1,
+                              close_fn=close)
+    results = pipeline.run([(f"https://x/commit/{i}", "Commit") for i in range(3)])
+
+    assert all(r.posted for r in results)
+    assert len(loops) == 1
+    assert events == ["analyze"] * 3 + ["close"]
@@ -0,0 +1,43 @@
+import json
+from unittest.mock import Mock, patch
+from services.run_report import RunReport
+from services.ai_service import AIService
+
+
+def test_run_report_writes_calls_and_totals(tmp_path):
+    path = tmp_path / "report.jsonl"
+    report = RunReport(str(path))
+
+    report.record_llm_call("openai", "m", 100, 20, 1.5, ticket_id="PROJ-1")
+    report.record_llm_call("openai", "m", 0, 0, 0.01, cached=True, ticket_id="PROJ-1")
+    report.record_llm_call("openai", "m", 50, 0, 2.0, ok=False, ticket_id="PROJ-2")
+    report.write_ticket_summary("PROJ-1", elapsed=3.0)
+    totals = report.write_run_summary(tickets=2)
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r["type"] for r in records] == ["llm_call"] * 3 + ["ticket_summary", "run_summary"]
+    assert records[3]["prompt_tokens"] == 100 and records[3]["cached_calls"] == 1
+    assert totals["calls"] == 3 and totals["failed_calls"] == 1 and totals["prompt_tokens"] == 150
+    assert all(r["run_id"] == report.run_id for r in records)
+
+
+def test_ai_service_records_provider_usage_or_estimate():
+    report = RunReport(None)
+    with patch.multiple("config.settings", AI_SERVICE_PROVIDER="openai", OPENAI_API_KEY="key", AI_CACHE_ENABLED=False,
+                        AI_STREAMING_ENABLED=False):
+        service = AIService(run_report=report)
+    service.client = Mock()
+    service.client.chat.completions.create.return_value = Mock(
+        choices=[Mock(message=Mock(content='{"conclusion": "NAIK STAGING"}'))],
+        usage=Mock(prompt_tokens=1234, completion_tokens=56),
+    )
+
+    service.analyze_code_diff("diff", ticket_id="PROJ-1")
+    assert report.ticket_totals("PROJ-1")["prompt_tokens"] == 1234
+    assert report.ticket_totals("PROJ-1")["completion_tokens"] == 56
+
+    service.client.chat.completions.create.return_value.usage = None
+    service.analyze_code_diff("another diff", ticket_id="PROJ-1")
+    totals = report.ticket_totals("PROJ-1")
+    assert totals["calls"] == 2
+    assert totals["prompt_tokens"] > 1234
@@ -0,0 +1,57 @@
+"""
+Startup-time benchmark for the CLI, in the style of `python -X importtime -c "import main"`.
+Guards against provider SDKs or network connections creeping back into module import.
+"""
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Cumulative import time budget for `import main`, in microseconds. Generous enough for
+# slow CI hosts; loading the provider SDKs eagerly takes well over this on its own.
+IMPORT_BUDGET_US = 1_000_000
+
+# Heavy modules that must only be imported once the matching provider is selected.
+LAZY_MODULES = ("openai", "google.generativeai")
+
+
+def _import_times(module):
+    """Runs `python -X importtime` and returns {module name: cumulative microseconds}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_main_stays_within_budget_and_skips_provider_sdks():
+    times = _import_times("main")
+
+    for name in LAZY_MODULES:
+        assert not any(imported == name or imported.startswith(name + ".") for imported in times), \
+            f"{name} is imported at startup"
+    assert times["main"] < IMPORT_BUDGET_US, f"import main took {times['main'] / 1000:.0f} ms"
+
+
+def test_services_connect_lazily():
+    from services.gitlab_service import GitLabService
+    from services.jira_service import JiraService
+
+    with patch('gitlab.Gitlab') as gitlab_client, patch('services.jira_service.JIRA') as jira_client, \
+            patch('config.settings.DIFF_CACHE_ENABLED', False):
+        gitlab_service = GitLabService()
+        jira_service = JiraService()
+        gitlab_client.assert_not_called()
+        jira_client.assert_not_called()
+
+        assert gitlab_service.client is gitlab_service.client
+        gitlab_client.return_value.auth.assert_called_once()
+        assert jira_service.client is jira_client.return_value
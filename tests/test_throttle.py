@@ -0,0 +1,105 @@
+from time import sleep as real_sleep
+from unittest.mock import Mock, patch
+import pytest
+import requests
+from services import throttle
+from services.http_transport import ThrottledAdapter
+from services.throttle import TokenBucket, parse_retry_after, send_with_retry, throttled_call
+
+
+@pytest.fixture(autouse=True)
+def fresh_buckets():
+    throttle._buckets.clear()
+    with patch.multiple('config.settings', THROTTLE_RATE=0, RETRY_MAX_ATTEMPTS=3, RETRY_BASE_DELAY=1.0,
+                        RETRY_MAX_DELAY=60.0), patch('services.throttle.time.sleep') as sleep, \
+            patch.object(TokenBucket, 'pause'):
+        yield sleep
+    throttle._buckets.clear()
+
+
+def response(status, headers=None):
+    return Mock(status_code=status, headers=headers or {})
+
+
+def test_token_bucket_spaces_requests_beyond_the_burst():
+    bucket = TokenBucket(rate=2, burst=2)
+    with patch('services.throttle.time.sleep', real_sleep):
+        waits = [bucket.acquire() for _ in range(3)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.5, abs=0.05)
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+
+
+def test_transient_status_is_retried_with_retry_after(fresh_buckets):
+    send = Mock(side_effect=[response(429, {"Retry-After": "3"}), response(502), response(200)])
+
+    result = send_with_retry("gitlab.example.com", send)
+
+    assert result.status_code == 200
+    assert send.call_count == 3
+    delays = [call.args[0] for call in fresh_buckets.call_args_list]
+    assert delays[0] == 3.0
+    assert 0 <= delays[-1] <= 2.0
+
+
+def test_non_idempotent_request_is_retried_only_on_429():
+    send = Mock(side_effect=[response(429), response(502), response(200)])
+
+    result = send_with_retry("jira.example.com", send, idempotent=False)
+
+    assert result.status_code == 502
+    assert send.call_count == 2
+
+
+def test_gives_up_after_max_attempts():
+    send = Mock(return_value=response(503))
+    assert send_with_retry("llm.example.com", send).status_code == 503
+    assert send.call_count == 4
+
+
+def test_sdk_exceptions_with_retryable_codes_are_retried():
+    error = Exception("quota")
+    error.code = 429
+    call = Mock(side_effect=[error, "ok"])
+    assert throttled_call("generativelanguage.googleapis.com", call) == "ok"
+
+    not_found = Exception("missing")
+    not_found.code = 404
+    with pytest.raises(Exception, match="missing"):
+        throttled_call("generativelanguage.googleapis.com", Mock(side_effect=not_found))
+
+
+def test_adapter_retries_connection_errors_for_get_only():
+    adapter = ThrottledAdapter()
+    get = requests.Request("GET", "https://jira.example.com/rest/api/2/issue/T-1").prepare()
+    post = requests.Request("POST", "https://jira.example.com/rest/api/2/issue/T-1/comment").prepare()
+    with patch('requests.adapters.HTTPAdapter.send',
+               side_effect=[requests.ConnectionError("reset"), response(200)]) as send:
+        assert adapter.send(get).status_code == 200
+        assert send.call_count == 2
+    with patch('requests.adapters.HTTPAdapter.send', side_effect=requests.ConnectionError("reset")):
+        with pytest.raises(requests.ConnectionError):
+            adapter.send(post)
+
+
+def test_python_gitlab_does_not_retry_on_top_of_the_adapter():
+    import gitlab
+    from services.gitlab_service import GitLabService
+    too_many = requests.Response()
+    too_many.status_code, too_many.headers["Retry-After"], too_many._content = 429, "1", b"{}"
+    session = requests.Session()
+    session.send = Mock(return_value=too_many)  # what ThrottledAdapter returns once it gives up
+
+    with patch('services.gitlab_service.requests_session', return_value=session), \
+            patch.object(gitlab.Gitlab, 'auth'), \
+            patch.multiple('config.settings', GITLAB_SERVER="https://gitlab.example.com", DIFF_CACHE_ENABLED=False):
+        client = GitLabService().client
+        with pytest.raises(gitlab.exceptions.GitlabHttpError):
+            client.http_get("/projects/1")
+
+    assert session.send.call_count == 1
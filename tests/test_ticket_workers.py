@@ -0,0 +1,61 @@
+from unittest.mock import patch
+import main
+
+
+def test_run_tickets_isolates_errors_per_ticket():
+    """A failing ticket must not stop the other tickets in the batch."""
+    def fake_workflow(ticket_id, services=None):
+        if ticket_id == "PROJ-2":
+            raise RuntimeError("boom")
+
+    with patch('main.main_workflow', side_effect=fake_workflow):
+        results = main.run_tickets(["PROJ-1", "PROJ-2", "PROJ-3"], workers=3)
+
+    assert [r["ticket_id"] for r in results] == ["PROJ-1", "PROJ-2", "PROJ-3"]
+    assert [r["ok"] for r in results] == [True, False, True]
+    assert results[1]["error"] == "boom"
+    assert all(r["elapsed"] >= 0 for r in results)
+
+
+def test_run_tickets_sequential_when_single_worker():
+    calls = []
+    with patch('main.main_workflow', side_effect=lambda ticket_id, services: calls.append((ticket_id, services))):
+        results = main.run_tickets(["PROJ-1", "PROJ-2"], workers=1)
+
+    assert [ticket_id for ticket_id, _ in calls] == ["PROJ-1", "PROJ-2"]
+    assert all(r["ok"] for r in results)
+
+
+def test_run_tickets_shares_one_service_container():
+    containers = []
+    with patch('main.main_workflow', side_effect=lambda ticket_id, services: containers.append(services)):
+        main.run_tickets(["PROJ-1", "PROJ-2", "PROJ-3"], workers=2)
+
+    assert len(containers) == 3
+    assert all(container is containers[0] for container in containers)
+
+
+def test_print_run_summary_reports_throughput(capsys):
+    results = [
+        {"ticket_id": "PROJ-1", "ok": True, "elapsed": 1.5, "error": None},
+        {"ticket_id": "PROJ-2", "ok": False, "elapsed": 0.5, "error": "boom"},
+    ]
+    main.print_run_summary(results, 30.0)
+    output = capsys.readouterr().out
+
+    assert "Throughput: 4.00 tickets/minute" in output
+    assert "PROJ-1: 1.50 seconds - OK" in output
+    assert "PROJ-2: 0.50 seconds - FAILED (boom)" in output
+
+
+def test_hedge_pool_is_sized_by_the_workers_passed_to_run_tickets():
+    from services.container import ServiceContainer
+    services = ServiceContainer()
+    with patch.multiple('config.settings', TICKET_WORKERS=1, AI_SERVICE_PROVIDER="openai", OPENAI_API_KEY="key",
+                        AI_CACHE_ENABLED=False, AI_HEDGE_ENABLED=True, AI_HEDGE_PROVIDER="openai",
+                        AI_CONCURRENCY_MAX=1, AI_CHUNK_CONCURRENCY=2), \
+            patch('main.main_workflow', side_effect=lambda ticket_id, services: services.ai):
+        main.run_tickets(["PROJ-1", "PROJ-2", "PROJ-3", "PROJ-4"], workers=4, services=services)
+
+    assert services.ai._hedge_executor._max_workers == 2 * 4 * 2
+    services.ai._hedge_executor.shutdown()